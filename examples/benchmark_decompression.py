@@ -0,0 +1,50 @@
+# Compare the decompression speed of the gunzip backends available on this
+# machine, on a synthetic genome (random ACGT, 80 bases per line).
+#
+# Usage: python benchmark_decompression.py [size_in_GB] [threads]
+#
+# The gzip file is created in a temporary folder (with compression level 1,
+# which takes a few seconds per GB), and is deleted at the end.
+
+import os
+import sys
+import time
+import zlib
+import tempfile
+
+from genome_collector.GunzipBackend import GunzipBackend
+
+size_gb = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+threads = int(sys.argv[2]) if len(sys.argv) > 2 else None
+BLOCK_SIZE = 2 ** 24
+bases_table = bytes(b"ACGT"[i % 4] for i in range(256))
+
+with tempfile.TemporaryDirectory() as folder:
+    gz_path = os.path.join(folder, "genome.fna.gz")
+    n_blocks = max(1, int(size_gb * 2 ** 30 / BLOCK_SIZE))
+    print("Writing a %.1f GB genome to %s..." % (size_gb, gz_path))
+    compressor = zlib.compressobj(1, wbits=16 + zlib.MAX_WBITS)
+    with open(gz_path, "wb") as f:
+        f.write(compressor.compress(b">synthetic_genome\n"))
+        for i in range(n_blocks):
+            # Fresh random bases for each block, so the compression ratio
+            # is close to that of a real genome.
+            bases = os.urandom(BLOCK_SIZE).translate(bases_table)
+            lines = [bases[j : j + 80] for j in range(0, len(bases), 80)]
+            f.write(compressor.compress(b"\n".join(lines) + b"\n"))
+        f.write(compressor.flush())
+    uncompressed_size = n_blocks * BLOCK_SIZE * 81 / 80
+    print(
+        "Compressed size: %.2f GB, uncompressed: %.2f GB"
+        % (os.path.getsize(gz_path) / 2 ** 30, uncompressed_size / 2 ** 30)
+    )
+
+    target_path = os.path.join(folder, "genome.fa")
+    for name in GunzipBackend.available_backends():
+        backend = GunzipBackend(name, threads=threads)
+        start_time = time.time()
+        backend.gunzip_file(gz_path, target_path)
+        duration = time.time() - start_time
+        speed = uncompressed_size / 2 ** 20 / duration
+        print("%-8s %6.2fs  %7.1f MB/s" % (name, duration, speed))
+        os.remove(target_path)
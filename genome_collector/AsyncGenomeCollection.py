@@ -0,0 +1,474 @@
+"""Asyncio interface to collections of genomes, for event-loop based code."""
+
+import os
+import io
+import json
+import asyncio
+import functools
+import contextvars
+from contextlib import asynccontextmanager
+from urllib.error import HTTPError
+
+from Bio import Entrez
+
+from .GenomeCollection import GenomeCollection
+from .mixins.BlastMixin import BLAST_DB_READY_EXTENSIONS
+from .mixins.BowtieMixin import BOWTIE_INDEX_READY_EXTENSIONS
+from .tools import run_process_async
+from .sources.NCBISource import NCBISource
+
+
+class AsyncGenomeCollection(GenomeCollection):
+    """GenomeCollection with coroutine versions of its main methods.
+
+    The coroutines have the name of the corresponding method with an "a"
+    prefix (``aget_taxid_genome_data_path``, ``aget_taxid_blastdb_path``...)
+    and never block the event loop:
+
+    - Entrez requests wait for the collection's rate limiter with
+      ``asyncio.sleep`` (the limiter is shared with the synchronous methods)
+      then run in the loop's default executor.
+    - Downloads (streaming, resumable, checked, see
+      ``download_taxid_genome_data_from_ncbi``) run in the default executor,
+      as do the methods of sources other than NCBI (see ``source``).
+    - makeblastdb, bowtie-build and BLAST run with
+      ``asyncio.create_subprocess_exec``.
+    - Other file operations which may block (locks, catalog and cache
+      updates, copies to and from the scratch tier) run in the default
+      executor.
+
+    Coroutines needing the same missing file share a single download or
+    build, and the files are protected by the same lock files as in the
+    synchronous methods. Functions run in the executor see the locks held
+    by the calling coroutine, so they can take these locks again. As the
+    data directory layout is also the same, a data directory can be used by
+    synchronous and asynchronous code at the same time. All synchronous
+    methods remain available.
+
+    Examples
+    ========
+
+    >>> collection = AsyncGenomeCollection()
+    >>> db_paths = await asyncio.gather(*[
+    >>>     collection.aget_taxid_blastdb_path(taxid, db_type="nucl")
+    >>>     for taxid in [511145, 559292, 224308]
+    >>> ])
+    >>> output = await collection.ablast_against_taxid(
+    >>>     511145, "nucl", ["blastn", "-query", "queries.fa"])
+    """
+
+    def __init__(self, data_dir="default", logger="bar"):
+        super().__init__(data_dir=data_dir, logger=logger)
+        self._async_flights = {}
+
+    @staticmethod
+    async def _run_in_executor(function, *args, context=None, **kwargs):
+        """Run a function in the loop's default executor.
+
+        The function runs in a copy of the current context (or in the given
+        ``context``), so it sees the locks held by the calling coroutine
+        (see ``FileLock``).
+        """
+        if context is None:
+            context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(context.run, function, *args, **kwargs)
+        )
+
+    @asynccontextmanager
+    async def _in_executor(self, context_manager):
+        """Enter and exit a synchronous context manager in the executor.
+
+        Both run in the same copy of the current context, so locks acquired
+        when entering are released when exiting.
+        """
+        context = contextvars.copy_context()
+        value = await self._run_in_executor(
+            context_manager.__enter__, context=context
+        )
+        try:
+            yield value
+        except BaseException as error:
+            is_suppressed = await self._run_in_executor(
+                context_manager.__exit__,
+                type(error),
+                error,
+                error.__traceback__,
+                context=context,
+            )
+            if not is_suppressed:
+                raise
+        else:
+            await self._run_in_executor(
+                context_manager.__exit__, None, None, None, context=context
+            )
+
+    @staticmethod
+    async def arun_process(name, parameters, stdout_path=None, **kwargs):
+        """Run a process without blocking the event loop.
+
+        See ``tools.run_process_async`` for the other parameters
+        (``timeout``, ``stdin_file``...).
+        """
+        return await run_process_async(
+            name, parameters, stdout_path=stdout_path, **kwargs
+        )
+
+    async def _aget_data_from_entrez(self, request, **kwargs):
+        """Coroutine version of ``_get_data_from_entrez``."""
+        cache, cache_key, response = await self._run_in_executor(
+            self._get_cached_entrez_response, request, **kwargs
+        )
+        if response is None:
+            response = await self._arequest_entrez(request, **kwargs)
+            if cache is not None:
+                await self._run_in_executor(cache.set, cache_key, response)
+        return Entrez.read(io.BytesIO(response), validate=False)
+
+    async def _arequest_entrez(self, request, **kwargs):
+        """Coroutine version of ``_request_entrez``."""
+        self._set_default_entrez_email()
+        rate_limiter = self._get_entrez_rate_limiter()
+        for attempt in range(self.entrez_max_retries + 1):
+            if hasattr(rate_limiter, "acquire_async"):
+                await rate_limiter.acquire_async()
+            else:  # custom rate limiters
+                await self._run_in_executor(rate_limiter.acquire)
+            try:
+                return await self._run_in_executor(
+                    self._read_entrez_response, request, **kwargs
+                )
+            except HTTPError as err:
+                await asyncio.sleep(self._get_entrez_retry_delay(err, attempt))
+
+    async def _asingle_flight(self, taxid, data_type, ready_path, create):
+        """Coroutine version of ``_single_flight``.
+
+        ``create`` is a coroutine function. Coroutines of this collection
+        needing the same file await the same task, and the task waits for
+        the file lock (for the other processes and threads).
+        """
+        await self._run_in_executor(self._record_access, taxid, data_type)
+        key = (str(taxid), data_type)
+        lock = self._taxid_file_lock(taxid, data_type)
+
+        async def is_ready():
+            if self.verify_on_read:
+                return await self._run_in_executor(
+                    self._is_ready, taxid, data_type, ready_path
+                )
+            return os.path.exists(ready_path)
+
+        async def create_under_lock():
+            async with lock:
+                if lock.broke_stale_lock or not (await is_ready()):
+                    await create()
+                    return True
+            return False
+
+        if key not in self._async_flights:
+            if (not lock.is_locked()) and (await is_ready()):
+                return
+            if key not in self._async_flights:
+                task = asyncio.ensure_future(create_under_lock())
+                self._async_flights[key] = task
+                task.add_done_callback(
+                    lambda task: self._async_flights.pop(key, None)
+                )
+        created = await asyncio.shield(self._async_flights[key])
+        if created:
+            await self._run_in_executor(
+                self._enforce_max_data_size, taxid, data_type
+            )
+
+    async def aget_taxid_infos(self, taxid):
+        """Coroutine version of ``get_taxid_infos``."""
+        taxid = str(taxid)
+        path = self.datafile_path(taxid=taxid, data_type="infos")
+
+        async def download():
+            if not self.autodownload:
+                self._raise_missing_file_error(path, "infos", taxid)
+            if isinstance(self._get_source(), NCBISource):
+                await self._adownload_taxid_genome_infos(taxid)
+            else:
+                await self._run_in_executor(
+                    self.download_taxid_genome_infos, taxid
+                )
+
+        await self._asingle_flight(taxid, "infos", path, download)
+        with open(path, "r") as f:
+            return json.load(f)
+
+    async def adownload_taxid_genome_infos_from_ncbi(
+        self, taxid, assembly_id=None
+    ):
+        """Coroutine version of ``download_taxid_genome_infos_from_ncbi``."""
+        taxid = str(taxid)
+        async with self._taxid_file_lock(taxid, "infos"):
+            await self._adownload_taxid_genome_infos(taxid, assembly_id)
+
+    async def _adownload_taxid_genome_infos(self, taxid, assembly_id=None):
+        self._log_message("Downloading infos for taxid %s from NCBI" % taxid)
+        search_results = await self._aget_data_from_entrez(
+            Entrez.esearch, term="txid" + taxid, db="genome", retmode="xml"
+        )
+        genome_id = self._get_single_genome_id(search_results, taxid)
+        genome_results, taxonomy_results = await asyncio.gather(
+            self._aget_data_from_entrez(
+                Entrez.esummary, id=genome_id, db="genome", retmode="xml"
+            ),
+            self._aget_data_from_entrez(
+                Entrez.esummary, id=taxid, db="taxonomy", retmode="xml"
+            ),
+        )
+        self._check_single_genome_summary(genome_results, genome_id)
+        infos = dict(**genome_results[0])
+        infos.update(dict(**taxonomy_results[0]))
+        infos["taxID"] = taxid
+        infos["genomeID"] = genome_id
+        if infos["AssemblyID"] == "0":
+            await self._run_in_executor(
+                self._set_infos_assembly_id, infos, assembly_id
+            )
+        await self._run_in_executor(self._write_taxid_infos, taxid, infos)
+
+    async def _aget_taxid_assembly_url_from_ncbi(self, taxid, data_type):
+        """Coroutine version of ``_get_taxid_assembly_url_from_ncbi``."""
+        genome_infos = await self.aget_taxid_infos(taxid)
+        ftp_path = genome_infos.get("AssemblyFtpPath", "")
+        if ftp_path == "":
+            data = await self._aget_data_from_entrez(
+                Entrez.esummary,
+                id=genome_infos["AssemblyID"],
+                db="assembly",
+                retmode="xml",
+            )
+            ftp_path = self._get_assembly_ftp_path(data)
+        return self._get_assembly_file_url(ftp_path, data_type)
+
+    async def aget_taxid_genome_data_path(
+        self, taxid, data_type="genomic_fasta"
+    ):
+        """Coroutine version of ``get_taxid_genome_data_path``."""
+        taxid = str(taxid)
+        stored_data_type = self._stored_data_type(data_type)
+        path = self.datafile_path(taxid=taxid, data_type=stored_data_type)
+
+        async def download():
+            stored_data_types = self._stored_data_types(data_type)
+            is_linked = await self._run_in_executor(
+                self._link_from_assembly_store, taxid, stored_data_types
+            )
+            if is_linked:
+                return
+            is_restored = await self._run_in_executor(
+                self._gunzip_local_gz_file, taxid, data_type
+            )
+            if is_restored:
+                return
+            if not self.autodownload:
+                self._raise_missing_file_error(path, "genome", taxid)
+            source = self._get_source()
+            if isinstance(source, NCBISource):
+                await self._adownload_taxid_genome_data(taxid, data_type)
+            else:
+                await self._run_in_executor(
+                    source.download_taxid_genome_data, self, taxid, data_type
+                )
+            await self._run_in_executor(
+                self._add_to_assembly_store, taxid, stored_data_types
+            )
+
+        await self._asingle_flight(taxid, stored_data_type, path, download)
+        return await self._run_in_executor(
+            self._scratch_tier_path, taxid, stored_data_type
+        )
+
+    async def adownload_taxid_genome_data_from_ncbi(self, taxid, data_type):
+        """Coroutine version of ``download_taxid_genome_data_from_ncbi``."""
+        taxid = str(taxid)
+        stored_data_type = self._stored_data_type(data_type)
+        async with self._taxid_file_lock(taxid, stored_data_type):
+            await self._adownload_taxid_genome_data(taxid, data_type)
+
+    async def _adownload_taxid_genome_data(self, taxid, data_type):
+        ftp_url = await self._aget_taxid_assembly_url_from_ncbi(
+            taxid, data_type
+        )
+        await self._run_in_executor(
+            self._download_taxid_genome_data_from_url,
+            taxid,
+            data_type,
+            ftp_url,
+        )
+
+    async def aget_taxid_blastdb_path(self, taxid, db_type):
+        """Coroutine version of ``get_taxid_blastdb_path``."""
+        taxid = str(taxid)
+        db_path = self.datafile_path(taxid=taxid, data_type="blast_" + db_type)
+        ready_extension = BLAST_DB_READY_EXTENSIONS[db_type]
+        await self._asingle_flight(
+            taxid,
+            "blast_" + db_type,
+            db_path + ready_extension,
+            lambda: self._agenerate_blast_db_for_taxid(taxid, db_type),
+        )
+        return await self._run_in_executor(
+            self._scratch_tier_path, taxid, "blast_" + db_type, ready_extension
+        )
+
+    async def agenerate_blast_db_for_taxid(self, taxid, db_type="nucl"):
+        """Coroutine version of ``generate_blast_db_for_taxid``."""
+        taxid = str(taxid)
+        async with self._taxid_file_lock(taxid, "blast_" + db_type):
+            await self._agenerate_blast_db_for_taxid(taxid, db_type)
+
+    async def _agenerate_blast_db_for_taxid(self, taxid, db_type):
+        data_type = {"nucl": "genomic_fasta", "prot": "protein_fasta"}[db_type]
+        index_type = "blast_" + db_type
+        ready_extension = BLAST_DB_READY_EXTENSIONS[db_type]
+        is_reused = await self._run_in_executor(
+            self._reuse_assembly_index, taxid, index_type, ready_extension
+        )
+        if is_reused:
+            return
+        fa_path = await self.aget_taxid_genome_data_path(taxid, data_type)
+        message = "Generating %s BLAST DB for taxid %s" % (db_type, taxid)
+        record, is_up_to_date = await self._run_in_executor(
+            self._get_build_record,
+            taxid,
+            index_type,
+            data_type,
+            self._makeblastdb_args(taxid, db_type, "{input}", "{output}"),
+            ready_extension,
+        )
+        if is_up_to_date:
+            self._log_message(message + " - Already up to date.")
+            return
+        cpus, memory = await self._run_in_executor(
+            self._get_build_resources, taxid, index_type, data_type, 1
+        )
+        async with self._get_build_scheduler().areserve(cpus, memory):
+            self._log_message(message)
+            async with self._in_executor(
+                self._atomic_multifile_build(
+                    taxid, index_type, ready_extension
+                )
+            ) as db_path:
+                blast_args = self._makeblastdb_args(
+                    taxid, db_type, fa_path, db_path
+                )
+                if self._stored_data_type(data_type) != data_type:
+                    async with self._in_executor(
+                        self._open_data_file(taxid, data_type)
+                    ) as f:
+                        await self.arun_process(
+                            message,
+                            blast_args,
+                            stdout_path=os.devnull,
+                            stdin_file=f,
+                        )
+                else:
+                    await self.arun_process(
+                        message, blast_args, stdout_path=os.devnull
+                    )
+        await self._afinish_build(taxid, index_type, record, ready_extension)
+        self._log_message(message + " - Done!")
+
+    async def _afinish_build(self, taxid, index_type, record, ready_extension):
+        """Record, deduplicate and register a new index, in the executor."""
+        await self._run_in_executor(
+            self._write_build_record, taxid, index_type, record
+        )
+        await self._run_in_executor(
+            self._add_to_assembly_store, taxid, [index_type], ready_extension
+        )
+        await self._run_in_executor(
+            self._register_taxid_files, taxid, index_type
+        )
+
+    async def ablast_against_taxid(
+        self, taxid, db_type, blast_args, stdout_path=None, **kwargs
+    ):
+        """Coroutine version of ``blast_against_taxid``."""
+        taxid = str(taxid)
+        db_path = await self.aget_taxid_blastdb_path(taxid, db_type)
+        blast_args = list(blast_args) + ["-db", db_path]
+        name = "BLASTing against TaxID %s %s: " % (taxid, db_type)
+        return await self.arun_process(
+            name, blast_args, stdout_path=stdout_path, **kwargs
+        )
+
+    async def aget_taxid_bowtie_index_path(self, taxid, version="1"):
+        """Coroutine version of ``get_taxid_bowtie_index_path``."""
+        taxid = str(taxid)
+        version = str(version)
+        data_type = "bowtie%s_index" % version
+        index_path = self.datafile_path(taxid=taxid, data_type=data_type)
+        ready_extension = BOWTIE_INDEX_READY_EXTENSIONS[version]
+        await self._asingle_flight(
+            taxid,
+            data_type,
+            index_path + ready_extension,
+            lambda: self._agenerate_bowtie_index_for_taxid(taxid, version),
+        )
+        return await self._run_in_executor(
+            self._scratch_tier_path, taxid, data_type, ready_extension
+        )
+
+    async def agenerate_bowtie_index_for_taxid(self, taxid, version="1"):
+        """Coroutine version of ``generate_bowtie_index_for_taxid``."""
+        taxid = str(taxid)
+        version = str(version)
+        async with self._taxid_file_lock(taxid, "bowtie%s_index" % version):
+            await self._agenerate_bowtie_index_for_taxid(taxid, version)
+
+    async def _agenerate_bowtie_index_for_taxid(self, taxid, version):
+        index_type = "bowtie%s_index" % version
+        ready_extension = BOWTIE_INDEX_READY_EXTENSIONS[version]
+        is_reused = await self._run_in_executor(
+            self._reuse_assembly_index, taxid, index_type, ready_extension
+        )
+        if is_reused:
+            return
+        await self.aget_taxid_genome_data_path(
+            taxid, data_type="genomic_fasta"
+        )
+        message = "Generating Bowtie%s index for taxid %s" % (version, taxid)
+        record, is_up_to_date = await self._run_in_executor(
+            self._get_build_record,
+            taxid,
+            index_type,
+            "genomic_fasta",
+            self._bowtie_build_parameters(version, "{input}", "{output}"),
+            ready_extension,
+        )
+        if is_up_to_date:
+            self._log_message(message + " - Already up to date.")
+            return
+        cpus, memory = await self._run_in_executor(
+            self._get_build_resources,
+            taxid,
+            index_type,
+            "genomic_fasta",
+            self.build_threads,
+        )
+        async with self._get_build_scheduler().areserve(cpus, memory):
+            self._log_message(message)
+            async with self._in_executor(
+                self._plain_data_file(taxid, "genomic_fasta")
+            ) as fa_path, self._in_executor(
+                self._atomic_multifile_build(
+                    taxid, index_type, ready_extension
+                )
+            ) as db_path:
+                bowtie_args = self._bowtie_build_parameters(
+                    version, fa_path, db_path, threads=self.build_threads
+                )
+                await self.arun_process(
+                    message, bowtie_args, stdout_path=os.devnull
+                )
+        await self._afinish_build(taxid, index_type, record, ready_extension)
+        self._log_message(message + " - Done")
@@ -0,0 +1,247 @@
+"""Blocked gzip (BGZF) files, with random access through a .gzi index.
+
+BGZF files (as written by ``bgzip``) are series of gzip members holding at
+most 64kb of data each, so they are valid gzip files, and any position of
+the uncompressed data can be reached by decompressing a single block. The
+.gzi index (same format as ``bgzip -i``) lists the (compressed,
+uncompressed) offsets of the blocks.
+"""
+
+import io
+import os
+import zlib
+import struct
+from bisect import bisect_right
+
+# Same block size as htslib, so that compressed blocks always fit in 64kb
+BGZF_BLOCK_SIZE = 0xFF00
+
+# Empty block marking the end of a BGZF file
+BGZF_EOF_BLOCK = bytes.fromhex(
+    "1f8b08040000000000ff0600424302001b0003000000000000000000"
+)
+
+
+def read_gzi(gzi_file):
+    """Return the list of (compressed, uncompressed) offsets of a .gzi file.
+
+    ``gzi_file`` is a path or a binary file handle. The first block, at
+    (0, 0), is not listed in .gzi files.
+    """
+    if isinstance(gzi_file, (str, os.PathLike)):
+        with open(gzi_file, "rb") as f:
+            return read_gzi(f)
+    (n_entries,) = struct.unpack("<Q", gzi_file.read(8))
+    data = gzi_file.read(16 * n_entries)
+    numbers = struct.unpack("<%dQ" % (2 * n_entries), data)
+    return list(zip(numbers[::2], numbers[1::2]))
+
+
+def write_gzi(block_offsets, gzi_file):
+    """Write a list of (compressed, uncompressed) offsets as a .gzi file."""
+    numbers = [number for offsets in block_offsets for number in offsets]
+    gzi_file.write(struct.pack("<Q", len(block_offsets)))
+    gzi_file.write(struct.pack("<%dQ" % len(numbers), *numbers))
+
+
+class BgzfFileWriter:
+    """Write data to a binary file handle as BGZF blocks.
+
+    The offsets of the blocks are listed in ``block_offsets`` (in the .gzi
+    format, see ``write_gzi``). ``close()`` writes the last block and the
+    end-of-file marker, but doesn't close the file handle.
+
+    Examples
+    ========
+
+    >>> with open("genome.fa.gz", "wb") as f:
+    >>>     writer = BgzfFileWriter(f)
+    >>>     writer.write(b">record_1\\nATGC...")
+    >>>     writer.close()
+    >>> with open("genome.fa.gz.gzi", "wb") as f:
+    >>>     write_gzi(writer.block_offsets, f)
+    """
+
+    def __init__(self, handle, compresslevel=6):
+        self.handle = handle
+        self.compresslevel = compresslevel
+        self.block_offsets = []
+        self._buffer = bytearray()
+        self._compressed_offset = 0
+        self._uncompressed_offset = 0
+
+    def write(self, data):
+        self._buffer += data
+        start = 0
+        with memoryview(self._buffer) as view:
+            while len(self._buffer) - start >= BGZF_BLOCK_SIZE:
+                self._write_block(view[start : start + BGZF_BLOCK_SIZE])
+                start += BGZF_BLOCK_SIZE
+        del self._buffer[:start]
+        return len(data)
+
+    def _write_block(self, data):
+        if self._uncompressed_offset:
+            self.block_offsets.append(
+                (self._compressed_offset, self._uncompressed_offset)
+            )
+        compressor = zlib.compressobj(
+            self.compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS
+        )
+        compressed = compressor.compress(data) + compressor.flush()
+        block_size = 18 + len(compressed) + 8
+        # gzip header with the "BC" extra field giving the block size - 1
+        header = struct.pack(
+            "<4BI2BH2BHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2,
+            block_size - 1,
+        )
+        footer = struct.pack("<2I", zlib.crc32(data), len(data))
+        self.handle.write(header + compressed + footer)
+        self._compressed_offset += block_size
+        self._uncompressed_offset += len(data)
+
+    def close(self):
+        if self._buffer:
+            self._write_block(self._buffer)
+            self._buffer = bytearray()
+        self.handle.write(BGZF_EOF_BLOCK)
+
+
+class BgzfFile(io.RawIOBase):
+    """Read-only binary file giving random access to a BGZF file's data.
+
+    Positions (for ``seek`` and ``tell``) are positions in the uncompressed
+    data, so this object can be used as a regular file, e.g. with a
+    ``FastaIndex``. Seeking reads the ``path + ".gzi"`` index (which is
+    computed, by scanning the block headers, if the file doesn't exist).
+    Wrap the file in a ``io.BufferedReader`` for fast line-by-line reading.
+
+    Examples
+    ========
+
+    >>> with BgzfFile("genome.fa.gz") as f:
+    >>>     f.seek(1_000_000)
+    >>>     data = f.read(1000)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._handle = open(path, "rb")
+        self._block_offsets = None
+        self._position = 0
+        self._block_start = 0  # uncompressed offset of the loaded block
+        self._block_data = b""
+        self._next_block_offset = 0  # compressed offset of the next block
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self._handle.close()
+        super().close()
+
+    def _get_block_offsets(self):
+        if self._block_offsets is None:
+            gzi_path = self.path + ".gzi"
+            if os.path.exists(gzi_path):
+                offsets = read_gzi(gzi_path)
+            else:
+                offsets = self._scan_block_offsets()
+            self._block_offsets = [(0, 0)] + offsets
+            self._uncompressed_offsets = [u for (c, u) in self._block_offsets]
+        return self._block_offsets
+
+    def uncompressed_size(self):
+        """Return the size of the uncompressed data (without reading it)."""
+        compressed, uncompressed = self._get_block_offsets()[-1]
+        block = self._read_block(compressed, decompress=False)
+        return uncompressed + (0 if block is None else block[1])
+
+    def _scan_block_offsets(self):
+        offsets = []
+        compressed, uncompressed = 0, 0
+        while True:
+            block = self._read_block(compressed, decompress=False)
+            if block is None:
+                return offsets
+            block_size, data_size = block
+            if data_size and uncompressed:
+                offsets.append((compressed, uncompressed))
+            compressed += block_size
+            uncompressed += data_size
+
+    def _read_block(self, offset, decompress=True):
+        """Return (block size, data) for the block at a compressed offset.
+
+        Return None at the end of the file. If ``decompress`` is False, the
+        size of the data is returned instead of the data.
+        """
+        self._handle.seek(offset)
+        header = self._handle.read(12)
+        if not header:
+            return None
+        (extra_length,) = struct.unpack("<H", header[10:12])
+        extra = self._handle.read(extra_length)
+        block_size = None
+        i = 0
+        while i + 4 <= len(extra):
+            (subfield_length,) = struct.unpack("<H", extra[i + 2 : i + 4])
+            if extra[i : i + 2] == b"BC":
+                (block_size,) = struct.unpack("<H", extra[i + 4 : i + 6])
+                block_size += 1
+            i += 4 + subfield_length
+        if (header[:3] != b"\x1f\x8b\x08") or (block_size is None):
+            raise IOError("%s is not a BGZF file" % self.path)
+        if not decompress:
+            self._handle.seek(offset + block_size - 4)
+            return block_size, struct.unpack("<I", self._handle.read(4))[0]
+        rest = self._handle.read(block_size - 12 - extra_length)
+        try:
+            data = zlib.decompress(rest[:-8], -zlib.MAX_WBITS)
+        except zlib.error as err:
+            raise IOError("Corrupted BGZF block in %s: %s" % (self.path, err))
+        return block_size, data
+
+    def _load_block_at(self, position):
+        """Load the block containing the (uncompressed) position."""
+        block_end = self._block_start + len(self._block_data)
+        if position == block_end:  # sequential reading
+            offset, self._block_start = self._next_block_offset, block_end
+        else:
+            offsets = self._get_block_offsets()
+            i = bisect_right(self._uncompressed_offsets, position) - 1
+            offset, self._block_start = offsets[i]
+        self._block_data = b""
+        while not self._block_data:  # skip empty blocks
+            block = self._read_block(offset)
+            if block is None:  # end of the file
+                break
+            block_size, self._block_data = block
+            offset += block_size
+        self._next_block_offset = offset
+
+    def readinto(self, buffer):
+        start = self._position - self._block_start
+        if not (0 <= start < len(self._block_data)):
+            self._load_block_at(self._position)
+            start = self._position - self._block_start
+        data = self._block_data[start : start + len(buffer)]
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Can't seek from the end of a BGZF")
+        if offset < 0:
+            raise ValueError("Negative seek position %d" % offset)
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
@@ -0,0 +1,96 @@
+"""Budget of CPUs and memory shared by concurrent index builds."""
+
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+
+class BuildScheduler:
+    """Let builds run concurrently within a budget of CPUs and memory.
+
+    Each build reserves a number of CPUs (threads) and bytes of memory
+    before it starts, and waits while the budget is exhausted by other
+    builds. A build needing more than the whole budget is clamped to the
+    budget, so it runs alone rather than never. The scheduler is
+    thread-safe and can be used from threads and coroutines at the same
+    time.
+
+    Parameters
+    ==========
+
+    cpus
+      Total number of CPUs for the builds running at the same time.
+
+    memory
+      Total memory, in bytes, for the builds running at the same time (None
+      for no memory limit).
+
+    poll_interval
+      Time in seconds between two checks of the budget by waiting
+      coroutines (threads are woken up as soon as resources are released).
+
+    Examples
+    ========
+
+    >>> scheduler = BuildScheduler(cpus=64, memory=200e9)
+    >>> with scheduler.reserve(cpus=8, memory=20e9):
+    >>>     run_process("bowtie-build", ["bowtie-build", "--threads", "8"...])
+    """
+
+    def __init__(self, cpus, memory=None, poll_interval=0.1):
+        self.cpus = cpus
+        self.memory = memory
+        self.poll_interval = poll_interval
+        self.used_cpus = 0
+        self.used_memory = 0
+        self._condition = threading.Condition()
+
+    def _clamp(self, cpus, memory):
+        cpus = min(max(1, cpus), self.cpus)
+        if self.memory is None:
+            memory = 0
+        else:
+            memory = min(max(0, memory), self.memory)
+        return cpus, memory
+
+    def _try_reserve(self, cpus, memory):
+        """Reserve the resources if available (under the condition lock)."""
+        free_memory = True
+        if self.memory is not None:
+            free_memory = self.used_memory + memory <= self.memory
+        if (self.used_cpus + cpus <= self.cpus) and free_memory:
+            self.used_cpus += cpus
+            self.used_memory += memory
+            return True
+        return False
+
+    def _release(self, cpus, memory):
+        with self._condition:
+            self.used_cpus -= cpus
+            self.used_memory -= memory
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, cpus=1, memory=0):
+        """Wait for the resources, and hold them in the ``with`` block."""
+        cpus, memory = self._clamp(cpus, memory)
+        with self._condition:
+            self._condition.wait_for(lambda: self._try_reserve(cpus, memory))
+        try:
+            yield
+        finally:
+            self._release(cpus, memory)
+
+    @asynccontextmanager
+    async def areserve(self, cpus=1, memory=0):
+        """Same as ``reserve``, without blocking the event loop."""
+        cpus, memory = self._clamp(cpus, memory)
+        while True:
+            with self._condition:
+                if self._try_reserve(cpus, memory):
+                    break
+            await asyncio.sleep(self.poll_interval)
+        try:
+            yield
+        finally:
+            self._release(cpus, memory)
@@ -0,0 +1,271 @@
+"""Persistent index of the data files of a collection, in a SQLite file."""
+
+import os
+
+from .tools import sqlite_connection
+
+CATALOG_COLUMNS = ["filename", "taxid", "data_type", "size", "checksum"]
+CATALOG_COLUMNS += ["build_time", "source_md5"]
+INSERT_FILES = "INSERT OR REPLACE INTO files VALUES (%s)" % ", ".join(
+    len(CATALOG_COLUMNS) * "?"
+)
+METADATA_COLUMNS = ["taxid", "name", "kingdom", "assembly_id", "genome_size"]
+
+
+class Catalog:
+    """Index of all the data files of a collection, to avoid directory scans.
+
+    Each data file is recorded with its TaxID, data type, size, checksum
+    (None when unknown), build time, and the MD5 announced by the source
+    for downloaded files (None when unknown). This makes the catalog a
+    manifest against which the files can be verified. It also has a table of
+    metadata on each TaxID (name, kingdom, assembly ID, genome size), to
+    avoid reading the TaxIDs' infos files, a table of the last access time
+    and number of accesses of each TaxID's data types, and the list of the
+    TaxIDs pinned in the collection (never evicted).
+
+    Parameters
+    ==========
+
+    path
+      Path to the SQLite file of the catalog (created if needed).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "filename TEXT PRIMARY KEY, taxid TEXT, data_type TEXT, "
+                "size INTEGER, checksum TEXT, build_time REAL, "
+                "source_md5 TEXT)"
+            )
+            rows = connection.execute("PRAGMA table_info(files)")
+            columns = [row[1] for row in rows]
+            if "source_md5" not in columns:  # catalogs of older versions
+                connection.execute(
+                    "ALTER TABLE files ADD COLUMN source_md5 TEXT"
+                )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS files_by_type "
+                "ON files (data_type, taxid)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS files_by_taxid ON files (taxid)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS taxids ("
+                "taxid TEXT PRIMARY KEY, name TEXT, kingdom TEXT, "
+                "assembly_id TEXT, genome_size INTEGER)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS accesses ("
+                "taxid TEXT, data_type TEXT, last_access REAL, "
+                "access_count INTEGER, PRIMARY KEY (taxid, data_type))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS pinned_taxids ("
+                "taxid TEXT PRIMARY KEY)"
+            )
+
+    def _connect(self):
+        return sqlite_connection(self.path)
+
+    def add_files(self, entries):
+        """Add (or update) files, given as a list of dicts.
+
+        The dicts have keys filename, taxid, data_type, size, checksum,
+        build_time and source_md5.
+        """
+        rows = [[entry[c] for c in CATALOG_COLUMNS] for entry in entries]
+        with self._connect() as connection:
+            connection.executemany(INSERT_FILES, rows)
+
+    def remove_files(self, filenames):
+        """Remove the given files from the catalog."""
+        with self._connect() as connection:
+            connection.executemany(
+                "DELETE FROM files WHERE filename=?",
+                [(filename,) for filename in filenames],
+            )
+
+    def replace_all(self, entries, metadata_entries):
+        """Replace the whole content of the catalog with the given entries.
+
+        See ``add_files`` and ``set_taxids_metadata`` for the entries format.
+        """
+        rows = [[entry[c] for c in CATALOG_COLUMNS] for entry in entries]
+        metadata_rows = [
+            [entry[c] for c in METADATA_COLUMNS] for entry in metadata_entries
+        ]
+        with self._connect() as connection:
+            connection.execute("DELETE FROM files")
+            connection.executemany(INSERT_FILES, rows)
+            connection.execute("DELETE FROM taxids")
+            connection.executemany(
+                "INSERT OR REPLACE INTO taxids VALUES (?, ?, ?, ?, ?)",
+                metadata_rows,
+            )
+
+    def taxids(self, data_type=None):
+        """Return the sorted list of TaxIDs with files of the given type.
+
+        If no data type is provided, all TaxIDs with files are returned.
+        """
+        with self._connect() as connection:
+            if data_type is None:
+                rows = connection.execute("SELECT DISTINCT taxid FROM files")
+            else:
+                rows = connection.execute(
+                    "SELECT DISTINCT taxid FROM files WHERE data_type=?",
+                    (data_type,),
+                )
+            return sorted(row[0] for row in rows)
+
+    def files(self, taxid=None, data_type=None):
+        """Return a list of file entries (dicts), filtered by TaxID/type."""
+        conditions, values = [], []
+        for column, value in [("taxid", taxid), ("data_type", data_type)]:
+            if value is not None:
+                conditions.append("%s=?" % column)
+                values.append(str(value))
+        query = "SELECT %s FROM files" % ", ".join(CATALOG_COLUMNS)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._connect() as connection:
+            rows = connection.execute(query + " ORDER BY filename", values)
+            return [dict(zip(CATALOG_COLUMNS, row)) for row in rows]
+
+    def set_taxids_metadata(self, entries):
+        """Add (or replace) TaxIDs metadata, given as a list of dicts.
+
+        The dicts have keys taxid, name, kingdom, assembly_id, genome_size.
+        """
+        rows = [[entry[c] for c in METADATA_COLUMNS] for entry in entries]
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO taxids VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+    def update_genome_size(self, taxid, genome_size):
+        """Set the genome size of a TaxID already in the metadata table."""
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE taxids SET genome_size=? WHERE taxid=?",
+                (genome_size, str(taxid)),
+            )
+
+    def remove_taxids_metadata(self, taxids):
+        """Remove the metadata of the given TaxIDs."""
+        with self._connect() as connection:
+            connection.executemany(
+                "DELETE FROM taxids WHERE taxid=?",
+                [(str(taxid),) for taxid in taxids],
+            )
+
+    def query_taxids_metadata(
+        self,
+        kingdom=None,
+        name_contains=None,
+        min_genome_size=None,
+        max_genome_size=None,
+    ):
+        """Return a list of TaxIDs metadata (dicts) matching all filters.
+
+        Each dict also has a "files" entry ``{data_type: build_time}`` with
+        the last build time of each of the TaxID's data types.
+        """
+        conditions, values = [], []
+        if kingdom is not None:
+            conditions.append("kingdom=?")
+            values.append(kingdom)
+        if name_contains is not None:
+            escaped = name_contains
+            for character in "\\%_":
+                escaped = escaped.replace(character, "\\" + character)
+            conditions.append("name LIKE ? ESCAPE '\\'")
+            values.append("%" + escaped + "%")
+        if min_genome_size is not None:
+            conditions.append("genome_size>=?")
+            values.append(min_genome_size)
+        if max_genome_size is not None:
+            conditions.append("genome_size<=?")
+            values.append(max_genome_size)
+        query = "SELECT %s FROM taxids" % ", ".join(METADATA_COLUMNS)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._connect() as connection:
+            rows = connection.execute(query + " ORDER BY taxid", values)
+            results = [dict(zip(METADATA_COLUMNS, row)) for row in rows]
+            files = {result["taxid"]: {} for result in results}
+            rows = connection.execute(
+                "SELECT taxid, data_type, MAX(build_time) FROM files "
+                "GROUP BY taxid, data_type"
+            )
+            for taxid, data_type, build_time in rows:
+                if taxid in files:
+                    files[taxid][data_type] = build_time
+        for result in results:
+            result["files"] = files[result["taxid"]]
+        return results
+
+    def total_size(self):
+        """Return the total size in bytes of the catalogued files."""
+        with self._connect() as connection:
+            (size,) = connection.execute(
+                "SELECT SUM(size) FROM files"
+            ).fetchone()
+            return size or 0
+
+    def record_accesses(self, accesses):
+        """Add accesses, given as a list of (taxid, data_type, time, count).
+
+        The last access time of each (taxid, data_type) is updated, and its
+        number of accesses increased by ``count``.
+        """
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT INTO accesses VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (taxid, data_type) DO UPDATE SET "
+                "last_access=MAX(last_access, excluded.last_access), "
+                "access_count=access_count + excluded.access_count",
+                [
+                    (str(taxid), data_type, access_time, count)
+                    for taxid, data_type, access_time, count in accesses
+                ],
+            )
+
+    def accesses(self):
+        """Return a dict ``{(taxid, data_type): (last_access, count)}``."""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT taxid, data_type, last_access, access_count "
+                "FROM accesses"
+            )
+            return {
+                (taxid, data_type): (last_access, count)
+                for taxid, data_type, last_access, count in rows
+            }
+
+    def pin_taxids(self, taxids):
+        """Add TaxIDs to the list of pinned TaxIDs."""
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO pinned_taxids VALUES (?)",
+                [(str(taxid),) for taxid in taxids],
+            )
+
+    def unpin_taxids(self, taxids):
+        """Remove TaxIDs from the list of pinned TaxIDs."""
+        with self._connect() as connection:
+            connection.executemany(
+                "DELETE FROM pinned_taxids WHERE taxid=?",
+                [(str(taxid),) for taxid in taxids],
+            )
+
+    def pinned_taxids(self):
+        """Return the sorted list of pinned TaxIDs."""
+        with self._connect() as connection:
+            rows = connection.execute("SELECT taxid FROM pinned_taxids")
+            return sorted(row[0] for row in rows)
@@ -0,0 +1,99 @@
+"""Persistent cache of raw Entrez responses, stored in a SQLite file."""
+
+import os
+import json
+import time
+
+from .tools import sqlite_connection
+
+
+class EntrezCache:
+    """On-disk cache of Entrez responses with a time-to-live and LRU eviction.
+
+    Parameters
+    ==========
+
+    path
+      Path to the SQLite file of the cache (created if needed).
+
+    ttl
+      Time in seconds after which a cached response is considered outdated.
+      None means that responses never expire.
+
+    max_size
+      Maximal total size (in bytes) of the cached responses. When it is
+      exceeded, the least recently used responses are evicted.
+
+    clock
+      Function returning the current time in seconds.
+    """
+
+    def __init__(self, path, ttl=None, max_size=50e6, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response BLOB, "
+                "created REAL, last_access REAL)"
+            )
+
+    def _connect(self):
+        return sqlite_connection(self.path)
+
+    @staticmethod
+    def request_key(request, **kwargs):
+        """Return the cache key for a call to ``request(**kwargs)``."""
+        name = getattr(request, "__name__", str(request))
+        return json.dumps([name, sorted(kwargs.items())], default=str)
+
+    def get(self, key, ignore_ttl=False):
+        """Return the cached response for that key (or None if absent).
+
+        Expired responses are ignored, unless ``ignore_ttl`` is True.
+        """
+        now = self.clock()
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT response, created FROM responses WHERE key=?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, created = row
+            if (not ignore_ttl) and (self.ttl is not None):
+                if now - created > self.ttl:
+                    return None
+            connection.execute(
+                "UPDATE responses SET last_access=? WHERE key=?", (now, key)
+            )
+        return response
+
+    def set(self, key, response):
+        """Store a response (bytes) in the cache, evict old ones if needed."""
+        now = self.clock()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            rows = connection.execute(
+                "SELECT key, LENGTH(response) FROM responses "
+                "ORDER BY last_access DESC"
+            ).fetchall()
+            total_size = 0
+            evicted_keys = []
+            for row_key, size in rows:
+                total_size += size
+                if total_size > self.max_size:
+                    evicted_keys.append((row_key,))
+            connection.executemany(
+                "DELETE FROM responses WHERE key=?", evicted_keys
+            )
+
+    def clear(self):
+        """Remove all responses from the cache."""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM responses")
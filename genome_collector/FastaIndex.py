@@ -0,0 +1,130 @@
+"""Samtools-compatible (.fai) index of FASTA files, for random access."""
+
+from collections import OrderedDict, namedtuple
+
+FastaIndexRecord = namedtuple(
+    "FastaIndexRecord", ["length", "offset", "line_bases", "line_width"]
+)
+
+
+class FastaIndex:
+    """Index of the records of a FASTA file, as in samtools' .fai files.
+
+    For each record, the index stores the sequence length, the offset of the
+    first base in the file, the number of bases per line and the number of
+    bytes per line (bases + newline characters). This allows to read any
+    subsequence with a single seek and read.
+
+    Parameters
+    ==========
+
+    records
+      An ordered dict ``{record_name: FastaIndexRecord}``.
+    """
+
+    def __init__(self, records):
+        self.records = records
+
+    @staticmethod
+    def from_fasta(fasta_file):
+        """Build the index by scanning a (binary) FASTA file handle once."""
+        records = OrderedDict()
+
+        def add_record(name, length, offset, line_bases, line_width):
+            if name in records:
+                raise ValueError("Duplicate FASTA record name %s" % name)
+            records[name] = FastaIndexRecord(
+                length, offset, line_bases, line_width
+            )
+
+        current = None
+        position = 0
+        for line in fasta_file:
+            line_length = len(line)
+            if line.startswith(b">"):
+                if current is not None:
+                    add_record(**current)
+                name = line[1:].split()[0].decode()
+                current = dict(
+                    name=name,
+                    length=0,
+                    offset=position + line_length,
+                    line_bases=None,
+                    line_width=None,
+                )
+                last_line_was_short = False
+            elif current is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if current["line_bases"] is None:
+                    current["line_bases"] = bases
+                    current["line_width"] = line_length
+                elif (bases > current["line_bases"]) or (
+                    last_line_was_short and bases > 0
+                ):
+                    raise ValueError(
+                        "Record %s has lines of different lengths, it cannot "
+                        "be indexed." % current["name"]
+                    )
+                last_line_was_short = bases < current["line_bases"]
+                current["length"] += bases
+            position += line_length
+        if current is not None:
+            add_record(**current)
+        for name, record in records.items():
+            if record.line_bases is None:  # records without sequence
+                records[name] = record._replace(line_bases=0, line_width=0)
+        return FastaIndex(records)
+
+    @staticmethod
+    def read(index_path):
+        """Read an index from a .fai file."""
+        records = OrderedDict()
+        with open(index_path, "r") as f:
+            for line in f:
+                name, *numbers = line.rstrip("\n").split("\t")
+                records[name] = FastaIndexRecord(*[int(n) for n in numbers])
+        return FastaIndex(records)
+
+    def write(self, index_file):
+        """Write the index in the .fai format in a (text) file handle."""
+        for name, record in self.records.items():
+            fields = [name] + [str(number) for number in record]
+            index_file.write("\t".join(fields) + "\n")
+
+    def _file_position(self, record, position):
+        """Return the position in the file of the record's n-th base."""
+        line, column = divmod(position, record.line_bases or 1)
+        return record.offset + line * record.line_width + column
+
+    def fetch(self, fasta_file, name, start, end):
+        """Return the bases start:end (bytes) of a record of the FASTA file.
+
+        The ``fasta_file`` is a seekable binary file handle. Coordinates are
+        0-based, with ``end`` excluded, like in Python slices.
+        """
+        if name not in self.records:
+            raise ValueError("No record named %s in the FASTA file." % name)
+        record = self.records[name]
+        if not (0 <= start <= end <= record.length):
+            raise ValueError(
+                "Invalid interval (%d, %d) for record %s of length %d."
+                % (start, end, name, record.length)
+            )
+        if start == end:
+            return b""
+        file_start = self._file_position(record, start)
+        file_end = self._file_position(record, end - 1) + 1
+        fasta_file.seek(file_start)
+        data = fasta_file.read(file_end - file_start)
+        return data.replace(b"\n", b"").replace(b"\r", b"")
+
+    def fetch_chunks(self, fasta_file, name, chunk_size=2 ** 22):
+        """Yield the bases of a record (bytes) in chunks of ``chunk_size``.
+
+        This reads a whole record without holding it in memory. The
+        ``fasta_file`` is a seekable binary file handle.
+        """
+        length = self.records[name].length
+        for start in range(0, length, chunk_size):
+            end = min(start + chunk_size, length)
+            yield self.fetch(fasta_file, name, start, end)
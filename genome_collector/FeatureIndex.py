@@ -0,0 +1,307 @@
+"""Index of the features of GenBank and GFF files, in a SQLite file."""
+
+import os
+import re
+from collections import namedtuple
+from urllib.parse import unquote
+
+from .tools import sqlite_connection
+
+FEATURE_COLUMNS_TYPES = [
+    ("record_id", "TEXT"),
+    ("start", "INTEGER"),
+    ("end", "INTEGER"),
+    ("strand", "INTEGER"),
+    ("type", "TEXT"),
+    ("gene", "TEXT"),
+    ("locus_tag", "TEXT"),
+    ("product", "TEXT"),
+]
+Feature = namedtuple("Feature", [name for name, _ in FEATURE_COLUMNS_TYPES])
+FEATURE_COLUMNS = ", ".join('"%s"' % field for field in Feature._fields)
+INDEXED_QUALIFIERS = {"gene", "locus_tag", "product"}
+INSERT_BATCH_SIZE = 10000
+
+
+def _parse_genbank_location(location):
+    """Return the (start, end, strand) of a GenBank location, or None.
+
+    Coordinates are 0-based, with ``end`` excluded. Parts of the location on
+    other records (e.g. "J00194.1:100..202") are ignored.
+    """
+    location = re.sub(r"[A-Za-z_][\w.]*:[<>]?\d+(\.\.[<>]?\d+)?", "", location)
+    positions = [int(position) for position in re.findall(r"\d+", location)]
+    if not positions:
+        return None
+    strand = -1 if location.startswith("complement(") else 1
+    if location.startswith(("join(complement(", "order(complement(")):
+        strand = -1
+    return min(positions) - 1, max(positions), strand
+
+
+def _make_genbank_feature(record_id, key, location, qualifiers):
+    """Return the Feature of a GenBank feature entry, or None."""
+    coordinates = _parse_genbank_location(location)
+    if coordinates is None:
+        return None
+    qualifiers = {
+        name: value.strip('"').replace('""', '"')
+        for name, value in qualifiers.items()
+    }
+    return Feature(
+        record_id,
+        *coordinates,
+        key,
+        qualifiers.get("gene"),
+        qualifiers.get("locus_tag"),
+        qualifiers.get("product"),
+    )
+
+
+def iter_genbank_features(lines):
+    """Yield the features of a GenBank file, given as text lines.
+
+    The file is read in a single pass, and only the gene, locus_tag and
+    product qualifiers are kept, so records are never held in memory. The
+    record ID is the accession.version of the VERSION line (as in
+    Biopython), or else the LOCUS name.
+    """
+    record_id = None
+    in_features = False
+    entry = None  # dict(key, location, qualifiers)
+    qualifier = None  # None in the location, "" in unindexed qualifiers
+    for line in lines:
+        if not in_features:
+            if line.startswith("LOCUS"):
+                record_id = line.split()[1]
+            elif line.startswith("VERSION"):
+                fields = line.split()
+                if len(fields) > 1:
+                    record_id = fields[1]
+            elif line.startswith("FEATURES"):
+                in_features = True
+            continue
+        if line.startswith(" ") and not line[5:6].strip():
+            # Continuation of the current feature entry
+            content = line[21:].strip()
+            if entry is None:
+                continue
+            if content.startswith("/"):
+                name, _, value = content[1:].partition("=")
+                qualifier = name if name in INDEXED_QUALIFIERS else ""
+                if qualifier:
+                    entry["qualifiers"][name] = value
+            elif qualifier is None:
+                entry["location"] += content
+            elif qualifier:
+                entry["qualifiers"][qualifier] += " " + content
+            continue
+        if entry is not None:
+            feature = _make_genbank_feature(record_id, **entry)
+            if feature is not None:
+                yield feature
+            entry = None
+        if line.startswith(" "):  # new feature entry
+            entry = dict(
+                key=line[5:21].strip(),
+                location=line[21:].strip(),
+                qualifiers={},
+            )
+            qualifier = None
+        else:  # ORIGIN, CONTIG, //...
+            in_features = False
+    if entry is not None:
+        feature = _make_genbank_feature(record_id, **entry)
+        if feature is not None:
+            yield feature
+
+
+def iter_gff_features(lines):
+    """Yield the features of a GFF3 file, given as text lines.
+
+    The gene is the "gene" attribute (or the "Name" of features of type
+    "gene"). Strands are 1, -1, or 0 when unknown. Sequences at the end of
+    the file (after "##FASTA") are not read.
+    """
+    strands = {"+": 1, "-": -1}
+    for line in lines:
+        if line.startswith("#"):
+            if line.startswith("##FASTA"):
+                return
+            continue
+        fields = line.rstrip("\r\n").split("\t")
+        if len(fields) < 9:
+            continue
+        attributes = {}
+        for attribute in fields[8].split(";"):
+            name, _, value = attribute.partition("=")
+            attributes[name.strip()] = unquote(value)
+        gene = attributes.get("gene")
+        if (gene is None) and (fields[2] == "gene"):
+            gene = attributes.get("Name")
+        yield Feature(
+            unquote(fields[0]),
+            int(fields[3]) - 1,
+            int(fields[4]),
+            strands.get(fields[6], 0),
+            fields[2],
+            gene,
+            attributes.get("locus_tag"),
+            attributes.get("product"),
+        )
+
+
+class FeatureIndex:
+    """Index of the features of a GenBank or GFF file, in a SQLite file.
+
+    The index has one row per feature, with its record ID, coordinates
+    (0-based, ``end`` excluded, as in Python slices), strand, type, gene,
+    locus tag and product. Features are indexed by position in each record,
+    and by gene, locus tag and type, so that queries never read the whole
+    file. Queries return ``Feature`` namedtuples.
+
+    Parameters
+    ==========
+
+    path
+      Path to the SQLite file of an index created with ``build``.
+
+    Examples
+    ========
+
+    >>> index = FeatureIndex.build(iter_gff_features(f), "features.sqlite")
+    >>> index.query("NC_000913.3", start=0, end=5000, feature_type="CDS")
+    >>> [Feature(record_id='NC_000913.3', start=189, end=255, strand=1,
+    >>>          type='CDS', gene='thrL', locus_tag='b0001',
+    >>>          product='thr operon leader peptide'), ...]
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        return sqlite_connection(self.path)
+
+    @staticmethod
+    def build(features, path):
+        """Write an index of the features (an iterable of ``Feature``).
+
+        The index is written to a temporary file, renamed to ``path`` once
+        complete. Return the ``FeatureIndex``.
+        """
+        directory, basename = os.path.split(os.path.abspath(path))
+        temp_path = os.path.join(directory, "." + basename + ".tmp")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        insert = "INSERT INTO features VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+        try:
+            with sqlite_connection(temp_path) as connection:
+                connection.execute("PRAGMA journal_mode=OFF")
+                connection.execute(
+                    "CREATE TABLE features (%s)"
+                    % ", ".join(
+                        '"%s" %s' % column for column in FEATURE_COLUMNS_TYPES
+                    )
+                )
+                batch = []
+                for feature in features:
+                    batch.append(feature)
+                    if len(batch) == INSERT_BATCH_SIZE:
+                        connection.executemany(insert, batch)
+                        batch = []
+                connection.executemany(insert, batch)
+                for name, columns in [
+                    ("by_position", '"record_id", "start"'),
+                    ("by_gene", '"gene"'),
+                    ("by_locus_tag", '"locus_tag"'),
+                    ("by_type", '"type"'),
+                ]:
+                    connection.execute(
+                        "CREATE INDEX features_%s ON features (%s)"
+                        % (name, columns)
+                    )
+                # The longest feature of a record bounds the features
+                # overlapping a region, see ``query``.
+                connection.execute(
+                    'CREATE TABLE records AS SELECT "record_id", '
+                    'MAX("end" - "start") AS max_length FROM features '
+                    'GROUP BY "record_id"'
+                )
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return FeatureIndex(path)
+
+    def record_ids(self):
+        """Return the sorted list of the IDs of the records with features."""
+        with self._connect() as connection:
+            rows = connection.execute('SELECT "record_id" FROM records')
+            return sorted(row[0] for row in rows)
+
+    def query(
+        self,
+        record_id=None,
+        start=None,
+        end=None,
+        feature_type=None,
+        gene=None,
+        locus_tag=None,
+    ):
+        """Return the features matching all the given filters.
+
+        Parameters
+        ==========
+
+        record_id
+          Keep only the features of this record (e.g. "NC_000913.3").
+
+        start, end
+          Keep only the features overlapping this region of the record
+          (0-based, ``end`` excluded). A ``record_id`` is required.
+
+        feature_type
+          Keep only the features of this type (e.g. "CDS", "gene").
+
+        gene, locus_tag
+          Keep only the features with this gene name or locus tag.
+
+        Returns
+        =======
+
+        features
+          A list of ``Feature`` namedtuples, sorted by record and position.
+        """
+        conditions, values = [], []
+        for column, value in [
+            ("record_id", record_id),
+            ("type", feature_type),
+            ("gene", gene),
+            ("locus_tag", locus_tag),
+        ]:
+            if value is not None:
+                conditions.append('"%s"=?' % column)
+                values.append(value)
+        with self._connect() as connection:
+            if (start is not None) or (end is not None):
+                if record_id is None:
+                    raise ValueError("Region queries require a record_id.")
+                if end is not None:
+                    conditions.append('"start"<?')
+                    values.append(end)
+                if start is not None:
+                    row = connection.execute(
+                        'SELECT max_length FROM records WHERE "record_id"=?',
+                        (record_id,),
+                    ).fetchone()
+                    max_length = 0 if row is None else row[0]
+                    conditions.append('"start">=?')
+                    values.append(start - max_length)
+                    conditions.append('"end">?')
+                    values.append(start)
+            query = "SELECT %s FROM features" % FEATURE_COLUMNS
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            query += ' ORDER BY "record_id", "start", "end"'
+            rows = connection.execute(query, values)
+            return [Feature(*row) for row in rows]
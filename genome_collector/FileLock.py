@@ -0,0 +1,235 @@
+"""Lock files shared by threads, processes and machines (e.g. on a cluster)."""
+
+import os
+import json
+import time
+import socket
+import asyncio
+import threading
+import contextvars
+
+# Numbers of acquisitions of the locks held in the current context (thread
+# or asyncio task), to make the locks reentrant. The dict is never modified
+# in place, so that contexts copied from this one don't share it.
+_held_locks = contextvars.ContextVar("held_locks", default={})
+
+
+def _process_is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # the process exists but belongs to someone else
+        return True
+    return True
+
+
+class FileLock:
+    """Lock materialized by a file, created exclusively by its holder.
+
+    The lock file contains the holder's PID and host name. A lock is
+    considered stale (and is broken) if its holder was on the same host and
+    is dead, or if the lock file hasn't been refreshed for more than
+    ``stale_timeout`` seconds: a holder refreshes its lock file regularly,
+    from a background thread, as long as it holds the lock. As the lock only
+    relies on an exclusive file creation, it works across machines sharing
+    a network file system.
+
+    The lock is reentrant: a thread holding a lock can acquire it again
+    (e.g. in nested method calls) without blocking. In asyncio code, use
+    ``async with lock`` (or ``acquire_async``) which waits without blocking
+    the event loop. The locks held are tracked per context (thread or
+    asyncio task, see ``contextvars``), so they are also reentrant in a
+    task, and in functions that a task runs in a thread with a copy of its
+    context (``contextvars.copy_context().run``). Tasks created by a task
+    holding a lock also start with a copy of its context, so they share the
+    lock.
+
+    Parameters
+    ==========
+
+    path
+      Path of the lock file. The folder is created if needed.
+
+    timeout
+      Maximal time in seconds to wait for the lock, after which a
+      TimeoutError is raised. None for no limit.
+
+    stale_timeout
+      Time in seconds without refresh after which a lock is considered
+      abandoned.
+
+    poll_interval
+      Time in seconds between two attempts to get the lock.
+
+    Examples
+    ========
+
+    >>> lock = FileLock("some_file.lock", timeout=3600)
+    >>> with lock:
+    >>>     if lock.broke_stale_lock or not os.path.exists("some_file"):
+    >>>         create_some_file()
+    """
+
+    def __init__(
+        self, path, timeout=None, stale_timeout=600, poll_interval=0.1
+    ):
+        self.path = path
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+        self.poll_interval = poll_interval
+        self.broke_stale_lock = False
+        self._inode = None
+        self._stop_refreshing = None
+
+    def _held_count(self):
+        """Return the number of acquisitions of the lock in this context."""
+        return _held_locks.get().get(self.path, 0)
+
+    def _set_held_count(self, count):
+        held = dict(_held_locks.get())
+        if count:
+            held[self.path] = count
+        else:
+            held.pop(self.path, None)
+        _held_locks.set(held)
+
+    def is_locked(self):
+        """Return whether the lock is currently held (possibly stale)."""
+        return os.path.exists(self.path)
+
+    def _try_create(self):
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        holder = dict(pid=os.getpid(), host=socket.gethostname())
+        holder["time"] = time.time()
+        with os.fdopen(fd, "w") as f:
+            json.dump(holder, f)
+        self._inode = os.stat(self.path).st_ino
+        return True
+
+    def _is_stale(self, stat):
+        if time.time() - stat.st_mtime > self.stale_timeout:
+            return True
+        try:
+            with open(self.path, "r") as f:
+                holder = json.load(f)
+        except (OSError, ValueError):
+            return False  # being created or removed by another process
+        return (holder["host"] == socket.gethostname()) and not (
+            _process_is_alive(holder["pid"])
+        )
+
+    def _break(self, stat):
+        """Remove a stale lock file, unless it was replaced in between."""
+        stale_path = "%s.stale.%d.%d" % (
+            self.path,
+            os.getpid(),
+            threading.get_ident(),
+        )
+        try:
+            os.rename(self.path, stale_path)
+        except FileNotFoundError:
+            return
+        if os.stat(stale_path).st_ino != stat.st_ino:
+            # Another process broke the lock and acquired it meanwhile
+            try:
+                os.link(stale_path, self.path)
+            except FileExistsError:
+                pass
+        os.remove(stale_path)
+
+    def _refresh(self, stop):
+        interval = self.stale_timeout / 4.0
+        while not stop.wait(interval):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                return
+
+    def _acquisition_attempts(self):
+        """Try to create the lock file until it works.
+
+        This generator yields each time the caller should wait (for
+        ``poll_interval`` seconds) before the next attempt.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self.broke_stale_lock = False
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+        while not self._try_create():
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                continue
+            if self._is_stale(stat):
+                self._break(stat)
+                self.broke_stale_lock = True
+                continue
+            if (deadline is not None) and (time.time() > deadline):
+                raise TimeoutError(
+                    "Could not acquire lock %s within %ss"
+                    % (self.path, self.timeout)
+                )
+            yield
+        self._stop_refreshing = threading.Event()
+        threading.Thread(
+            target=self._refresh, args=(self._stop_refreshing,), daemon=True
+        ).start()
+
+    def acquire(self):
+        """Wait until the lock is acquired.
+
+        Attribute ``broke_stale_lock`` is then True if a stale lock was broken
+        in the process, which means that the previous holder was interrupted
+        and may have left incomplete files.
+        """
+        count = self._held_count()
+        if count == 0:
+            for _ in self._acquisition_attempts():
+                time.sleep(self.poll_interval)
+        self._set_held_count(count + 1)
+
+    async def acquire_async(self):
+        """Wait until the lock is acquired, without blocking the event loop.
+
+        Same as ``acquire``, for asyncio code. The lock must then be released
+        with ``release()``, in the same task.
+        """
+        count = self._held_count()
+        if count == 0:
+            for _ in self._acquisition_attempts():
+                await asyncio.sleep(self.poll_interval)
+        self._set_held_count(count + 1)
+
+    def release(self):
+        """Release the lock (once per call to ``acquire``)."""
+        count = self._held_count() - 1
+        self._set_held_count(count)
+        if count:
+            return
+        self._stop_refreshing.set()
+        try:
+            # Don't remove a lock which was (wrongly) broken and re-acquired
+            if os.stat(self.path).st_ino == self._inode:
+                os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, *args):
+        self.release()
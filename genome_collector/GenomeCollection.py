@@ -1,6 +1,7 @@
 import os
+import io
 import json
-import subprocess
+import threading
 
 import proglog
 from Bio import SeqIO
@@ -9,9 +10,27 @@ from .mixins.BlastMixin import BlastMixin
 from .mixins.NCBIMixin import NCBIMixin
 from .mixins.FileManagerMixin import FileManagerMixin
 from .mixins.BowtieMixin import BowtieMixin
+from .mixins.SequenceMixin import SequenceMixin
+from .mixins.BuildMixin import BuildMixin
+from .mixins.AssemblyStoreMixin import AssemblyStoreMixin
+from .mixins.QuotaMixin import QuotaMixin
+from .mixins.ScratchTierMixin import ScratchTierMixin
+from .mixins.FeatureMixin import FeatureMixin
+from .tools import run_process, iter_process_lines
 
 
-class GenomeCollection(BlastMixin, NCBIMixin, FileManagerMixin, BowtieMixin):
+class GenomeCollection(
+    BlastMixin,
+    NCBIMixin,
+    FileManagerMixin,
+    BowtieMixin,
+    SequenceMixin,
+    BuildMixin,
+    AssemblyStoreMixin,
+    QuotaMixin,
+    ScratchTierMixin,
+    FeatureMixin,
+):
     """Collection of local data files including genomes and BLAST databases.
 
     Parameters
@@ -51,6 +70,87 @@ class GenomeCollection(BlastMixin, NCBIMixin, FileManagerMixin, BowtieMixin):
     datafiles_extensions
       Dictionnary linking data file types to standardized file extensions.
 
+    data_layout
+      Either "flat" (default, all files directly in ``data_dir``) or
+      "sharded" (one subfolder per TaxID, advised for large collections).
+      See ``collection.taxid_dir()`` and ``collection.migrate_data_layout()``.
+
+    lock_timeout
+      Data files are downloaded or built under a lock, so that several
+      processes sharing the data directory never create the same files at
+      the same time (the others wait, then reuse the files). This is the
+      maximal waiting time in seconds (None, the default, for no limit).
+
+    stale_lock_timeout
+      Time in seconds after which the lock of a process which stopped
+      refreshing it (e.g. a crashed process on another machine) is broken.
+
+    source
+      Where missing data files are obtained from: None (default) for NCBI,
+      or a ``MirrorSource`` (local or HTTP mirror of the NCBI FTP site) or
+      ``PeerCollectionSource`` (another collection's data directory).
+
+    sequence_storage
+      Either "plain" (default, uncompressed sequence files) or "bgzf", to
+      keep the genomic FASTA/GenBank/GFF and protein FASTA files compressed
+      in BGZF blocks (as ``bgzip`` does), with a .gzi index. All methods
+      read these files transparently (the subsequence methods with random
+      access), and BLAST databases are built from the decompressed data
+      piped to ``makeblastdb``. ``bgzf_compresslevel`` (default 6) sets the
+      compression level.
+
+    packing_chunk_size
+      Number of bases read and packed at a time when creating the packed
+      genomes of ``get_taxid_packed_genome`` (default 4M).
+
+    deduplicate_assemblies
+      If True, TaxIDs with the same assembly (same accession in their infos,
+      e.g. strains of a species) share their sequence files and Bowtie
+      indexes: the files are hard-linked to a store of assemblies in the
+      hidden metadata folder, and the files of an assembly are never
+      downloaded or built twice. BLAST databases are still built per TaxID,
+      as their sequences are annotated with the TaxID. See also
+      ``deduplicate_local_files``.
+
+    build_cpu_budget, build_memory_budget
+      Total CPUs (default: all) and memory in bytes (default: no limit) for
+      the BLAST databases and Bowtie indexes built at the same time, e.g.
+      by ``build_indexes``. Set ``build_scheduler`` to a ``BuildScheduler``
+      to share a budget between collections.
+
+    build_threads
+      Number of threads of each Bowtie index build (default 1).
+
+    blast_max_file_size
+      Maximal size of BLAST database volumes (makeblastdb's
+      ``-max_file_sz``, e.g. "4GB"). The default None keeps makeblastdb's
+      default.
+
+    max_data_size
+      Maximal total size of the data files, in bytes (default None, for no
+      limit). After each download or build exceeding it, the least used
+      data files are evicted (see ``evict_data_files``): indexes first, then
+      the uncompressed sequences which have a local gz file, then the other
+      sequences. Accesses to the files are tracked by all the
+      ``get_taxid_...`` methods. ``eviction_policy`` is either "lru"
+      (default, least recently used first) or "lfu" (least frequently used
+      first). TaxIDs protected with ``pin_taxids`` are never evicted, nor
+      the files accessed in the last ``eviction_grace_period`` seconds
+      (default 600), which may still be in use. Sizes are those recorded in
+      the catalog (see ``rebuild_catalog`` for files added by hand), with
+      hard-linked files (see ``deduplicate_assemblies``) counted once.
+
+    scratch_dir
+      Optional fast local directory (e.g. on a local SSD) in front of a
+      shared ``data_dir`` (e.g. on a network file system). The methods
+      ``get_taxid_genome_data_path``, ``get_taxid_blastdb_path`` and
+      ``get_taxid_bowtie_index_path`` then copy the files to the scratch
+      directory on first use and return the local paths, and BLAST
+      databases and Bowtie indexes are built in the scratch directory then
+      published to the ``data_dir``. ``max_scratch_size`` limits the size
+      of the scratch directory, by evicting its least used files (see
+      ``max_data_size``).
+
     """
 
     messages_prefix = "[genome_collector] "
@@ -60,7 +160,21 @@ class GenomeCollection(BlastMixin, NCBIMixin, FileManagerMixin, BowtieMixin):
             data_dir = self.default_dir
         self.data_dir = data_dir
         self._logger = proglog.default_bar_logger(logger)
-        self._time_of_last_entrez_call = None
+        self._entrez_rate_limiter = None
+        self._entrez_cache = None
+        self._fasta_indexes = {}
+        self._taxid_dirs = {}
+        self._catalog = None
+        self._catalog_lock = threading.Lock()
+        self._entrez_lock = threading.Lock()
+        self._build_scheduler = None
+        self._build_lock = threading.Lock()
+        self._pending_accesses = {}
+        self._last_access_flush = 0
+        self._flushed_accesses = set()
+        self._access_lock = threading.Lock()
+        self._scratch_collection = None
+        self._scratch_lock = threading.Lock()
 
     def _log_message(self, message):
         """Send a message (with prefix) to the logger)"""
@@ -86,15 +200,13 @@ class GenomeCollection(BlastMixin, NCBIMixin, FileManagerMixin, BowtieMixin):
         """
         taxid = str(taxid)
         path = self.datafile_path(taxid=taxid, data_type="infos")
-        if not os.path.exists(path):
+
+        def download():
             if not self.autodownload:
-                error_message = (
-                    "No infos for taxid %s found locally, and parameter "
-                    "autodownload_enabled is set to False in "
-                    "genome_collector.settings"
-                ) % taxid
-                raise FileNotFoundError(error_message)
-            self.download_taxid_genome_infos_from_ncbi(taxid)
+                self._raise_missing_file_error(path, "infos", taxid)
+            self.download_taxid_genome_infos(taxid)
+
+        self._single_flight(taxid, "infos", path, download)
         with open(path, "r") as f:
             return json.load(f)
 
@@ -104,21 +216,63 @@ class GenomeCollection(BlastMixin, NCBIMixin, FileManagerMixin, BowtieMixin):
         
         ``data_type`` is either genomic_fasta, genomic_genbank, genomic_gff,
         or protein_fasta
+
+        With ``sequence_storage = "bgzf"``, this is the path of the BGZF file
+        (which can be read by any gzip reader, or with
+        ``open_taxid_genome_data``).
+
+        With a ``scratch_dir``, this is the path of the file's copy in the
+        scratch directory.
         """
         taxid = str(taxid)
-        path = self.datafile_path(taxid=taxid, data_type=data_type)
-        if not os.path.exists(path):
+        stored_data_type = self._stored_data_type(data_type)
+        path = self.datafile_path(taxid=taxid, data_type=stored_data_type)
+
+        def download():
+            stored_data_types = self._stored_data_types(data_type)
+            if self._link_from_assembly_store(taxid, stored_data_types):
+                return
+            if self._gunzip_local_gz_file(taxid, data_type):
+                return
             if not self.autodownload:
-                error_message = (
-                    "No genome for taxid %s found locally, and parameter "
-                    "autodownload_enabled is set to False in "
-                    "genome_collector.settings"
-                ) % taxid
-                raise FileNotFoundError(error_message)
-            self.download_taxid_genome_data_from_ncbi(
-                taxid, data_type=data_type
+                self._raise_missing_file_error(path, "genome", taxid)
+            self.download_taxid_genome_data(taxid, data_type=data_type)
+            self._add_to_assembly_store(taxid, stored_data_types)
+
+        self._single_flight(taxid, stored_data_type, path, download)
+        return self._scratch_tier_path(taxid, stored_data_type)
+
+    def open_taxid_genome_data(self, taxid, data_type="genomic_fasta"):
+        """Return a binary file handle of the taxid's genome data file.
+
+        The data is downloaded if needed. This works with all values of the
+        ``sequence_storage`` attribute: BGZF files are decompressed on the
+        fly.
+
+        Examples
+        ========
+
+        >>> with collection.open_taxid_genome_data(511145) as f:
+        >>>     n_records = sum(line.startswith(b">") for line in f)
+        """
+        self.get_taxid_genome_data_path(taxid, data_type=data_type)
+        return self._open_data_file(str(taxid), data_type)
+
+    @staticmethod
+    def _raise_missing_file_error(path, description, taxid):
+        """Raise the error for a missing (or corrupted) file, offline."""
+        if os.path.exists(path):
+            raise IOError(
+                "The local %s file for taxid %s is corrupted (see "
+                "verify_taxid_files), and parameter autodownload is set to "
+                "False." % (description, taxid)
             )
-        return path
+        error_message = (
+            "No %s for taxid %s found locally, and parameter "
+            "autodownload_enabled is set to False in "
+            "genome_collector.settings"
+        ) % (description, taxid)
+        raise FileNotFoundError(error_message)
 
     def get_taxid_biopython_records(
         self, taxid, source_type="genomic_genbank", as_iterator=False
@@ -130,24 +284,42 @@ class GenomeCollection(BlastMixin, NCBIMixin, FileManagerMixin, BowtieMixin):
 
         For huge genomes, use the ``as_iterator`` option to return a Python
         iterator, which avoids to load all chromosomes at once in memory.
+
+        Records stored as BGZF (see ``sequence_storage``) are decompressed
+        on the fly.
         """
         path = self.get_taxid_genome_data_path(taxid, data_type=source_type)
         data_format = source_type.split("_")[1]
-        records = SeqIO.parse(path, data_format)
+        if self._stored_data_type(source_type) == source_type:
+            return self._parse_records(path, data_format, as_iterator)
+        handle = io.TextIOWrapper(self._open_data_file(taxid, source_type))
+        if as_iterator:
+            return self._parse_records(handle, data_format, as_iterator)
+        with handle:
+            return self._parse_records(handle, data_format, as_iterator)
+
+    @staticmethod
+    def _parse_records(source, data_format, as_iterator):
+        records = SeqIO.parse(source, data_format)
         if as_iterator:
             return records
         else:
             return list(records)
     
     @staticmethod
-    def run_process(name, parameters):
-        process = subprocess.run(
-            parameters,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        if process.returncode:
-            error = process.stderr.decode()
-            parameters = " ".join(parameters)
-            raise OSError("%s failed:\n\n%s\n\n%s" % (name, error, parameters))
-        return process.stdout
+    def run_process(name, parameters, stdout_path=None, **kwargs):
+        """Run a process and return its stdout. Raise an OSError if it fails.
+
+        See ``genome_collector.tools.run_process`` for the other parameters
+        (``timeout``, ``cancel_event``...). If ``stdout_path`` is provided,
+        the stdout is streamed to that file instead of being returned.
+        """
+        return run_process(name, parameters, stdout_path=stdout_path, **kwargs)
+
+    @staticmethod
+    def iter_process_lines(name, parameters, **kwargs):
+        """Run a process and yield the lines of its stdout as they come.
+
+        See ``genome_collector.tools.iter_process_lines``.
+        """
+        return iter_process_lines(name, parameters, **kwargs)
@@ -0,0 +1,190 @@
+"""Gzip decompression with the fastest implementation available.
+
+External programs (igzip, pigz) and in-process libraries (python-isal,
+zlib-ng) decompress several times faster than the standard library's zlib,
+which is used as a fallback.
+"""
+
+import os
+import gzip
+import zlib
+import shutil
+import importlib
+import subprocess
+
+from .tools import CHUNK_SIZE, GZIP_WBITS, _monitored_process
+
+# Programs decompressing to stdout, in order of preference ("THREADS" is
+# replaced by the number of threads).
+GUNZIP_PROGRAMS = {
+    "igzip": ["igzip", "-d", "-c"],
+    "pigz": ["pigz", "-d", "-c", "-p", "THREADS"],
+}
+
+# Libraries with zlib- and gzip-like modules, in order of preference, as
+# (zlib-like module, gzip-like module, pip package).
+GUNZIP_LIBRARIES = {
+    "isal": ("isal.isal_zlib", "isal.igzip", "isal"),
+    "zlib-ng": ("zlib_ng.zlib_ng", "zlib_ng.gzip_ng", "zlib-ng"),
+    "zlib": ("zlib", "gzip", None),
+}
+
+
+def _import_library(name):
+    zlib_name, gzip_name, package = GUNZIP_LIBRARIES[name]
+    try:
+        return (
+            importlib.import_module(zlib_name),
+            importlib.import_module(gzip_name),
+        )
+    except ImportError:
+        raise ImportError(
+            "Gunzip backend '%s' requires package %s. Install it with "
+            "pip install %s" % (name, package, package)
+        )
+
+
+class GunzipBackend:
+    """Decompress gzip files with a program or a library.
+
+    Parameters
+    ==========
+
+    name
+      One of "igzip", "pigz" (external programs), "isal", "zlib-ng"
+      (Python libraries), "zlib" (standard library), or "auto" for the first
+      of these which is available on this machine, in that order.
+
+    threads
+      Number of threads used by the programs which support it (pigz). The
+      default None means one per CPU.
+
+    Examples
+    ========
+
+    >>> backend = GunzipBackend("auto")
+    >>> print (backend.name)
+    >>> backend.gunzip_file("genome.fna.gz", "genome.fa")
+    """
+
+    def __init__(self, name="auto", threads=None):
+        if name == "auto":
+            name = self.available_backends()[0]
+        if name in GUNZIP_PROGRAMS:
+            if shutil.which(name) is None:
+                raise FileNotFoundError(
+                    "Gunzip backend '%s' requires program %s in the PATH"
+                    % (name, name)
+                )
+        elif name in GUNZIP_LIBRARIES:
+            _import_library(name)
+        else:
+            raise ValueError(
+                "Unknown gunzip backend '%s'. Choose one of %s, or 'auto'."
+                % (name, ", ".join(self.backend_names()))
+            )
+        self.name = name
+        self.threads = threads
+
+    @staticmethod
+    def backend_names():
+        """Return the names of all backends, in order of preference."""
+        return list(GUNZIP_PROGRAMS) + list(GUNZIP_LIBRARIES)
+
+    @staticmethod
+    def available_backends():
+        """Return the names of the backends available on this machine."""
+        available = []
+        for name in GUNZIP_PROGRAMS:
+            if shutil.which(name) is not None:
+                available.append(name)
+        for name in GUNZIP_LIBRARIES:
+            try:
+                _import_library(name)
+            except ImportError:
+                continue
+            available.append(name)
+        return available
+
+    @property
+    def library_name(self):
+        """Name of the library used for in-process decompression.
+
+        This is the backend itself for libraries, and the best available
+        library for programs (which cannot decompress streamed data).
+        """
+        if self.name in GUNZIP_LIBRARIES:
+            return self.name
+        return [
+            name
+            for name in self.available_backends()
+            if name in GUNZIP_LIBRARIES
+        ][0]
+
+    def decompressobj(self):
+        """Return a new zlib-like decompressor for gzip data.
+
+        Its errors are of type ``self.error``. Use it to decompress data in
+        chunks, for instance while it is downloaded.
+        """
+        zlib_module, _ = _import_library(self.library_name)
+        return zlib_module.decompressobj(GZIP_WBITS)
+
+    @property
+    def error(self):
+        """Class of the errors raised by the decompressors."""
+        zlib_module, _ = _import_library(self.library_name)
+        return zlib_module.error
+
+    def open(self, gz_path):
+        """Return a binary file handle reading a gzip file's data.
+
+        The file is decompressed in-process, by the backend's library (or
+        the fastest available library, for programs).
+        """
+        _, gzip_module = _import_library(self.library_name)
+        return gzip_module.open(gz_path, "rb")
+
+    def gunzip_file(self, gz_path, target):
+        """Decompress a gzip file into a file.
+
+        ``target`` is either a path or a file object opened in binary mode
+        (or any object with a ``write`` method). Gzip files made of several
+        concatenated members are supported. An IOError is raised if the data
+        is invalid or truncated.
+        """
+        if isinstance(target, (str, os.PathLike)):
+            with open(target, "wb") as f:
+                return self.gunzip_file(gz_path, f)
+        if self.name in GUNZIP_PROGRAMS:
+            self._gunzip_with_program(gz_path, target)
+        else:
+            self._gunzip_with_library(gz_path, target)
+
+    def _gunzip_with_program(self, gz_path, target):
+        threads = str(self.threads or os.cpu_count() or 1)
+        parameters = [
+            threads if parameter == "THREADS" else parameter
+            for parameter in GUNZIP_PROGRAMS[self.name]
+        ]
+        name = "Decompressing %s with %s" % (gz_path, self.name)
+        if hasattr(target, "fileno"):
+            # The program writes directly in the target file
+            target.flush()
+            stdout = target
+        else:
+            stdout = subprocess.PIPE
+        with _monitored_process(
+            name, parameters + [gz_path], stdout, None, None, 100
+        ) as process:
+            if stdout is subprocess.PIPE:
+                shutil.copyfileobj(process.stdout, target, CHUNK_SIZE)
+
+    def _gunzip_with_library(self, gz_path, target):
+        zlib_module, gzip_module = _import_library(self.name)
+        errors = (zlib_module.error, zlib.error, gzip.BadGzipFile, EOFError)
+        try:
+            with gzip_module.open(gz_path, "rb") as f:
+                shutil.copyfileobj(f, target, CHUNK_SIZE)
+        except errors as err:
+            raise IOError("Invalid gzip file %s: %s" % (gz_path, err))
@@ -0,0 +1,122 @@
+"""Token-bucket rate limiter which can be shared by threads and processes."""
+
+import os
+import json
+import time
+import asyncio
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover (Windows)
+    fcntl = None
+
+
+class RateLimiter:
+    """Token bucket limiting the rate of some calls (e.g. Entrez requests).
+
+    Method ``acquire()`` blocks until the next call is allowed. The limiter
+    is thread-safe. When a ``state_file`` is provided, the state of the
+    bucket is kept in that file (protected by a file lock) so that all
+    processes using the same file share the same quota.
+
+    Parameters
+    ==========
+
+    rate
+      Number of calls allowed per second, on average.
+
+    capacity
+      Maximal number of calls which can be made in a burst after a period of
+      inactivity. The default of 1 evenly spaces the calls.
+
+    state_file
+      Optional path to a file shared with other processes. File sharing is
+      only available on systems providing ``fcntl`` (Linux, MacOS...),
+      elsewhere the limiter is only shared between threads.
+
+    clock
+      Function returning the current time in seconds. To be shared between
+      processes, this should be the (default) wall clock ``time.time``.
+
+    sleep
+      Function used to wait, ``time.sleep`` by default.
+    """
+
+    def __init__(
+        self,
+        rate,
+        capacity=1,
+        state_file=None,
+        clock=time.time,
+        sleep=time.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.state_file = state_file if fcntl is not None else None
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _reserve(self, state):
+        """Take a token from the state. Return the new state and the wait.
+
+        The number of tokens can become negative: the call is then allowed
+        once the bucket will have refilled enough.
+        """
+        now = self.clock()
+        if state is None:
+            tokens = self.capacity
+        else:
+            elapsed = max(0, now - state["timestamp"])
+            tokens = min(self.capacity, state["tokens"] + elapsed * self.rate)
+        tokens -= 1
+        wait = -tokens / self.rate if tokens < 0 else 0
+        return dict(tokens=tokens, timestamp=now), wait
+
+    def _reserve_in_state_file(self):
+        directory = os.path.dirname(os.path.abspath(self.state_file))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.state_file, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                try:
+                    state = json.loads(content) if content else None
+                except ValueError:
+                    state = None
+                state, wait = self._reserve(state)
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return wait
+
+    def _reserve_wait(self):
+        """Reserve a call. Return the time to wait before making it."""
+        with self._lock:
+            if self.state_file is None:
+                self._state, wait = self._reserve(self._state)
+            else:
+                wait = self._reserve_in_state_file()
+        return wait
+
+    def acquire(self):
+        """Wait until a new call is allowed by the rate limit."""
+        wait = self._reserve_wait()
+        if wait > 0:
+            self.sleep(wait)
+
+    async def acquire_async(self):
+        """Wait until a new call is allowed, without blocking the event loop.
+
+        Same as ``acquire``, for asyncio code. Synchronous and asynchronous
+        calls share the same quota.
+        """
+        wait = self._reserve_wait()
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,307 @@
+"""Memory-mapped genomes packed 2 bits per base (UCSC .2bit format).
+
+This module requires NumPy.
+"""
+
+import mmap
+import struct
+from functools import partial
+
+TWOBIT_SIGNATURE = 0x1A412743
+
+# Bases are encoded T=0, C=1, A=2, G=3 in the .2bit format
+BASES = b"TCAG"
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            "NumPy is required for packed (.2bit) genomes. Install it with "
+            "pip install numpy"
+        )
+    return numpy
+
+
+def _runs(numpy, mask):
+    """Return (starts, sizes) arrays of the runs of True in a boolean array."""
+    padded = numpy.concatenate([[False], mask, [False]]).astype(numpy.int8)
+    changes = numpy.flatnonzero(numpy.diff(padded))
+    starts, ends = changes[::2], changes[1::2]
+    return starts.astype("<u4"), (ends - starts).astype("<u4")
+
+
+class _RunsCollector:
+    """Collect the runs of True of a boolean array given chunk by chunk.
+
+    Runs spanning several chunks are merged. Only the runs are kept in
+    memory, never the chunks.
+    """
+
+    def __init__(self, numpy):
+        self.numpy = numpy
+        self.starts, self.sizes = [], []
+        self.last_run = None  # (start, size), may grow with the next chunk
+
+    def add(self, mask, offset):
+        """Add the runs of a chunk starting at position ``offset``."""
+        starts, sizes = _runs(self.numpy, mask)
+        if len(starts) == 0:
+            return
+        starts = starts.astype("int64") + offset
+        sizes = sizes.astype("int64")
+        if self.last_run is not None:
+            last_start, last_size = self.last_run
+            if last_start + last_size == starts[0]:
+                starts[0], sizes[0] = last_start, sizes[0] + last_size
+            else:
+                self.starts.append([last_start])
+                self.sizes.append([last_size])
+        self.starts.append(starts[:-1])
+        self.sizes.append(sizes[:-1])
+        self.last_run = (int(starts[-1]), int(sizes[-1]))
+
+    def arrays(self):
+        """Return the (starts, sizes) arrays of all runs."""
+        starts, sizes = [[]] + self.starts, [[]] + self.sizes
+        if self.last_run is not None:
+            starts.append([self.last_run[0]])
+            sizes.append([self.last_run[1]])
+        return tuple(
+            self.numpy.concatenate(arrays).astype("<u4")
+            for arrays in (starts, sizes)
+        )
+
+
+def _base_tables(numpy):
+    """Return the (codes, is_acgt) lookup tables of uppercase letters."""
+    codes = numpy.zeros(256, dtype=numpy.uint8)
+    is_acgt = numpy.zeros(256, dtype=bool)
+    for code, base in enumerate(BASES):
+        codes[base] = code
+        is_acgt[base] = True
+    return codes, is_acgt
+
+
+def _pack_bases(numpy, codes, chunk):
+    """Return the bytes of a chunk (bytes) packed 2 bits per base."""
+    upper = numpy.frombuffer(chunk, dtype=numpy.uint8) & 0xDF
+    packed = codes[upper]
+    packed = numpy.concatenate(
+        [packed, numpy.zeros(-len(packed) % 4, dtype=numpy.uint8)]
+    ).reshape(-1, 4)
+    packed = (
+        (packed[:, 0] << 6)
+        | (packed[:, 1] << 4)
+        | (packed[:, 2] << 2)
+        | packed[:, 3]
+    )
+    return packed.astype(numpy.uint8).tobytes()
+
+
+def _write_record(numpy, read_chunks, f):
+    """Write the .2bit record section of a sequence in a file handle.
+
+    ``read_chunks()`` returns an iterator over the chunks (bytes) of the
+    sequence. It is called twice: the runs of N and lowercase letters, which
+    come first in the record, are found in a first pass, then the bases are
+    packed in a second pass.
+    """
+    codes, is_acgt = _base_tables(numpy)
+    n_runs, mask_runs = _RunsCollector(numpy), _RunsCollector(numpy)
+    length = 0
+    for chunk in read_chunks():
+        array = numpy.frombuffer(chunk, dtype=numpy.uint8)
+        n_runs.add(~is_acgt[array & 0xDF], length)
+        mask_runs.add(array >= ord("a"), length)
+        length += len(chunk)
+    n_starts, n_sizes = n_runs.arrays()
+    mask_starts, mask_sizes = mask_runs.arrays()
+    for data in [
+        struct.pack("<II", length, len(n_starts)),
+        n_starts.tobytes(),
+        n_sizes.tobytes(),
+        struct.pack("<I", len(mask_starts)),
+        mask_starts.tobytes(),
+        mask_sizes.tobytes(),
+        struct.pack("<I", 0),
+    ]:
+        f.write(data)
+    # Chunks are packed by groups of 4 bases, the rest goes to the next chunk
+    rest = b""
+    for chunk in read_chunks():
+        if rest:
+            chunk = rest + chunk
+        end = len(chunk) - len(chunk) % 4
+        f.write(_pack_bases(numpy, codes, chunk[:end]))
+        rest = chunk[end:]
+    f.write(_pack_bases(numpy, codes, rest))
+
+
+def write_twobit_file(records, names, f):
+    """Write sequences in the .2bit format in a binary file handle.
+
+    Parameters
+    ==========
+
+    records
+      Iterable of sequences, in the same order as ``names``. Each sequence
+      is either bytes, or a function returning an iterator over the chunks
+      (bytes) of the sequence. Functions are called twice, and the sequence
+      is never entirely in memory. Letters other than ACGT (whatever their
+      case) are stored as N, lowercase letters are stored as soft-masked
+      blocks.
+
+    names
+      List of the records names. Required in advance as the file starts with
+      an index of all records.
+
+    f
+      A binary file handle, open for writing, and seekable.
+    """
+    numpy = _import_numpy()
+    encoded_names = [name.encode() for name in names]
+    index_size = sum(1 + len(name) + 8 for name in encoded_names)
+    f.write(b"\0" * (16 + index_size))  # header and index come last
+    offsets = []
+    for sequence in records:
+        offsets.append(f.tell())
+        if isinstance(sequence, bytes):
+            sequence = partial(iter, [sequence])
+        _write_record(numpy, sequence, f)
+    if len(offsets) != len(names):
+        raise ValueError("There should be as many records as names.")
+    # Version 1 of the format uses 64-bit offsets, for files over 4GB
+    version = 0 if f.tell() < 2 ** 32 else 1
+    offset_format = "<I" if version == 0 else "<Q"
+    index = [struct.pack("<IIII", TWOBIT_SIGNATURE, version, len(names), 0)]
+    for name, offset in zip(encoded_names, offsets):
+        index += [struct.pack("B", len(name)), name]
+        index.append(struct.pack(offset_format, offset))
+    index = b"".join(index)
+    # With 4-bytes offsets, the index is smaller than the reserved space
+    index = index + b"\0" * (16 + index_size - len(index))
+    f.seek(0)
+    f.write(index)
+    f.seek(0, 2)
+
+
+class TwoBitGenome:
+    """Read-only, memory-mapped access to a .2bit genome file.
+
+    The file is mapped in memory, so several processes reading the same
+    genome share the same pages. Use it as a context manager, or call
+    ``close()`` when done (after deleting the buffers obtained with
+    ``packed()``).
+
+    Examples
+    ========
+
+    >>> with TwoBitGenome("genome.2bit") as genome:
+    >>>     packed = numpy.frombuffer(genome.packed("chr1"), dtype="uint8")
+    >>>     print (genome.sequence("chr1", 1000, 1020))
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = self._mmap
+        signature, version, n_records, _ = struct.unpack_from(
+            "<IIII", buffer, 0
+        )
+        if signature != TWOBIT_SIGNATURE:
+            raise ValueError("%s is not a (little-endian) 2bit file." % path)
+        offset_format = "<I" if version == 0 else "<Q"
+        offset_size = struct.calcsize(offset_format)
+        position = 16
+        self.records = {}
+        for i in range(n_records):
+            name_size = buffer[position]
+            name = bytes(buffer[position + 1 : position + 1 + name_size])
+            position += 1 + name_size
+            (offset,) = struct.unpack_from(offset_format, buffer, position)
+            position += offset_size
+            self.records[name.decode()] = self._read_record_header(offset)
+
+    def _read_record_header(self, offset):
+        numpy = _import_numpy()
+        buffer = self._mmap
+        length, n_blocks = struct.unpack_from("<II", buffer, offset)
+        offset += 8
+
+        def read_blocks(offset, n_blocks):
+            # Copies, so that the arrays don't prevent closing the mmap
+            blocks = numpy.frombuffer(buffer, "<u4", 2 * n_blocks, offset)
+            return blocks[:n_blocks].copy(), blocks[n_blocks:].copy()
+
+        n_starts, n_sizes = read_blocks(offset, n_blocks)
+        offset += 8 * n_blocks
+        (n_mask_blocks,) = struct.unpack_from("<I", buffer, offset)
+        mask_starts, mask_sizes = read_blocks(offset + 4, n_mask_blocks)
+        offset += 4 + 8 * n_mask_blocks + 4  # +4 for the "reserved" field
+        return dict(
+            length=length,
+            n_blocks=(n_starts, n_sizes),
+            mask_blocks=(mask_starts, mask_sizes),
+            packed_offset=offset,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Unmap the file."""
+        self._mmap.close()
+
+    def packed(self, name):
+        """Return a zero-copy buffer of the record's 2-bit packed bases.
+
+        Each byte encodes 4 bases (first base in the highest bits) with
+        T=0, C=1, A=2, G=3. N positions are encoded as T, see ``n_blocks``.
+        The buffer can be wrapped in a NumPy array with
+        ``numpy.frombuffer(buffer, dtype="uint8")``.
+        """
+        record = self.records[name]
+        start = record["packed_offset"]
+        end = start + (record["length"] + 3) // 4
+        return memoryview(self._mmap)[start:end]
+
+    def n_blocks(self, name):
+        """Return the (starts, sizes) arrays of the record's runs of N."""
+        return self.records[name]["n_blocks"]
+
+    def sequence(self, name, start=0, end=None):
+        """Return the (upper-case) sequence start:end of a record (str)."""
+        numpy = _import_numpy()
+        if name not in self.records:
+            raise ValueError("No record named %s in %s" % (name, self.path))
+        record = self.records[name]
+        if end is None:
+            end = record["length"]
+        if not (0 <= start <= end <= record["length"]):
+            raise ValueError(
+                "Invalid interval (%d, %d) for record %s of length %d."
+                % (start, end, name, record["length"])
+            )
+        packed = numpy.frombuffer(
+            self.packed(name)[start // 4 : (end + 3) // 4], dtype=numpy.uint8
+        )
+        codes = numpy.stack(
+            [(packed >> shift) & 3 for shift in (6, 4, 2, 0)], axis=1
+        ).ravel()
+        first = start - 4 * (start // 4)
+        bases = numpy.frombuffer(BASES, dtype=numpy.uint8)[
+            codes[first : first + end - start]
+        ]
+        n_starts, n_sizes = record["n_blocks"]
+        for n_start, n_size in zip(n_starts, n_sizes):
+            block_start = max(int(n_start), start)
+            block_end = min(int(n_start + n_size), end)
+            if block_start < block_end:
+                bases[block_start - start : block_end - start] = ord("N")
+        return bases.tobytes().decode()
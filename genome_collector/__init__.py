@@ -1,7 +1,15 @@
 from .GenomeCollection import GenomeCollection
+from .AsyncGenomeCollection import AsyncGenomeCollection
+from .BuildScheduler import BuildScheduler
+from .sources import NCBISource, MirrorSource, PeerCollectionSource
 from .version import __version__
 
 __all__ = [
     "GenomeCollection",
+    "AsyncGenomeCollection",
+    "BuildScheduler",
+    "NCBISource",
+    "MirrorSource",
+    "PeerCollectionSource",
     "__version__",
 ]
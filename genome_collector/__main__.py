@@ -4,12 +4,15 @@ Usage:
   python -m genome_collector data <taxid> <data_type> [data_dir]
   python -m genome_collector blast_db <taxid> <db_type> [data_dir]
   python -m genome_collector bowtie1 <taxid> [data_dir]
+  python -m genome_collector migrate <layout> [data_dir]
+  python -m genome_collector verify [data_dir]
 
 Parameters:
   - taxid: a taxonomic ID. Must have a single reference assembly on NCBI.
   - data_type: one of genomic_fasta, genomic_genbank, genomic_bff,
     protein_fasta.
   - db_type: either "nucl" or "prot".
+  - layout: either "flat" or "sharded" (one subfolder per TaxID).
   - data_dir: optional directory where the data will be downloaded.
 """
 
@@ -40,5 +43,19 @@ if __name__ == "__main__":
         taxid = sys.argv[2]
         version = "1" if command == "bowtie1" else "2"
         collection.generate_bowtie_index_for_taxid(taxid, version=version)
+    elif command == "migrate":
+        collection = GenomeCollection()
+        if len(sys.argv) == 4:
+            collection.data_dir = sys.argv[3]
+        collection.migrate_data_layout(layout=sys.argv[2])
+    elif command == "verify":
+        collection = GenomeCollection()
+        if len(sys.argv) == 3:
+            collection.data_dir = sys.argv[2]
+        problems = collection.verify_collection()
+        for filename, problem in sorted(problems.items()):
+            print("%s: %s" % (filename, problem))
+        if problems:
+            sys.exit(1)
     else:
         raise ValueError("Unknown genome_collector command %s." % command)
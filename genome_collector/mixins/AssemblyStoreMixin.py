@@ -0,0 +1,275 @@
+"""Mixin sharing the files of TaxIDs with the same genome assembly."""
+
+import os
+import re
+import glob
+import shutil
+
+from ..tools import atomic_link_or_copy, file_hash
+
+
+class AssemblyStoreMixin:
+    """All methods are directly accessible to GenomeCollection instances."""
+
+    deduplicate_assemblies = False
+    deduplicated_data_types = {
+        "genomic_fasta",
+        "genomic_genbank",
+        "genomic_gff",
+        "protein_fasta",
+        "genomic_fasta_bgzf",
+        "genomic_fasta_bgzf_gzi",
+        "genomic_genbank_bgzf",
+        "genomic_genbank_bgzf_gzi",
+        "genomic_gff_bgzf",
+        "genomic_gff_bgzf_gzi",
+        "protein_fasta_bgzf",
+        "protein_fasta_bgzf_gzi",
+        # BLAST databases are not shared, as their sequences are annotated
+        # with the TaxID (for the "staxid" column).
+        "bowtie1_index",
+        "bowtie2_index",
+    }
+
+    def _assembly_key(self, taxid):
+        """Return the name of the TaxID's assembly in the store, or None.
+
+        This is the assembly accession (e.g. "GCF_000005845.2") of the
+        TaxID's infos, or else the NCBI Assembly ID. The infos are obtained
+        if needed (and allowed by ``autodownload``).
+        """
+        infos_path = self.datafile_path(taxid, "infos")
+        if not (self.autodownload or os.path.exists(infos_path)):
+            return None
+        infos = self.get_taxid_infos(taxid)
+        for field in ["AssemblyAccession", "Assembly_Accession"]:
+            accession = infos.get(field, "")
+            if accession:
+                return re.sub(r"[^\w.-]", "_", accession)
+        assembly_id = str(infos.get("AssemblyID", ""))
+        if assembly_id not in ("", "0"):
+            return "assembly_" + re.sub(r"[^\w.-]", "_", assembly_id)
+        return None
+
+    def _assembly_store_path(self, key, data_type):
+        """Return the path (prefix) of an assembly's file in the store."""
+        filename = key + self.datafiles_extensions[data_type]
+        return self._metadata_path("assemblies", key, filename)
+
+    def _assembly_build_record_path(self, key, data_type):
+        """Return the path of the build record of an assembly's index."""
+        filename = "build_%s.json" % data_type
+        return self._metadata_path("assemblies", key, filename)
+
+    def _data_type_files(self, path, data_type):
+        """Return the files of a data type at this path (or path prefix)."""
+        if data_type in self.multifile_data_types:
+            return glob.glob(glob.escape(path) + ".*")
+        return [path] if os.path.exists(path) else []
+
+    def _link_files(self, source_prefix, target_prefix, data_type, ready):
+        """Link the files of a data type to the same names under a new prefix.
+
+        For multi-file data types, the target files which are not in the
+        sources are removed first, and the file with the ``ready`` path name
+        is linked last, so the target is never seen as ready before all of
+        its files are in place.
+        """
+        source_paths = self._data_type_files(source_prefix, data_type)
+        suffixes = [path[len(source_prefix) :] for path in source_paths]
+        for path in self._data_type_files(target_prefix, data_type):
+            if path[len(target_prefix) :] not in suffixes:
+                os.remove(path)
+        ready_suffix = ready[len(source_prefix) :]
+        for suffix in sorted(suffixes, key=lambda s: s == ready_suffix):
+            target = target_prefix + suffix
+            atomic_link_or_copy(source_prefix + suffix, target)
+
+    def _link_from_assembly_store(
+        self, taxid, data_types, ready_extension=""
+    ):
+        """Link the TaxID's files of these types to its assembly's files.
+
+        Return True if the store had all the files, which are then
+        hard-linked (or copied, where hard links are not supported) to the
+        TaxID's data files. Return False, without linking anything, if
+        ``deduplicate_assemblies`` is False, if a data type is not in
+        ``deduplicated_data_types``, if the TaxID's assembly is unknown, or
+        if a file is missing. ``ready_extension`` is the
+        extension of the file proving that a multi-file data type (BLAST
+        database, Bowtie index) is complete.
+        """
+        if not self.deduplicate_assemblies:
+            return False
+        if not self.deduplicated_data_types.issuperset(data_types):
+            return False
+        key = self._assembly_key(taxid)
+        if key is None:
+            return False
+        for data_type in data_types:
+            store_path = self._assembly_store_path(key, data_type)
+            if not os.path.exists(store_path + ready_extension):
+                return False
+        for data_type in data_types:
+            with self._taxid_file_lock("assembly_" + key, data_type):
+                store_path = self._assembly_store_path(key, data_type)
+                self._link_files(
+                    store_path,
+                    self.datafile_path(taxid, data_type),
+                    data_type,
+                    store_path + ready_extension,
+                )
+                if data_type in self.multifile_data_types:
+                    record_path = self._assembly_build_record_path(
+                        key, data_type
+                    )
+                    if os.path.exists(record_path):
+                        atomic_link_or_copy(
+                            record_path,
+                            self._build_record_path(taxid, data_type),
+                            hardlink=False,
+                        )
+            self._register_taxid_files(taxid, data_type)
+        message = "Reusing the %s files of assembly %s for taxid %s"
+        self._log_message(message % ("/".join(data_types), key, taxid))
+        return True
+
+    def _add_to_assembly_store(self, taxid, data_types, ready_extension=""):
+        """Link the TaxID's files of these types into its assembly's store.
+
+        Nothing is done if ``deduplicate_assemblies`` is False or if the
+        TaxID's assembly is unknown.
+        """
+        if not self.deduplicate_assemblies:
+            return
+        key = self._assembly_key(taxid)
+        if key is None:
+            return
+        for data_type in data_types:
+            if data_type not in self.deduplicated_data_types:
+                continue
+            taxid_path = self.datafile_path(taxid, data_type)
+            paths = self._data_type_files(taxid_path, data_type)
+            # Multi-volume BLAST databases have an alias file listing the
+            # volumes by name, so they can't be renamed.
+            if any(path.endswith((".nal", ".pal")) for path in paths):
+                paths = []
+            if not paths:
+                continue
+            with self._taxid_file_lock("assembly_" + key, data_type):
+                store_path = self._assembly_store_path(key, data_type)
+                self._link_files(
+                    taxid_path,
+                    store_path,
+                    data_type,
+                    taxid_path + ready_extension,
+                )
+                record_path = self._build_record_path(taxid, data_type)
+                if os.path.exists(record_path):
+                    atomic_link_or_copy(
+                        record_path,
+                        self._assembly_build_record_path(key, data_type),
+                        hardlink=False,
+                    )
+
+    def _stored_data_types(self, data_type):
+        """Return the data types of the files storing data of this type.
+
+        This is the stored data type (see ``_stored_data_type``), and the
+        .gzi index of BGZF files.
+        """
+        stored_data_type = self._stored_data_type(data_type)
+        if stored_data_type == data_type:
+            return [stored_data_type]
+        return [stored_data_type, stored_data_type + "_gzi"]
+
+    def _reuse_assembly_index(self, taxid, index_type, ready_extension):
+        """Link a missing index of the TaxID to its assembly's index.
+
+        Return True if the index was found in the store (see
+        ``_link_from_assembly_store``). Existing indexes are never replaced.
+        """
+        ready_path = self.datafile_path(taxid, index_type) + ready_extension
+        if os.path.exists(ready_path):
+            return False
+        return self._link_from_assembly_store(
+            taxid, [index_type], ready_extension
+        )
+
+    def clean_assembly_store(self):
+        """Remove the files of the assembly store used by no TaxID.
+
+        With ``deduplicate_assemblies``, the store keeps a hard link to
+        every deduplicated file. A stored file is only removed when no TaxID
+        file links to it anymore, e.g. after ``remove_all_taxid_files``.
+        Return the list of the assemblies removed from the store.
+        """
+        store_dir = self._metadata_path("assemblies")
+        if not os.path.isdir(store_dir):
+            return []
+        removed = []
+        for entry in os.scandir(store_dir):
+            if not entry.is_dir():
+                continue
+            data_files = 0
+            for file_entry in os.scandir(entry.path):
+                if file_entry.name.startswith("build_"):
+                    continue
+                if os.stat(file_entry.path).st_nlink == 1:
+                    os.remove(file_entry.path)
+                else:
+                    data_files += 1
+            if data_files == 0:
+                shutil.rmtree(entry.path)
+                removed.append(entry.name)
+        return removed
+
+    def deduplicate_local_files(self):
+        """Hard-link the identical data files of the collection together.
+
+        Files of the same data type with the same content (SHA-256 hash)
+        are replaced by hard links to a single file, whether or not the
+        TaxIDs have a known assembly. This deduplicates collections created
+        without ``deduplicate_assemblies``. BLAST databases are never
+        identical between TaxIDs (their sequences are annotated with the
+        TaxID), and multi-file data types are not considered. Return the
+        number of bytes saved.
+
+        Examples
+        ========
+
+        >>> saved = collection.deduplicate_local_files()
+        >>> print("Saved %.1f Gb" % (saved / 1e9))
+        """
+        entries_by_size = {}
+        for entry in self._get_catalog().files():
+            if entry["data_type"] in self.multifile_data_types:
+                continue
+            if entry["data_type"] not in self.deduplicated_data_types:
+                continue
+            key = (entry["data_type"], entry["size"])
+            entries_by_size.setdefault(key, []).append(entry)
+        saved = 0
+        for entries in entries_by_size.values():
+            if len(entries) < 2:
+                continue
+            paths_by_hash = {}
+            for entry in entries:
+                path = os.path.join(self.data_dir, entry["filename"])
+                paths_by_hash.setdefault(file_hash(path), []).append(entry)
+            for same_entries in paths_by_hash.values():
+                first_path = os.path.join(
+                    self.data_dir, same_entries[0]["filename"]
+                )
+                first_inode = os.stat(first_path).st_ino
+                for entry in same_entries[1:]:
+                    path = os.path.join(self.data_dir, entry["filename"])
+                    if os.stat(path).st_ino == first_inode:
+                        continue
+                    atomic_link_or_copy(first_path, path)
+                    if os.stat(path).st_ino == first_inode:
+                        saved += entry["size"]
+                    self._register_taxid_files(
+                        entry["taxid"], entry["data_type"]
+                    )
+        return saved
@@ -2,6 +2,41 @@
 
 import subprocess
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from ..tools import atomic_write
+
+# Extension of the file proving that a database is complete
+BLAST_DB_READY_EXTENSIONS = {"nucl": ".nsq", "prot": ".psq"}
+
+
+def _shard_fasta_file(fasta_path, target_dir, records_per_shard):
+    """Split a FASTA file into files of ``records_per_shard`` records.
+
+    Return the list of the shards paths. The file is read line by line, so
+    the records are never loaded in memory.
+    """
+    shards_paths = []
+    shard_file = None
+    n_records = 0
+    with open(fasta_path, "r") as f:
+        for line in f:
+            if line.startswith(">"):
+                if n_records % records_per_shard == 0:
+                    if shard_file is not None:
+                        shard_file.close()
+                    shard_path = os.path.join(
+                        target_dir, "shard_%d.fa" % len(shards_paths)
+                    )
+                    shards_paths.append(shard_path)
+                    shard_file = open(shard_path, "w")
+                n_records += 1
+            if shard_file is not None:
+                shard_file.write(line)
+    if shard_file is not None:
+        shard_file.close()
+    return shards_paths
 
 
 class BlastMixin:
@@ -12,12 +47,95 @@ class BlastMixin:
 
         ``db_type`` is either "nucl" (nucleotides database for blastn, blastx)
         or "prot" (protein database, untested).
+
+        All sequences of the database are given the TaxID (so BLAST outputs
+        can use the "staxid" column, e.g. with combined databases). For this
+        reason, TaxIDs with the same assembly never share their databases,
+        even with ``deduplicate_assemblies``.
+
+        The database is built under a lock, so other threads or processes
+        building the same database at the same time wait for this build. The
+        build waits for a CPU in the collection's build budget (see
+        ``build_indexes``), and is skipped if the existing database was built
+        from the same FASTA data with the same parameters.
         """
         taxid = str(taxid)
+        with self._taxid_file_lock(taxid, "blast_" + db_type):
+            self._generate_blast_db_for_taxid(taxid, db_type)
+
+    def _generate_blast_db_for_taxid(self, taxid, db_type):
         data_type = {"nucl": "genomic_fasta", "prot": "protein_fasta"}[db_type]
+        index_type = "blast_" + db_type
+        ready_extension = BLAST_DB_READY_EXTENSIONS[db_type]
+        if self._reuse_assembly_index(taxid, index_type, ready_extension):
+            return
         fa_path = self.get_taxid_genome_data_path(taxid, data_type=data_type)
-        db_path = self.datafile_path(taxid=taxid, data_type="blast_" + db_type)
-        blast_args = [
+        message = "Generating %s BLAST DB for taxid %s" % (db_type, taxid)
+        record, is_up_to_date = self._get_build_record(
+            taxid,
+            index_type,
+            data_type,
+            self._makeblastdb_args(taxid, db_type, "{input}", "{output}"),
+            ready_extension,
+        )
+        if is_up_to_date:
+            self._log_message(message + " - Already up to date.")
+            return
+        # makeblastdb is single-threaded
+        cpus, memory = self._get_build_resources(
+            taxid, index_type, data_type, cpus=1
+        )
+        with self._get_build_scheduler().reserve(cpus, memory):
+            self._log_message(message)
+            with self._atomic_multifile_build(
+                taxid, index_type, ready_extension
+            ) as db_path:
+                blast_args = self._makeblastdb_args(
+                    taxid, db_type, fa_path, db_path
+                )
+                if self._stored_data_type(data_type) != data_type:
+                    # BGZF data is decompressed on the fly, piped to
+                    # makeblastdb
+                    with self._open_data_file(taxid, data_type) as f:
+                        self.run_process(
+                            message,
+                            blast_args,
+                            stdout_path=os.devnull,
+                            stdin_file=f,
+                        )
+                else:
+                    self.run_process(
+                        message, blast_args, stdout_path=os.devnull
+                    )
+        self._write_build_record(taxid, index_type, record)
+        self._add_to_assembly_store(taxid, [index_type], ready_extension)
+        self._register_taxid_files(taxid, index_type)
+        self._log_message(message + " - Done!")
+
+    def _makeblastdb_args(self, taxid, db_type, fa_path, db_path):
+        """Return the makeblastdb command building the TaxID's database.
+
+        The FASTA is piped to makeblastdb for BGZF files (see
+        ``sequence_storage``). Option ``-max_file_sz`` is set by attribute
+        ``blast_max_file_size`` (e.g. "4GB"), to control the size of the
+        database volumes.
+        """
+        data_type = {"nucl": "genomic_fasta", "prot": "protein_fasta"}[db_type]
+        if self._stored_data_type(data_type) != data_type:
+            parameters = self._piped_makeblastdb_parameters(
+                taxid, data_type, db_type, db_path
+            )
+        else:
+            parameters = self._makeblastdb_parameters(
+                fa_path, db_type, db_path, taxid
+            )
+        if self.blast_max_file_size is not None:
+            parameters += ["-max_file_sz", str(self.blast_max_file_size)]
+        return parameters
+
+    @staticmethod
+    def _makeblastdb_parameters(fa_path, db_type, db_path, taxid):
+        return [
             "makeblastdb",
             "-in",
             fa_path,
@@ -25,26 +143,107 @@ class BlastMixin:
             db_type,
             "-out",
             db_path,
+            "-taxid",
+            taxid,
         ]
-        message = "Generating %s BLAST DB for taxid %s" % (db_type, taxid)
-        self._log_message(message)
-        self.run_process(message, blast_args)
-        self._log_message(message + " - Done!")
+
+    def _piped_makeblastdb_parameters(
+        self, taxid, data_type, db_type, db_path
+    ):
+        """Return makeblastdb parameters to read the FASTA from stdin."""
+        title = taxid + self.datafiles_extensions[data_type]
+        parameters = self._makeblastdb_parameters("-", db_type, db_path, taxid)
+        return parameters + ["-title", title]
 
     def get_taxid_blastdb_path(self, taxid, db_type):
         """Get the path to a local blast DB, download and create one if needed.
 
         ``db_type`` is either "nucl" (nucleotides database for blastn, blastx)
         or "prot" (protein database, untested).
+
+        With a ``scratch_dir``, this is the path of the database's copy in the
+        scratch directory.
         """
         taxid = str(taxid)
         db_path = self.datafile_path(taxid=taxid, data_type="blast_" + db_type)
-        expected_file_extension = {"nucl": ".nsq", "prot": ".psq"}
-        if not os.path.exists(db_path + expected_file_extension[db_type]):
-            self.generate_blast_db_for_taxid(taxid, db_type=db_type)
+        ready_extension = BLAST_DB_READY_EXTENSIONS[db_type]
+        self._single_flight(
+            taxid,
+            "blast_" + db_type,
+            db_path + ready_extension,
+            lambda: self.generate_blast_db_for_taxid(taxid, db_type=db_type),
+        )
+        return self._scratch_tier_path(
+            taxid, "blast_" + db_type, ready_extension
+        )
+
+    def combined_blast_db_path(self, name, db_type="nucl"):
+        """Return the path of a combined BLAST DB, which may not exist yet."""
+        return os.path.join(self.data_dir, "combined_%s_%s" % (name, db_type))
+
+    def generate_combined_blast_db(self, taxids, name, db_type="nucl"):
+        """Create a BLAST database covering several TaxIDs. Return its path.
+
+        The combined database is an alias over the per-TaxID databases (see
+        ``generate_blast_db_for_taxid``), so only the TaxID databases which
+        don't exist yet are built (and downloaded if needed). Re-creating a
+        combined database with one more TaxID only builds the new TaxID's
+        database.
+
+        All the sequences of a TaxID database are annotated with the TaxID, so
+        BLAST hits can be traced back to their TaxID by adding "staxid" to
+        the output columns, e.g. ``-outfmt "6 qseqid sseqid staxid"``.
+
+        Examples
+        ========
+
+        >>> db_path = collection.generate_combined_blast_db(
+        >>>     [511145, 559292, 224308], name="my_panel")
+        >>> collection.run_process("blast", [
+        >>>     "blastn", "-query", "queries.fa", "-db", db_path,
+        >>>     "-outfmt", "6 qseqid sseqid staxid", "-out", "results.tsv"
+        >>> ])
+        """
+        db_path = self.combined_blast_db_path(name, db_type)
+        db_dir = os.path.dirname(db_path)
+        taxids_db_paths = []
+        for taxid in taxids:
+            self.get_taxid_blastdb_path(taxid, db_type)
+            # Databases of the data_dir, not of the scratch_dir
+            data_type = "blast_" + db_type
+            taxids_db_paths.append(self.datafile_path(taxid, data_type))
+        # Relative paths, so the data_dir can be moved or mounted elsewhere
+        taxids_db_paths = [os.path.relpath(p, db_dir) for p in taxids_db_paths]
+        self._log_message(
+            "Generating combined %s BLAST DB %s" % (db_type, name)
+        )
+        alias_extension = {"nucl": ".nal", "prot": ".pal"}[db_type]
+        with atomic_write(db_path + alias_extension, mode="w") as f:
+            f.write("#\n# Alias file created by Genome Collector\n#\n")
+            f.write("TITLE %s\n" % name)
+            f.write(
+                "DBLIST %s\n" % " ".join('"%s"' % p for p in taxids_db_paths)
+            )
+        return db_path
+
+    def get_combined_blastdb_path(self, name, db_type="nucl"):
+        """Return the path of an existing combined BLAST database.
+
+        Raise a FileNotFoundError if the database has not been created with
+        ``generate_combined_blast_db``.
+        """
+        db_path = self.combined_blast_db_path(name, db_type)
+        alias_extension = {"nucl": ".nal", "prot": ".pal"}[db_type]
+        if not os.path.exists(db_path + alias_extension):
+            raise FileNotFoundError(
+                "No combined %s BLAST DB named %s. Create it with "
+                "generate_combined_blast_db()." % (db_type, name)
+            )
         return db_path
 
-    def blast_against_taxid(self, taxid, db_type, blast_args):
+    def blast_against_taxid(
+        self, taxid, db_type, blast_args, stdout_path=None, **kwargs
+    ):
         """Run a BLAST, using a genome_collector database.
         
         Parameters
@@ -63,6 +262,14 @@ class BlastMixin:
           List of NCBI-BLAST arguments, for instance ['blastn', '-query',
           'my_sequences.fa', '-out', 'myresults.xml'].
 
+        stdout_path
+          If None (and there is no '-out' in the blast_args), the BLAST output
+          is returned (as bytes). Otherwise the output is streamed to this
+          file, which avoids holding it in memory.
+
+        kwargs
+          Other parameters of ``run_process``, e.g. ``timeout``.
+
         Examples
         ========
 
@@ -73,4 +280,133 @@ class BlastMixin:
         db_path = self.get_taxid_blastdb_path(taxid=taxid, db_type=db_type)
         blast_args = list(blast_args) + ["-db", db_path]
         name = "BLASTing against TaxID %s %s: " % (taxid, db_type)
-        return self.run_process(name, blast_args)
+        return self.run_process(
+            name, blast_args, stdout_path=stdout_path, **kwargs
+        )
+
+    def blast_against_taxids(
+        self,
+        taxids,
+        query_fasta,
+        output_path,
+        db_type="nucl",
+        blast_program="blastn",
+        blast_args=(),
+        queries_per_shard=500,
+        threads_per_job=1,
+        cpu_budget=None,
+    ):
+        """BLAST a FASTA file against several TaxIDs, in parallel.
+
+        The query file is split into shards of ``queries_per_shard`` records,
+        and each (TaxID, shard) pair is BLASTed by a separate BLAST process,
+        with up to ``cpu_budget / threads_per_job`` processes running at the
+        same time. Each process reserves its threads in the collection's
+        build budget (see ``build_indexes``), so BLASTs and index builds
+        running at the same time share the same CPUs. Each process writes
+        its results in its own file, then all results are merged into
+        ``output_path``.
+
+        The output is in BLAST's tabular format (``-outfmt 6``, custom
+        columns can be given in ``blast_args``), with an extra first column
+        giving the TaxID of the database hit.
+
+        Parameters
+        ==========
+
+        taxids
+          List of TaxIDs (int or str) to BLAST against. Missing databases are
+          created first (which can involve downloads).
+
+        query_fasta
+          Path to a FASTA file of the query sequences.
+
+        output_path
+          Path of the tabular output file.
+
+        db_type
+          Either "nucl" or "prot", see ``blast_against_taxid``.
+
+        blast_program
+          BLAST executable, e.g. "blastn", "blastx", "tblastn"...
+
+        blast_args
+          List of extra arguments for the BLAST program, e.g.
+          ``["-evalue", "1e-5", "-outfmt", "6 qseqid sseqid pident"]``.
+
+        queries_per_shard
+          Number of query records in each shard.
+
+        threads_per_job
+          Value of ``-num_threads`` for each BLAST process, unless
+          ``-num_threads`` is given in ``blast_args``.
+
+        cpu_budget
+          Maximal number of CPUs used by the BLAST processes. Defaults to
+          the collection's build budget (``build_cpu_budget``, by default
+          all the machine's CPUs).
+
+        Examples
+        ========
+
+        >>> collection.blast_against_taxids(
+        >>>     [511145, 559292], "queries.fa", "results.tsv",
+        >>>     blast_args=["-evalue", "1e-10"], threads_per_job=2
+        >>> )
+        """
+        taxids = [str(taxid) for taxid in taxids]
+        blast_args = list(blast_args)
+        if "-outfmt" in blast_args:
+            outfmt = blast_args[blast_args.index("-outfmt") + 1]
+            if outfmt.split()[0] != "6":
+                raise ValueError("Only the tabular -outfmt 6 is supported.")
+        else:
+            blast_args += ["-outfmt", "6"]
+        if "-num_threads" in blast_args:
+            index = blast_args.index("-num_threads") + 1
+            threads_per_job = int(blast_args[index])
+        else:
+            blast_args += ["-num_threads", str(threads_per_job)]
+        scheduler = self._get_build_scheduler()
+        if cpu_budget is None:
+            cpu_budget = scheduler.cpus
+        max_workers = max(1, cpu_budget // threads_per_job)
+        db_paths = {
+            taxid: self.get_taxid_blastdb_path(taxid, db_type=db_type)
+            for taxid in taxids
+        }
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shards = _shard_fasta_file(
+                query_fasta, temp_dir, queries_per_shard
+            )
+            jobs = [
+                (taxid, shard, "%s_%s.tsv" % (shard, taxid))
+                for taxid in taxids
+                for shard in shards
+            ]
+
+            def run_job(job):
+                taxid, shard, job_output = job
+                name = "BLASTing %s against TaxID %s" % (shard, taxid)
+                args = [blast_program, "-query", shard, "-out", job_output]
+                args += ["-db", db_paths[taxid]] + blast_args
+                with scheduler.reserve(cpus=threads_per_job):
+                    self.run_process(name, args, stdout_path=os.devnull)
+
+            message = "Running %d BLAST jobs with %d workers" % (
+                len(jobs),
+                max_workers,
+            )
+            self._log_message(message)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # list() so that the first error, if any, is raised
+                list(executor.map(run_job, jobs))
+
+            with open(output_path, "w") as output_file:
+                for taxid, shard, job_output in jobs:
+                    with open(job_output, "r") as f:
+                        for line in f:
+                            output_file.write(taxid + "\t" + line)
+        self._log_message(message + " - Done!")
+        return output_path
@@ -3,39 +3,96 @@
 import subprocess
 import os
 
+# Extension of the file proving that an index is complete
+BOWTIE_INDEX_READY_EXTENSIONS = {"1": ".1.ebwt", "2": ".1.bt2"}
+
 
 class BowtieMixin:
     """All methods are directly accessible to GenomeCollection instances."""
 
     def generate_bowtie_index_for_taxid(self, taxid, version="1"):
-        """Generate a Bowtie (1 or 2) index for the given TaxID."""
+        """Generate a Bowtie (1 or 2) index for the given TaxID.
+
+        The index is built under a lock, so other threads or processes
+        building the same index at the same time wait for this build. The
+        build uses ``build_threads`` threads, within the collection's build
+        budget (see ``build_indexes``), and is skipped if the existing index
+        was built from the same FASTA data with the same parameters.
+        """
         taxid = str(taxid)
         version = str(version)
-        fa_path = self.get_taxid_genome_data_path(
-            taxid, data_type="genomic_fasta"
-        )
-        db_path = self.datafile_path(
-            taxid=taxid, data_type="bowtie%s_index" % version
-        )
-        executable = "bowtie%s-build" % ("" if version == "1" else "2")
-        bowtie_args = [executable, fa_path, db_path]
+        with self._taxid_file_lock(taxid, "bowtie%s_index" % version):
+            self._generate_bowtie_index_for_taxid(taxid, version)
 
+    def _generate_bowtie_index_for_taxid(self, taxid, version):
+        index_type = "bowtie%s_index" % version
+        ready_extension = BOWTIE_INDEX_READY_EXTENSIONS[version]
+        if self._reuse_assembly_index(taxid, index_type, ready_extension):
+            return
+        self.get_taxid_genome_data_path(taxid, data_type="genomic_fasta")
         message = "Generating Bowtie%s index for taxid %s" % (version, taxid)
-        self._log_message(message)
-        self.run_process(message, bowtie_args)
+        record, is_up_to_date = self._get_build_record(
+            taxid,
+            index_type,
+            "genomic_fasta",
+            self._bowtie_build_parameters(version, "{input}", "{output}"),
+            ready_extension,
+        )
+        if is_up_to_date:
+            self._log_message(message + " - Already up to date.")
+            return
+        cpus, memory = self._get_build_resources(
+            taxid, index_type, "genomic_fasta", cpus=self.build_threads
+        )
+        with self._get_build_scheduler().reserve(cpus, memory):
+            self._log_message(message)
+            # bowtie-build reads the FASTA several times, so BGZF files are
+            # decompressed to a temporary file.
+            with self._plain_data_file(taxid, "genomic_fasta") as fa_path:
+                with self._atomic_multifile_build(
+                    taxid, index_type, ready_extension
+                ) as db_path:
+                    bowtie_args = self._bowtie_build_parameters(
+                        version, fa_path, db_path, threads=self.build_threads
+                    )
+                    self.run_process(
+                        message, bowtie_args, stdout_path=os.devnull
+                    )
+        self._write_build_record(taxid, index_type, record)
+        self._add_to_assembly_store(taxid, [index_type], ready_extension)
+        self._register_taxid_files(taxid, index_type)
         self._log_message(message + " - Done")
 
+    @staticmethod
+    def _bowtie_build_parameters(version, fa_path, db_path, threads=1):
+        """Return the bowtie-build (or bowtie2-build) command.
+
+        Option ``--threads`` is only given for more than one thread, so
+        versions of bowtie-build without this option can still be used.
+        """
+        executable = "bowtie%s-build" % ("" if version == "1" else "2")
+        parameters = [executable]
+        if threads > 1:
+            parameters += ["--threads", str(threads)]
+        return parameters + [fa_path, db_path]
+
     def get_taxid_bowtie_index_path(self, taxid, version="1"):
         """Get a path to the Bowtie (1 or 2) index for the given TaxID.
         
         This will download data and generate the index if necessary.
         This requires Bowtie (1 or 2) installed.
+
+        With a ``scratch_dir``, this is the path of the index's copy in the
+        scratch directory.
         """
         taxid = str(taxid)
-        index_path = self.datafile_path(
-            taxid=taxid, data_type="bowtie%s_index" % version
+        index_type = "bowtie%s_index" % version
+        index_path = self.datafile_path(taxid=taxid, data_type=index_type)
+        ready_extension = BOWTIE_INDEX_READY_EXTENSIONS[version]
+        self._single_flight(
+            taxid,
+            index_type,
+            index_path + ready_extension,
+            lambda: self.generate_bowtie_index_for_taxid(taxid, version),
         )
-        expected_file_extension = {"1": ".1.ebwt", "2": ".1.bt2"}
-        if not os.path.exists(index_path + expected_file_extension[version]):
-            self.generate_bowtie_index_for_taxid(taxid, version=version)
-        return index_path
+        return self._scratch_tier_path(taxid, index_type, ready_extension)
@@ -0,0 +1,221 @@
+"""Mixin scheduling and caching index builds, inherited by GenomeCollection."""
+
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from ..BgzfFile import BgzfFile
+from ..BuildScheduler import BuildScheduler
+from ..tools import atomic_write, file_hash
+
+
+class BuildMixin:
+    """All methods are directly accessible to GenomeCollection instances."""
+
+    build_scheduler = None
+    build_cpu_budget = None
+    build_memory_budget = None
+    build_threads = 1
+    build_memory_factors = {
+        "blast_nucl": 1.0,
+        "blast_prot": 1.0,
+        "bowtie1_index": 4.0,
+        "bowtie2_index": 4.0,
+    }
+    blast_max_file_size = None
+
+    def _get_build_scheduler(self):
+        """Return the BuildScheduler limiting the concurrent index builds.
+
+        This is the ``build_scheduler`` attribute if it was set (so several
+        collections can share a scheduler). Otherwise a scheduler is created
+        with a budget of ``build_cpu_budget`` CPUs (default: all the CPUs of
+        the machine) and ``build_memory_budget`` bytes of memory (default:
+        no limit).
+        """
+        if self.build_scheduler is not None:
+            return self.build_scheduler
+        with self._build_lock:
+            if self._build_scheduler is None:
+                cpus = self.build_cpu_budget or os.cpu_count() or 1
+                self._build_scheduler = BuildScheduler(
+                    cpus=cpus, memory=self.build_memory_budget
+                )
+        return self._build_scheduler
+
+    def _get_input_data_size(self, taxid, data_type):
+        """Return the size of a data file's (uncompressed) data, in bytes."""
+        stored_data_type = self._stored_data_type(data_type)
+        path = self.datafile_path(taxid, stored_data_type)
+        if stored_data_type == data_type:
+            return os.path.getsize(path)
+        with BgzfFile(path) as f:
+            return f.uncompressed_size()
+
+    def _get_build_resources(self, taxid, index_type, input_data_type, cpus):
+        """Return the (cpus, memory) to reserve for an index build.
+
+        The memory is estimated as the size of the input data times the
+        factor of the index type in ``build_memory_factors``.
+        """
+        size = self._get_input_data_size(taxid, input_data_type)
+        factor = self.build_memory_factors.get(index_type, 1.0)
+        return cpus, int(factor * size)
+
+    def _build_record_path(self, taxid, index_type):
+        """Return the path of the record of the TaxID index's last build."""
+        filename = "%s_%s.json" % (taxid, index_type)
+        return self._metadata_path("builds", filename)
+
+    def _read_build_record(self, taxid, index_type):
+        path = self._build_record_path(taxid, index_type)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            try:
+                return json.load(f)
+            except ValueError:
+                return None
+
+    def _get_build_record(
+        self, taxid, index_type, input_data_type, parameters, ready_extension
+    ):
+        """Return (record, is_up_to_date) for a build of the index.
+
+        The record describes the build: a SHA-256 hash of the input data
+        file, and the build parameters (program and options, without paths
+        or thread counts, which don't change the index). It is saved in the
+        hidden metadata folder after each build. The index is up to date if
+        it is complete and was built with the same record. The input is
+        only hashed if its size or modification time changed since the
+        previous build.
+        """
+        stored_data_type = self._stored_data_type(input_data_type)
+        input_path = self.datafile_path(taxid, stored_data_type)
+        stat = os.stat(input_path)
+        record = dict(
+            input_data_type=stored_data_type,
+            input_size=stat.st_size,
+            input_mtime=stat.st_mtime,
+            input_sha256=None,
+            parameters=list(parameters),
+        )
+        ready_path = self.datafile_path(taxid, index_type) + ready_extension
+        previous = self._read_build_record(taxid, index_type)
+        if (previous is None) or not os.path.exists(ready_path):
+            record["input_sha256"] = file_hash(input_path)
+            return record, False
+        same_file = all(
+            previous.get(key) == record[key]
+            for key in ["input_data_type", "input_size", "input_mtime"]
+        )
+        if same_file and previous.get("parameters") == record["parameters"]:
+            return previous, True
+        record["input_sha256"] = file_hash(input_path)
+        is_up_to_date = all(
+            previous.get(key) == record[key]
+            for key in ["input_data_type", "input_sha256", "parameters"]
+        )
+        if is_up_to_date:
+            # Same content (e.g. downloaded again): save the new file stats
+            # so the input is not hashed again next time.
+            self._write_build_record(taxid, index_type, record)
+        return record, is_up_to_date
+
+    def _write_build_record(self, taxid, index_type, record):
+        path = self._build_record_path(taxid, index_type)
+        with atomic_write(path, "w") as f:
+            json.dump(record, f)
+
+    def build_indexes(
+        self,
+        taxids,
+        index_types=("blast_nucl",),
+        rebuild_outdated=False,
+        max_workers=None,
+    ):
+        """Build the BLAST databases and Bowtie indexes of many TaxIDs.
+
+        The builds run concurrently, within the budget of CPUs and memory of
+        the collection's build scheduler (see attributes
+        ``build_cpu_budget`` and ``build_memory_budget``). Each build uses
+        ``build_threads`` threads when the program supports it (bowtie-build
+        ``--threads``), and reserves memory according to the size of its
+        input (see ``build_memory_factors``). Missing data files are
+        downloaded first, outside of the budget.
+
+        Parameters
+        ==========
+
+        taxids
+          List of TaxIDs (int or str).
+
+        index_types
+          Index data types to build for each TaxID, among "blast_nucl",
+          "blast_prot", "bowtie1_index" and "bowtie2_index".
+
+        rebuild_outdated
+          If False, existing indexes are kept. If True, existing indexes are
+          rebuilt unless their input data (content hash) and build
+          parameters are the same as when they were built.
+
+        max_workers
+          Maximal number of TaxIDs processed at the same time (downloading
+          data or waiting for the scheduler). Defaults to the number of CPUs
+          of the build budget.
+
+        Returns
+        =======
+
+        report
+          A list of dicts with keys taxid, data_type, path (None if the
+          build failed) and error (None, or the exception raised).
+
+        Examples
+        ========
+
+        >>> collection.build_cpu_budget = 64
+        >>> collection.build_threads = 8
+        >>> collection.build_indexes(taxids, ["blast_nucl", "bowtie2_index"])
+        """
+        taxids = [str(taxid) for taxid in taxids]
+        blast, bowtie = "get_taxid_blastdb_path", "get_taxid_bowtie_index_path"
+        builders = {
+            "blast_nucl": (blast, "generate_blast_db_for_taxid", "nucl"),
+            "blast_prot": (blast, "generate_blast_db_for_taxid", "prot"),
+            "bowtie1_index": (bowtie, "generate_bowtie_index_for_taxid", "1"),
+            "bowtie2_index": (bowtie, "generate_bowtie_index_for_taxid", "2"),
+        }
+        for index_type in index_types:
+            if index_type not in builders:
+                raise ValueError(
+                    "Unknown index type %s. Choose among %s."
+                    % (index_type, ", ".join(builders))
+                )
+        if max_workers is None:
+            max_workers = self._get_build_scheduler().cpus
+
+        def build(taxid, index_type):
+            get_path, generate, variant = builders[index_type]
+            if rebuild_outdated:
+                getattr(self, generate)(taxid, variant)
+            return getattr(self, get_path)(taxid, variant)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                (taxid, index_type): executor.submit(build, taxid, index_type)
+                for taxid in taxids
+                for index_type in index_types
+            }
+        report = []
+        for (taxid, index_type), future in futures.items():
+            error = future.exception()
+            report.append(
+                dict(
+                    taxid=taxid,
+                    data_type=index_type,
+                    path=None if error else future.result(),
+                    error=error,
+                )
+            )
+        return report
@@ -0,0 +1,134 @@
+"""Mixin for queries on genome features, inherited by GenomeCollection."""
+
+import io
+
+from ..FeatureIndex import (
+    FEATURE_COLUMNS,
+    FeatureIndex,
+    iter_genbank_features,
+    iter_gff_features,
+)
+
+FEATURES_PARSERS = {
+    "genomic_genbank": iter_genbank_features,
+    "genomic_gff": iter_gff_features,
+}
+
+
+class FeatureMixin:
+    """All methods are directly accessible to GenomeCollection instances."""
+
+    def get_taxid_feature_index(self, taxid, source_type="genomic_genbank"):
+        """Return a FeatureIndex of the features of the TaxID's genome.
+
+        The index is built with a single streaming pass over the TaxID's
+        GenBank ("genomic_genbank") or GFF ("genomic_gff") file, without
+        creating Biopython records, and stored in a SQLite file next to it
+        (``[taxid]_genomic.gb.features.sqlite``). It is created if needed,
+        and re-created if the content of the source file changed (its hash
+        is kept in a build record, as for BLAST databases). The source file
+        is downloaded if needed. See ``get_taxid_features``.
+        """
+        taxid = str(taxid)
+        if source_type not in FEATURES_PARSERS:
+            raise ValueError(
+                "source_type should be genomic_genbank or genomic_gff, not %s"
+                % source_type
+            )
+        index_type = source_type + "_feature_index"
+        self.get_taxid_genome_data_path(taxid, source_type)
+        index_path = self.datafile_path(taxid, index_type)
+        # The source and index files of the data_dir (not of the scratch
+        # tier) are compared.
+        parameters = ["FeatureIndex", FEATURE_COLUMNS]
+
+        def get_build_record():
+            return self._get_build_record(
+                taxid, index_type, source_type, parameters, ""
+            )
+
+        def is_ready():
+            return get_build_record()[1]
+
+        def build():
+            self._log_message(
+                "Indexing the %s features of taxid %s" % (source_type, taxid)
+            )
+            record, _ = get_build_record()
+            parse = FEATURES_PARSERS[source_type]
+            binary_file = self._open_data_file(taxid, source_type)
+            with io.TextIOWrapper(binary_file) as f:
+                FeatureIndex.build(parse(f), index_path)
+            self._write_build_record(taxid, index_type, record)
+            self._register_taxid_files(taxid, index_type)
+
+        self._single_flight(
+            taxid, index_type, index_path, build, is_ready=is_ready
+        )
+        return FeatureIndex(self._scratch_tier_path(taxid, index_type))
+
+    def get_taxid_features(
+        self,
+        taxid,
+        record_id=None,
+        start=None,
+        end=None,
+        feature_type=None,
+        gene=None,
+        locus_tag=None,
+        source_type="genomic_genbank",
+    ):
+        """Return the features of the TaxID's genome matching all filters.
+
+        The features are read from the index returned by
+        ``get_taxid_feature_index``, so big genomes are never parsed
+        entirely.
+
+        Parameters
+        ==========
+
+        taxid
+          TaxID (int or str) of the genome.
+
+        record_id
+          Keep only the features of this record (e.g. "NC_000913.3").
+
+        start, end
+          Keep only the features overlapping this region of the record.
+          These are 0-based, with ``end`` excluded, like in Python slices.
+
+        feature_type
+          Keep only the features of this type, e.g. "CDS" or "gene".
+
+        gene, locus_tag
+          Keep only the features with this gene name or locus tag.
+
+        source_type
+          Either "genomic_genbank" (default) or "genomic_gff".
+
+        Returns
+        =======
+
+        features
+          A list of ``Feature`` namedtuples (record_id, start, end, strand,
+          type, gene, locus_tag, product), sorted by record and position.
+
+        Examples
+        ========
+
+        >>> collection.get_taxid_features(
+        >>>     511145, "NC_000913.3", 0, 5000, feature_type="CDS")
+        >>> [Feature(record_id='NC_000913.3', start=189, end=255, strand=1,
+        >>>          type='CDS', gene='thrL', locus_tag='b0001',
+        >>>          product='thr operon leader peptide'), ...]
+        >>> collection.get_taxid_features(511145, locus_tag="b0002")
+        """
+        index = self.get_taxid_feature_index(taxid, source_type=source_type)
+        return index.query(
+            record_id=record_id,
+            start=start,
+            end=end,
+            feature_type=feature_type,
+            gene=gene,
+            locus_tag=locus_tag,
+        )
@@ -1,18 +1,37 @@
 """Mixin with everything related to file creation/deletion/listing..."""
 
+import io
 import os
 import re
+import glob
+import json
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
 import appdirs
 
+from ..Catalog import Catalog
+from ..BgzfFile import BgzfFile
+from ..FileLock import FileLock
+from ..tools import file_checksum, atomic_link_or_copy, CHUNK_SIZE
+
 LOCAL_DIR = appdirs.user_data_dir(appname="genome_collector", appauthor="EGF")
 
+
 class FileManagerMixin:
     """All methods are directly accessible to GenomeCollection instances."""
 
     datafiles_extensions = {
         "genomic_fasta": "_genomic.fa",
+        "genomic_fasta_index": "_genomic.fa.fai",
+        "genomic_2bit": "_genomic.2bit",
         "genomic_genbank": "_genomic.gb",
+        "genomic_genbank_feature_index": "_genomic.gb.features.sqlite",
         "genomic_gff": "_gff.gb",
+        "genomic_gff_feature_index": "_gff.gb.features.sqlite",
         "protein_fasta": "_protein.fa",
         "blast_nucl": "_nucl",
         "blast_prot": "_prot",
@@ -23,9 +42,31 @@ class FileManagerMixin:
         "infos": ".json",
         "bowtie1_index": "_bowtie1",
         "bowtie2_index": "_bowtie2",
+        "genomic_fasta_bgzf": "_genomic.fa.gz",
+        "genomic_fasta_bgzf_gzi": "_genomic.fa.gz.gzi",
+        "genomic_fasta_bgzf_index": "_genomic.fa.gz.fai",
+        "genomic_genbank_bgzf": "_genomic.gb.gz",
+        "genomic_genbank_bgzf_gzi": "_genomic.gb.gz.gzi",
+        "genomic_gff_bgzf": "_gff.gb.gz",
+        "genomic_gff_bgzf_gzi": "_gff.gb.gz.gzi",
+        "protein_fasta_bgzf": "_protein.fa.gz",
+        "protein_fasta_bgzf_gzi": "_protein.fa.gz.gzi",
+    }
+    multifile_data_types = {
+        "blast_nucl",
+        "blast_prot",
+        "bowtie1_index",
+        "bowtie2_index",
     }
     autodownload = True
     default_dir = os.environ.get("GENOME_COLLECTOR_DATA_DIR", LOCAL_DIR)
+    data_layout = "flat"
+    lock_timeout = None
+    stale_lock_timeout = 600
+    compute_checksums = True
+    verify_on_read = False
+    sequence_storage = "plain"
+    bgzf_compresslevel = 6
 
     def datafile_path(self, taxid, data_type):
         """Return a standardized datafile path for the given TaxID.
@@ -36,27 +77,399 @@ class FileManagerMixin:
 
         Parameter ``data_type`` should be one of genomic_fasta, protein_fasta,
         blast_nucl, blast_prot, genomic_gz, protein_gz, infos.
+
+        The file is in the TaxID's folder (see ``taxid_dir``) which depends on
+        the ``data_layout``.
         """
         taxid = str(taxid)
         filename = taxid + self.datafiles_extensions[data_type]
-        return os.path.join(self.data_dir, filename)
+        return os.path.join(self.taxid_dir(taxid), filename)
+
+    def _stored_data_type(self, data_type):
+        """Return the data type of the file storing data of this type.
+
+        With ``sequence_storage = "bgzf"``, the sequence files (genomic
+        FASTA, GenBank, GFF and protein FASTA) are stored compressed in BGZF
+        blocks, e.g. "genomic_fasta" data is in a "genomic_fasta_bgzf" file,
+        with a .gzi index ("genomic_fasta_bgzf_gzi") for random access.
+        """
+        if self.sequence_storage not in ("plain", "bgzf"):
+            raise ValueError(
+                "sequence_storage should be 'plain' or 'bgzf', not %s"
+                % self.sequence_storage
+            )
+        bgzf_data_type = data_type + "_bgzf"
+        if (self.sequence_storage == "bgzf") and (
+            bgzf_data_type in self.datafiles_extensions
+        ):
+            return bgzf_data_type
+        return data_type
+
+    def _open_data_file(self, taxid, data_type, random_access=False):
+        """Return a binary file handle of a data file's (uncompressed) data.
+
+        ``data_type`` is the type of the data (e.g. "genomic_fasta"), which
+        may be stored in a plain or BGZF file (see ``_stored_data_type``).
+        BGZF files are decompressed with the collection's gunzip backend or,
+        if ``random_access`` is True, opened as a seekable ``BgzfFile``. The
+        file is not downloaded if missing.
+        """
+        stored_data_type = self._stored_data_type(data_type)
+        path = self.datafile_path(taxid, stored_data_type)
+        if stored_data_type == data_type:
+            return open(path, "rb")
+        if random_access:
+            return io.BufferedReader(BgzfFile(path), buffer_size=CHUNK_SIZE)
+        return self._get_gunzip_backend().open(path)
+
+    @contextmanager
+    def _plain_data_file(self, taxid, data_type):
+        """Yield the path of an uncompressed file with the data of this type.
+
+        This is the data file itself when it is stored uncompressed. For BGZF
+        files, a temporary (hidden) uncompressed copy is made next to the
+        file, and removed at the end, for programs which need to read a file
+        several times.
+        """
+        stored_data_type = self._stored_data_type(data_type)
+        path = self.datafile_path(taxid, stored_data_type)
+        if stored_data_type == data_type:
+            yield path
+            return
+        directory, basename = os.path.split(path)
+        temp_dir = tempfile.mkdtemp(dir=directory, prefix="." + basename)
+        try:
+            plain_basename = str(taxid) + self.datafiles_extensions[data_type]
+            plain_path = os.path.join(temp_dir, plain_basename)
+            self._get_gunzip_backend().gunzip_file(path, plain_path)
+            yield plain_path
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _sharded_taxid_dir(self, taxid):
+        bucket = hashlib.md5(taxid.encode()).hexdigest()[:2]
+        return os.path.join(self.data_dir, bucket, taxid)
+
+    def taxid_dir(self, taxid):
+        """Return the folder holding the data files of the TaxID.
+
+        With ``data_layout = "flat"`` (default), all files are directly in
+        the ``data_dir``. With ``data_layout = "sharded"``, which is advised
+        for collections of thousands of TaxIDs, each TaxID has its own
+        subfolder, in one of 256 buckets: ``data_dir/3f/511145/``.
+
+        To allow for transitions between layouts (see
+        ``migrate_data_layout``), TaxIDs which already have data in the other
+        layout keep using that layout. This is checked once per TaxID and
+        collection instance (and again after ``migrate_data_layout``), not
+        at each call, so instances created before another instance migrated
+        the data_dir should be re-created.
+        """
+        taxid = str(taxid)
+        key = (self.data_dir, self.data_layout, taxid)
+        taxid_dir = self._taxid_dirs.get(key, None)
+        if taxid_dir is None:
+            taxid_dir = self._find_taxid_dir(taxid)
+            self._taxid_dirs[key] = taxid_dir
+        return taxid_dir
+
+    def _find_taxid_dir(self, taxid):
+        sharded_dir = self._sharded_taxid_dir(taxid)
+        if os.path.isdir(sharded_dir):
+            return sharded_dir
+        if self.data_layout == "sharded":
+            flat_infos_path = os.path.join(
+                self.data_dir, taxid + self.datafiles_extensions["infos"]
+            )
+            if not os.path.exists(flat_infos_path):
+                return sharded_dir
+        return self.data_dir
+
+    def _metadata_path(self, *path_parts):
+        """Return a path in the data directory's hidden metadata folder.
+
+        This folder holds the internal files of Genome Collector (rate
+        limiter state, caches...) and is ignored by the listing methods.
+        """
+        return os.path.join(self.data_dir, ".genome_collector", *path_parts)
+
+    def _taxid_file_lock(self, taxid, data_type):
+        """Return a FileLock protecting the creation of a TaxID's data file.
+
+        The lock files are in the hidden metadata folder, and are shared by
+        all threads and processes using the same data directory.
+        """
+        filename = "%s_%s.lock" % (taxid, data_type)
+        return FileLock(
+            self._metadata_path("locks", filename),
+            timeout=self.lock_timeout,
+            stale_timeout=self.stale_lock_timeout,
+        )
+
+    def _single_flight(
+        self, taxid, data_type, ready_path, create, is_ready=None
+    ):
+        """Call ``create()`` to create a data file, unless it already exists.
+
+        When several threads or processes need the same missing file at the
+        same time, only one calls ``create()`` while the others wait for the
+        lock, then find the file ready and reuse it. The file is also
+        re-created if its previous creation was interrupted (stale lock).
+        ``ready_path`` is the file whose existence proves that the data is
+        ready, e.g. the ".nsq" file of a BLAST database. ``is_ready`` is an
+        optional function replacing the check of the ready file (see
+        ``_is_ready``).
+
+        The access is recorded for the eviction policy, and least used files
+        are evicted after a creation if the collection exceeds its
+        ``max_data_size`` (see ``evict_data_files``).
+        """
+        if is_ready is None:
+
+            def is_ready():
+                return self._is_ready(taxid, data_type, ready_path)
+
+        self._record_access(taxid, data_type)
+        lock = self._taxid_file_lock(taxid, data_type)
+        is_locked = lock.is_locked()
+        if not is_locked and is_ready():
+            return
+        created = False
+        with lock:
+            if lock.broke_stale_lock or not is_ready():
+                create()
+                created = True
+        if created:
+            self._enforce_max_data_size(taxid, data_type)
+
+    def _is_ready(self, taxid, data_type, ready_path):
+        """Return whether a data file exists (and is valid, if verified).
+
+        When attribute ``verify_on_read`` is True, the files are also checked
+        against the catalog (see ``verify_taxid_files``), and corrupted files
+        are considered absent (so they are created again).
+        """
+        if not os.path.exists(ready_path):
+            return False
+        if self.verify_on_read:
+            problems = self.verify_taxid_files(taxid, data_type)
+            for filename, problem in problems.items():
+                message = "Corrupted file %s: %s" % (filename, problem)
+                self._log_message(message)
+            return len(problems) == 0
+        return True
+
+    @contextmanager
+    def _atomic_multifile_build(self, taxid, data_type, ready_extension):
+        """Yield a temporary path prefix where to build a multi-file artifact.
+
+        On success, the files created with this prefix are moved to the final
+        path prefix of the TaxID's data type (replacing the previous files),
+        the file with extension ``ready_extension`` being moved last, so the
+        artifact is never seen as ready before all of its files are in place.
+        Nothing is moved if an exception occurs. With a ``scratch_dir``, the
+        artifact is built in the scratch tier (see ``_scratch_build``).
+        """
+        final_prefix = self.datafile_path(taxid, data_type)
+        directory, basename = os.path.split(final_prefix)
+        os.makedirs(directory, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(dir=directory, prefix="." + basename)
+        try:
+            with self._scratch_build(
+                taxid, data_type, ready_extension, temp_dir
+            ) as build_prefix:
+                yield build_prefix
+            new_names = sorted(
+                os.listdir(temp_dir),
+                key=lambda name: name == basename + ready_extension,
+            )
+            for path in glob.glob(glob.escape(final_prefix) + ".*"):
+                if os.path.basename(path) not in new_names:
+                    os.remove(path)
+            for name in new_names:
+                os.replace(
+                    os.path.join(temp_dir, name), os.path.join(directory, name)
+                )
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _get_catalog(self):
+        """Return the catalog of the collection's data files.
+
+        The catalog is created with ``rebuild_catalog`` if it doesn't exist
+        (for instance for data directories created with older versions).
+        """
+        path = self._metadata_path("catalog.sqlite")
+        with self._catalog_lock:
+            if (self._catalog is None) or (self._catalog.path != path):
+                is_new = not os.path.exists(path)
+                self._catalog = Catalog(path)
+                if is_new:
+                    self._rebuild_catalog(self._catalog)
+        return self._catalog
+
+    def _identify_datafile(self, filename):
+        """Return the (taxid, data_type) of a data file name, or None."""
+        match = re.match(r"(\d+)(.*)$", filename)
+        if match is None:
+            return None
+        taxid, suffix = match.groups()
+        best_data_type, best_extension = None, ""
+        for data_type, extension in self.datafiles_extensions.items():
+            matches = suffix == extension
+            if data_type in self.multifile_data_types:
+                matches = suffix.startswith(extension + ".")
+            if matches and len(extension) > len(best_extension):
+                best_data_type, best_extension = data_type, extension
+        if best_data_type is None:
+            return None
+        return taxid, best_data_type
+
+    def _catalog_entry(
+        self, filename, taxid, data_type, checksum=None, source_md5=None
+    ):
+        path = os.path.join(self.data_dir, filename)
+        stat = os.stat(path)
+        return dict(
+            filename=filename,
+            taxid=taxid,
+            data_type=data_type,
+            size=stat.st_size,
+            checksum=checksum,
+            build_time=stat.st_mtime,
+            source_md5=source_md5,
+        )
+
+    def _taxid_metadata(self, taxid):
+        """Return the catalog's metadata on the TaxID, from its infos file.
+
+        The genome size is obtained from the genomic FASTA index, if any.
+        """
+        with open(self.datafile_path(taxid, "infos"), "r") as f:
+            infos = json.load(f)
+        genome_size = None
+        for data_type in ["genomic_fasta_index", "genomic_fasta_bgzf_index"]:
+            index_path = self.datafile_path(taxid, data_type)
+            if os.path.exists(index_path):
+                with open(index_path, "r") as f:
+                    genome_size = sum(int(line.split("\t")[1]) for line in f)
+        return dict(
+            taxid=str(taxid),
+            name=infos.get("ScientificName", None),
+            kingdom=infos.get("Organism_Kingdom", None),
+            assembly_id=infos.get("AssemblyID", None),
+            genome_size=genome_size,
+        )
+
+    def _scan_data_files(self):
+        """Yield the (filename, taxid, data_type) of all data files.
+
+        Filenames are relative to the data_dir. Both flat and sharded data
+        files are found, with a single scan of each folder.
+        """
+        if not os.path.exists(self.data_dir):
+            return
+        for entry in os.scandir(self.data_dir):
+            if entry.is_file():
+                identified = self._identify_datafile(entry.name)
+                if identified is not None:
+                    yield (entry.name,) + identified
+            elif entry.is_dir() and re.match(r"[0-9a-f]{2}$", entry.name):
+                for taxid_dir in os.scandir(entry.path):
+                    if not taxid_dir.is_dir():
+                        continue
+                    for file_entry in os.scandir(taxid_dir.path):
+                        identified = self._identify_datafile(file_entry.name)
+                        if identified is not None:
+                            filename = os.path.relpath(
+                                file_entry.path, self.data_dir
+                            )
+                            yield (filename,) + identified
+
+    def _rebuild_catalog(self, catalog):
+        # Checksums of the files which didn't change are kept
+        previous_entries = {
+            entry["filename"]: entry for entry in catalog.files()
+        }
+        entries = []
+        for filename, taxid, data_type in self._scan_data_files():
+            entry = self._catalog_entry(filename, taxid, data_type)
+            previous = previous_entries.get(filename, None)
+            if (previous is not None) and all(
+                previous[field] == entry[field]
+                for field in ("taxid", "data_type", "size", "build_time")
+            ):
+                entry["checksum"] = previous["checksum"]
+                entry["source_md5"] = previous["source_md5"]
+            entries.append(entry)
+        metadata_entries = [
+            self._taxid_metadata(entry["taxid"])
+            for entry in entries
+            if entry["data_type"] == "infos"
+        ]
+        catalog.replace_all(entries, metadata_entries)
+
+    def rebuild_catalog(self):
+        """Re-create the catalog of data files from a scan of the data_dir.
+
+        The catalog is kept up to date by Genome Collector, but this method
+        should be called if data files are added or removed by other means.
+        """
+        self._rebuild_catalog(self._get_catalog())
+
+    def _register_taxid_files(self, taxid, data_type, source_md5=None):
+        """Add (or update) the files of this TaxID and type in the catalog.
+
+        Files of this TaxID and type which no longer exist are removed from
+        the catalog. The checksums of the files are computed if attribute
+        ``compute_checksums`` is True. ``source_md5`` is the MD5 announced by
+        the source of the files (for downloads).
+        """
+        taxid = str(taxid)
+        catalog = self._get_catalog()
+        path = self.datafile_path(taxid, data_type)
+        if data_type in self.multifile_data_types:
+            paths = glob.glob(glob.escape(path) + ".*")
+        else:
+            paths = [path] if os.path.exists(path) else []
+        filenames = [os.path.relpath(p, self.data_dir) for p in paths]
+        catalog.remove_files(
+            [
+                entry["filename"]
+                for entry in catalog.files(taxid=taxid, data_type=data_type)
+                if entry["filename"] not in filenames
+            ]
+        )
+        catalog.add_files(
+            [
+                self._catalog_entry(
+                    filename,
+                    taxid,
+                    data_type,
+                    checksum=(
+                        file_checksum(p) if self.compute_checksums else None
+                    ),
+                    source_md5=source_md5,
+                )
+                for filename, p in zip(filenames, paths)
+            ]
+        )
+        if data_type == "infos":
+            if len(filenames):
+                catalog.set_taxids_metadata([self._taxid_metadata(taxid)])
+            else:
+                catalog.remove_taxids_metadata([taxid])
 
     def list_locally_available_taxids(self, data_type="infos"):
         """Return all taxIDs for which there is a local data file of this type.
 
         Parameter ``data_type`` should be one of genomic_fasta, protein_fasta,
         blast_nucl, blast_prot, genomic_gz, protein_gz, infos.
+
+        The TaxIDs are obtained from the collection's catalog, without
+        scanning the data directory (see ``rebuild_catalog``).
         """
-        extension = self.datafiles_extensions[data_type]
-        local_files = os.listdir(self.data_dir)
-        regexpr = r"(\d+)%s(.|$)" % extension
-        available_taxids = []
-        for filename in local_files:
-            match = re.match(regexpr, filename)
-            if match is None:
-                continue
-            available_taxids.append(match.groups()[0])
-        return sorted(list(set(available_taxids)))
+        return self._get_catalog().taxids(data_type=data_type)
 
     def list_locally_available_taxids_names(self, print_mode=False):
         """Return a dictionnary {taxid: scientific_name} of all local taxIDs.
@@ -65,8 +478,8 @@ class FileManagerMixin:
         in alphabetical order instead of being returned as a dict.
         """
         result = {
-            taxid: self.get_taxid_infos(taxid)["ScientificName"]
-            for taxid in self.list_locally_available_taxids(data_type="infos")
+            entry["taxid"]: entry["name"]
+            for entry in self.query_local_taxids()
         }
         if print_mode:
             items = sorted(result.items(), key=lambda item: item[1])
@@ -74,6 +487,106 @@ class FileManagerMixin:
         else:
             return result
 
+    def query_local_taxids(
+        self,
+        kingdom=None,
+        name_contains=None,
+        min_genome_size=None,
+        max_genome_size=None,
+    ):
+        """Return metadata on the local TaxIDs matching all given filters.
+
+        The metadata is read from the collection's catalog, without opening
+        the infos files of the TaxIDs.
+
+        Parameters
+        ==========
+
+        kingdom
+          Keep only TaxIDs with this "Organism_Kingdom", e.g. "Bacteria".
+
+        name_contains
+          Keep only TaxIDs whose scientific name contains this string (case
+          insensitive).
+
+        min_genome_size, max_genome_size
+          Keep only TaxIDs whose genome size (in bases) is in this range.
+          The genome size is only known for TaxIDs whose genomic FASTA has
+          been indexed (see ``get_taxid_fasta_index``).
+
+        Examples
+        ========
+
+        >>> collection.query_local_taxids(kingdom="Bacteria")
+        >>> [
+        >>>     {'taxid': '511145', 'name': 'Escherichia coli ...',
+        >>>      'kingdom': 'Bacteria', 'assembly_id': '79781',
+        >>>      'genome_size': 4641652,
+        >>>      'files': {'infos': 1577836800.0, 'genomic_fasta': ...}},
+        >>>     ...
+        >>> ]
+        """
+        return self._get_catalog().query_taxids_metadata(
+            kingdom=kingdom,
+            name_contains=name_contains,
+            min_genome_size=min_genome_size,
+            max_genome_size=max_genome_size,
+        )
+
+    def _check_catalog_entry(self, entry):
+        """Return the problem (str) of a catalogued file, or None if valid."""
+        path = os.path.join(self.data_dir, entry["filename"])
+        if not os.path.exists(path):
+            return "file is missing"
+        size = os.path.getsize(path)
+        if size != entry["size"]:
+            return "size is %d bytes instead of %d" % (size, entry["size"])
+        if entry["checksum"] is not None:
+            checksum = file_checksum(path)
+            if checksum != entry["checksum"]:
+                return "checksum is %s instead of %s" % (
+                    checksum,
+                    entry["checksum"],
+                )
+        return None
+
+    def _check_catalog_entries(self, entries, max_workers=1):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            problems = executor.map(self._check_catalog_entry, entries)
+            return {
+                entry["filename"]: problem
+                for entry, problem in zip(entries, problems)
+                if problem is not None
+            }
+
+    def verify_taxid_files(self, taxid, data_type=None):
+        """Check the TaxID's files against the sizes/checksums of the catalog.
+
+        Return a dict ``{filename: problem}`` of the missing or corrupted
+        files of the TaxID (and data type, if provided). All the files of
+        multi-file data types (e.g. BLAST databases) are checked.
+        """
+        entries = self._get_catalog().files(taxid=taxid, data_type=data_type)
+        return self._check_catalog_entries(entries)
+
+    def verify_collection(self, max_workers=4):
+        """Check all files of the collection against the catalog.
+
+        The files are checked in parallel, by ``max_workers`` threads. Return
+        a dict ``{filename: problem}`` of the missing or corrupted files. The
+        files with problems can be deleted with ``remove_all_taxid_files``,
+        or will be created again on their next use if attribute
+        ``verify_on_read`` is True.
+
+        Examples
+        ========
+
+        >>> collection.verify_collection()
+        >>> {'511145_genomic.fa': 'size is 12000 bytes instead of 4641652'}
+        """
+        entries = self._get_catalog().files()
+        return self._check_catalog_entries(entries, max_workers=max_workers)
+
     def remove_all_taxid_files(self, taxid):
         """Remove all local data files for this TaxID. Return a names list.
         
@@ -87,21 +600,107 @@ class FileManagerMixin:
         >>>     gd.remove_all_taxid_files(taxid)
 
         """
-        regexpr = r"(\d+)"
-        removed_files = []
-        local_files = os.listdir(self.data_dir)
-        for filename in local_files:
-            local_files = os.listdir(self.data_dir)
-            match = re.match(regexpr, filename)
-            if match is None:
-                continue
-            file_taxid = match.groups()[0]
-            if file_taxid == taxid:
-                removed_files.append(filename)
-                os.remove(os.path.join(self.data_dir, filename))
+        catalog = self._get_catalog()
+        catalogued_files = [
+            entry["filename"] for entry in catalog.files(taxid=str(taxid))
+        ]
+        removed_files = catalogued_files + self._uncatalogued_taxid_files(
+            taxid, catalogued_files
+        )
+        for filename in removed_files:
+            path = os.path.join(self.data_dir, filename)
+            if os.path.exists(path):
+                os.remove(path)
+        catalog.remove_files(catalogued_files)
+        catalog.remove_taxids_metadata([taxid])
+        sharded_dir = self._sharded_taxid_dir(str(taxid))
+        for directory in [sharded_dir, os.path.dirname(sharded_dir)]:
+            if os.path.isdir(directory) and not os.listdir(directory):
+                os.rmdir(directory)
+        key = (self.data_dir, self.data_layout, str(taxid))
+        self._taxid_dirs.pop(key, None)
+        if self.deduplicate_assemblies:
+            self.clean_assembly_store()
         return removed_files
 
+    def _uncatalogued_taxid_files(self, taxid, catalogued_files):
+        """Return the TaxID's data files which are missing from the catalog.
+
+        These are files added by other means than Genome Collector. They are
+        found by checking the paths of all data types in both layouts, so
+        the data_dir is not listed.
+        """
+        taxid = str(taxid)
+        paths = []
+        for directory in [self.data_dir, self._sharded_taxid_dir(taxid)]:
+            for data_type, extension in self.datafiles_extensions.items():
+                path = os.path.join(directory, taxid + extension)
+                if data_type in self.multifile_data_types:
+                    paths += glob.glob(glob.escape(path) + ".*")
+                elif os.path.exists(path):
+                    paths.append(path)
+        filenames = set(os.path.relpath(p, self.data_dir) for p in paths)
+        return sorted(filenames.difference(catalogued_files))
+
     def remove_all_local_data_files(self):
         """Remove all the locally stored data files"""
-        for taxid in self.list_locally_available_taxids():
-            self.remove_all_taxid_files(taxid)
\ No newline at end of file
+        taxids = set(self._get_catalog().taxids())
+        taxids.update(taxid for _, taxid, _ in self._scan_data_files())
+        for taxid in sorted(taxids):
+            self.remove_all_taxid_files(taxid)
+
+    def migrate_data_layout(self, layout="sharded"):
+        """Move all data files of the collection to the given data layout.
+
+        ``layout`` is either "flat" or "sharded" (see ``taxid_dir``). The
+        files of each TaxID are first hard-linked (or copied, if hard links
+        are not supported) to their new location, then the TaxID is switched
+        to the new location with a single folder rename, then the old files
+        are removed. So the data of every TaxID remains readable during the
+        migration. However, no other process should be writing data in the
+        collection during the migration.
+
+        The collection's ``data_layout`` is set to ``layout``.
+        """
+        if layout not in ("flat", "sharded"):
+            raise ValueError("Unknown data layout %s" % layout)
+        self.rebuild_catalog()
+        files_by_taxid = {}
+        for filename, taxid, data_type in self._scan_data_files():
+            files_by_taxid.setdefault(taxid, []).append(filename)
+        for taxid, filenames in sorted(files_by_taxid.items()):
+            sharded_dir = self._sharded_taxid_dir(taxid)
+            is_sharded = os.path.isdir(sharded_dir)
+            if is_sharded == (layout == "sharded"):
+                continue
+            self._log_message("Migrating taxid %s to %s" % (taxid, layout))
+            paths = [os.path.join(self.data_dir, f) for f in filenames]
+            if layout == "sharded":
+                bucket_dir = os.path.dirname(sharded_dir)
+                temp_dir = os.path.join(bucket_dir, "." + taxid + ".tmp")
+                if os.path.exists(temp_dir):
+                    shutil.rmtree(temp_dir)
+                os.makedirs(temp_dir)
+                for path in paths:
+                    target = os.path.join(temp_dir, os.path.basename(path))
+                    atomic_link_or_copy(path, target)
+                os.rename(temp_dir, sharded_dir)  # The switch
+                for path in paths:
+                    os.remove(path)
+            else:
+                for path in paths:
+                    basename = os.path.basename(path)
+                    atomic_link_or_copy(
+                        path, os.path.join(self.data_dir, basename)
+                    )
+                temp_dir = os.path.join(
+                    os.path.dirname(sharded_dir), "." + taxid + ".old"
+                )
+                os.rename(sharded_dir, temp_dir)  # The switch
+                shutil.rmtree(temp_dir)
+                bucket_dir = os.path.dirname(sharded_dir)
+                if not os.listdir(bucket_dir):
+                    os.rmdir(bucket_dir)
+        self.data_layout = layout
+        self._taxid_dirs.clear()
+        self.rebuild_catalog()
@@ -1,43 +1,210 @@
 """Mixin for Bowtie methods, inherited by GenomeCollection."""
 
+import io
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor
 from urllib import request
+from urllib.error import HTTPError
 from Bio import Entrez
-import shutil
 import json
-import gzip
 import os
 
+from ..GunzipBackend import GunzipBackend
+from ..tools import (
+    atomic_write,
+    atomic_bgzf_write,
+    stream_gunzip_url,
+    download_url,
+)
+from ..RateLimiter import RateLimiter
+from ..EntrezCache import EntrezCache
+from ..sources.NCBISource import NCBISource
+
 
 class NCBIMixin:
 
     use_ncbi_ftp_via_https = True
     time_between_entrez_requests = 0.34
+    time_between_entrez_requests_with_api_key = 0.1
+    entrez_rate_limiter = None
+    share_entrez_rate_limit = False
+    entrez_max_retries = 3
+    entrez_retry_delay = 1.0
+    use_entrez_cache = True
+    entrez_cache_ttl = 7 * 24 * 3600
+    entrez_cache_max_size = 50e6
+    entrez_offline = False
+    stream_downloads = True
+    keep_gz_files = True
+    check_ncbi_md5 = True
+    download_segments = 1
+    download_max_retries = 5
+    download_retry_delay = 1.0
+    source = None
+    gunzip_backend = "auto"
+    gunzip_threads = None
+
+    def _get_source(self):
+        """Return the collection's source of data (see ``source``)."""
+        if self.source is None:
+            return NCBISource()
+        return self.source
+
+    def download_taxid_genome_infos(self, taxid, assembly_id=None):
+        """Get infos on a TaxID from the source, store them in [taxid].json.
+
+        The source is the ``source`` attribute of the collection (NCBI by
+        default, see ``NCBISource``, ``MirrorSource`` and
+        ``PeerCollectionSource``). See the source's ``get_taxid_infos`` for
+        the meaning of ``assembly_id``.
+        """
+        taxid = str(taxid)
+        infos = self._get_source().get_taxid_infos(self, taxid, assembly_id)
+        self._write_taxid_infos(taxid, infos)
+
+    def download_taxid_genome_data(self, taxid, data_type):
+        """Get a data file of the TaxID from the collection's source.
+
+        ``data_type`` is either genomic_fasta, genomic_genbank, genomic_gff,
+        or protein_fasta. This is the method used by
+        ``get_taxid_genome_data_path`` when a file is missing. The file is
+        obtained under a lock, as in ``download_taxid_genome_data_from_ncbi``.
+        """
+        taxid = str(taxid)
+        stored_data_type = self._stored_data_type(data_type)
+        with self._taxid_file_lock(taxid, stored_data_type):
+            self._get_source().download_taxid_genome_data(
+                self, taxid, data_type
+            )
+
+    def _get_entrez_rate_limiter(self):
+        """Return the rate limiter used for all Entrez requests.
+
+        This is the ``entrez_rate_limiter`` attribute if it was set (any
+        object with an ``acquire()`` method). Otherwise a token bucket is
+        created, allowing one request every ``time_between_entrez_requests``
+        (or ``time_between_entrez_requests_with_api_key`` if an
+        ``Entrez.api_key`` is set). If ``share_entrez_rate_limit`` is True,
+        the bucket is shared with all other processes using the same
+        ``data_dir``.
+        """
+        if self.entrez_rate_limiter is not None:
+            return self.entrez_rate_limiter
+        with self._entrez_lock:
+            if self._entrez_rate_limiter is None:
+                time_between = self.time_between_entrez_requests
+                if Entrez.api_key is not None:
+                    time_between = (
+                        self.time_between_entrez_requests_with_api_key
+                    )
+                state_file = None
+                if self.share_entrez_rate_limit:
+                    state_file = self._metadata_path("entrez_rate_limiter")
+                self._entrez_rate_limiter = RateLimiter(
+                    rate=1.0 / time_between, state_file=state_file
+                )
+        return self._entrez_rate_limiter
+
+    def _get_entrez_cache(self):
+        """Return the on-disk cache of Entrez responses of this data_dir.
+
+        Responses are kept ``entrez_cache_ttl`` seconds, and the least
+        recently used responses are evicted when the cache exceeds
+        ``entrez_cache_max_size`` bytes. Returns None if ``use_entrez_cache``
+        is False.
+        """
+        if not self.use_entrez_cache:
+            return None
+        path = self._metadata_path("entrez_cache.sqlite")
+        with self._entrez_lock:
+            cache = self._entrez_cache
+            if (cache is None) or (cache.path != path):
+                self._entrez_cache = EntrezCache(
+                    path,
+                    ttl=self.entrez_cache_ttl,
+                    max_size=self.entrez_cache_max_size,
+                )
+        return self._entrez_cache
 
     def _get_data_from_entrez(self, request, **kwargs):
+        """Return the parsed response of an Entrez request.
+
+        The responses are cached (see ``_get_entrez_cache``). When attribute
+        ``entrez_offline`` is True, the responses are only served from the
+        cache (even if outdated), and an IOError is raised for requests which
+        are not cached.
+        """
+
+        cache, cache_key, response = self._get_cached_entrez_response(
+            request, **kwargs
+        )
+        if response is None:
+            response = self._request_entrez(request, **kwargs)
+            if cache is not None:
+                cache.set(cache_key, response)
+        return Entrez.read(io.BytesIO(response), validate=False)
+
+    def _get_cached_entrez_response(self, request, **kwargs):
+        """Return (cache, cache_key, response) for an Entrez request.
 
-        # Set the ENTREZ email (mandatory) if not done already
+        The response is None if it is not in the cache. In offline mode, an
+        IOError is raised instead.
+        """
+        cache = self._get_entrez_cache()
+        cache_key = EntrezCache.request_key(request, **kwargs)
+        response = None
+        if cache is not None:
+            response = cache.get(cache_key, ignore_ttl=self.entrez_offline)
+        if (response is None) and self.entrez_offline:
+            raise IOError(
+                "Entrez request %s is not in the cache, and Genome "
+                "Collector is in offline mode." % cache_key
+            )
+        return cache, cache_key, response
 
+    @staticmethod
+    def _set_default_entrez_email():
+        """Set the ENTREZ email (mandatory) if not done already."""
         if Entrez.email is None:
             random_id = random.randint(0, 10000)
             Entrez.email = "genome_collector_%s@replaceme.org" % random_id
 
-        # Be nice to NCBI and wait a bit if the previous request is too recent
+    @staticmethod
+    def _read_entrez_response(request, **kwargs):
+        handle = request(**kwargs)
+        try:
+            return handle.read()
+        finally:
+            handle.close()
+
+    def _get_entrez_retry_delay(self, error, attempt):
+        """Return the delay before retrying a failed Entrez request.
+
+        The error is raised again if the request shouldn't be retried.
+        """
+        is_retryable = (error.code == 429) or (error.code >= 500)
+        if (not is_retryable) or (attempt == self.entrez_max_retries):
+            raise error
+        delay = self.entrez_retry_delay * 2 ** attempt
+        self._log_message(
+            "Entrez request failed (%s), retrying in %.1fs" % (error, delay)
+        )
+        return delay
 
-        now = time.time()
-        last_time = self._time_of_last_entrez_call
-        if last_time is not None:
-            elapsed = now - last_time
-            sleep_time = self.time_between_entrez_requests - elapsed
-            if sleep_time > 0:
-                time.sleep(sleep_time)
-        self._time_of_last_entrez_call = time.time()
+    def _request_entrez(self, request, **kwargs):
+        """Return the raw response (bytes) of an Entrez request."""
+        self._set_default_entrez_email()
 
-        # Do the request
+        # Be nice to NCBI: wait for the rate limiter before each request, and
+        # retry with an increasing delay if NCBI says it is overloaded.
 
-        search = request(**kwargs)
-        return Entrez.read(search, validate=False)
+        for attempt in range(self.entrez_max_retries + 1):
+            self._get_entrez_rate_limiter().acquire()
+            try:
+                return self._read_entrez_response(request, **kwargs)
+            except HTTPError as err:
+                time.sleep(self._get_entrez_retry_delay(err, attempt))
 
     def _get_taxid_genome_id_from_ncbi(self, taxid):
         """Return a Genome ID for this TaxID, provided by the NCBI API."""
@@ -45,7 +212,12 @@ class NCBIMixin:
         data = self._get_data_from_entrez(
             Entrez.esearch, term="txid" + taxid, db="genome", retmode="xml"
         )
-        ids = data["IdList"]
+        return self._get_single_genome_id(data, taxid)
+
+    @staticmethod
+    def _get_single_genome_id(search_results, taxid):
+        """Return the Genome ID of an esearch, if there is exactly one."""
+        ids = search_results["IdList"]
         if len(ids) != 1:
             raise IOError(
                 "Found %d results (instead of 1) for taxID %s"
@@ -61,84 +233,258 @@ class NCBIMixin:
         available NCBI Assembly ID (first in numerical order).
         """
         taxid = str(taxid)
+        infos = self._get_taxid_infos_from_ncbi(taxid, assembly_id)
+        self._write_taxid_infos(taxid, infos)
+
+    def _get_taxid_infos_from_ncbi(
+        self, taxid, assembly_id=None, genome_id=None
+    ):
+        """Return the infos dict of a TaxID, obtained from Entrez.
+
+        The genome ID is searched unless it is provided.
+        """
         self._log_message("Downloading infos for taxid %s from NCBI" % taxid)
 
         # First get the corresponding genome ID, check that there is only one
-        genome_id = self._get_taxid_genome_id_from_ncbi(taxid)
+        if genome_id is None:
+            genome_id = self._get_taxid_genome_id_from_ncbi(taxid)
 
         # Then search for the reference genome, check that there is only one
-        results = self._get_data_from_entrez(
+        genome_results = self._get_data_from_entrez(
             Entrez.esummary, id=genome_id, db="genome", retmode="xml"
         )
-        if len(results) != 1:
-            raise IOError(
-                "Found %d results (instead of 1) for genome %s"
-                % (len(results), genome_id)
-            )
-        infos = dict(**results[0])
+        self._check_single_genome_summary(genome_results, genome_id)
 
         # So far so good, valid TaxID! Let us get more infos about that taxID
         # such as the scientific name, division, etc.
-        results = self._get_data_from_entrez(
+        taxonomy_results = self._get_data_from_entrez(
             Entrez.esummary, id=taxid, db="taxonomy", retmode="xml"
         )
-        infos.update(dict(**results[0]))
+        infos = dict(**genome_results[0])
+        infos.update(dict(**taxonomy_results[0]))
         infos["taxID"] = taxid
         infos["genomeID"] = genome_id
         if infos["AssemblyID"] == "0":
-            data = self._get_data_from_entrez(
-                Entrez.esearch,
-                term="txid" + taxid,
-                db="assembly",
-                retmode="xml",
+            self._set_infos_assembly_id(infos, assembly_id)
+        return infos
+
+    @staticmethod
+    def _check_single_genome_summary(results, genome_id):
+        if len(results) != 1:
+            raise IOError(
+                "Found %d results (instead of 1) for genome %s"
+                % (len(results), genome_id)
             )
-            assembly_ids = data["IdList"]
-            if assembly_id is None:
-                message = "No AssemblyID found for taxID %s! " % taxid
-                if len(assembly_ids) == 0:
-                    message += (
-                        "And no assembly came up from the NCBI search. Sorry! "
-                    )
-                else:
-                    message += (
-                        "You will need to download the infos manually using "
-                        "collection.download_taxid_genome_infos_from_ncbi("
-                        "taxid, assembly_id=XXX) where assembly_id can be an "
-                        "ID, or an index of the form '#0' to select the first "
-                        "available assembly_id."
-                    )
-                raise OSError(message)
-
-            if assembly_id.startswith("#"):
-                data = self._get_data_from_entrez(
-                    Entrez.esearch,
-                    term="txid" + taxid,
-                    db="assembly",
-                    retmode="xml",
+
+    def _set_infos_assembly_id(self, infos, assembly_id=None):
+        """Set infos["AssemblyID"] for TaxIDs whose genome has none.
+
+        See ``download_taxid_genome_infos_from_ncbi`` for the meaning of
+        ``assembly_id``.
+        """
+        taxid = infos["taxID"]
+        data = self._get_data_from_entrez(
+            Entrez.esearch, term="txid" + taxid, db="assembly", retmode="xml",
+        )
+        assembly_ids = data["IdList"]
+        if assembly_id is None:
+            message = "No AssemblyID found for taxID %s! " % taxid
+            if len(assembly_ids) == 0:
+                message += (
+                    "And no assembly came up from the NCBI search. Sorry! "
                 )
-                assembly_ids = data["IdList"]
-                if len(assembly_ids) == 0:
-                    raise OSError(
-                        "Couldn't find an AssemblyID for this genome."
-                    )
-                assembly_ids = sorted([int(i) for i in assembly_ids])
-                assembly_index = int(assembly_id.strip("#"))
-                infos["AssemblyID"] = str(assembly_ids[assembly_index])
             else:
-                if assembly_id not in assembly_ids:
-                    raise ValueError(
-                        "NCBI says that %s is not an assembly ID for taxID %s."
-                        % (assembly_id, taxid)
-                    )
-                infos["AssemblyID"] = assembly_id
+                message += (
+                    "You will need to download the infos manually using "
+                    "collection.download_taxid_genome_infos_from_ncbi("
+                    "taxid, assembly_id=XXX) where assembly_id can be an "
+                    "ID, or an index of the form '#0' to select the first "
+                    "available assembly_id."
+                )
+            raise OSError(message)
 
-        # Finally, write the infos locally
+        if assembly_id.startswith("#"):
+            if len(assembly_ids) == 0:
+                raise OSError("Couldn't find an AssemblyID for this genome.")
+            assembly_ids = sorted([int(i) for i in assembly_ids])
+            assembly_index = int(assembly_id.strip("#"))
+            infos["AssemblyID"] = str(assembly_ids[assembly_index])
+        else:
+            if assembly_id not in assembly_ids:
+                raise ValueError(
+                    "NCBI says that %s is not an assembly ID for taxID %s."
+                    % (assembly_id, taxid)
+                )
+            infos["AssemblyID"] = assembly_id
 
+    def _write_taxid_infos(self, taxid, infos):
+        """Write the infos dict in the TaxID's '[taxid].json' file."""
         path = self.datafile_path(taxid, data_type="infos")
-        if not os.path.exists(self.data_dir):
-            os.makedirs(self.data_dir)
-        with open(path, "w") as f:
+        with atomic_write(path, mode="w") as f:
             json.dump(infos, f)
+        self._register_taxid_files(taxid, "infos")
+
+    def _get_entrez_summaries(self, db, ids):
+        """Return a dict {id: summary} obtained with a single esummary call.
+
+        For the "assembly" database, the summaries are the DocumentSummary
+        elements. Ids for which NCBI returned no summary are absent from the
+        result.
+        """
+        data = self._get_data_from_entrez(
+            Entrez.esummary, id=",".join(ids), db=db, retmode="xml"
+        )
+        if db == "assembly":
+            summaries = data["DocumentSummarySet"]["DocumentSummary"]
+            return {str(s.attributes["uid"]): s for s in summaries}
+        return {str(summary["Id"]): summary for summary in data}
+
+    def _get_taxids_genome_ids_from_ncbi(self, taxids):
+        """Return a dict {taxid: genome_id} obtained with a single elink call.
+
+        The TaxIDs are linked to the genome database one-to-one (one link
+        set per TaxID). TaxIDs with no linked genome, or with several, are
+        absent from the result.
+        """
+        data = self._get_data_from_entrez(
+            Entrez.elink,
+            dbfrom="taxonomy",
+            db="genome",
+            id=list(taxids),
+            retmode="xml",
+        )
+        genome_ids = {}
+        for link_set in data:
+            links = [
+                link["Id"]
+                for link_set_db in link_set.get("LinkSetDb", [])
+                if link_set_db.get("DbTo") == "genome"
+                for link in link_set_db["Link"]
+            ]
+            if len(link_set["IdList"]) == 1 and len(links) == 1:
+                genome_ids[str(link_set["IdList"][0])] = str(links[0])
+        return genome_ids
+
+    def download_taxids_infos_from_ncbi(self, taxids, batch_size=200):
+        """Download infos for many TaxIDs, with batched Entrez requests.
+
+        This is equivalent to calling ``download_taxid_genome_infos_from_ncbi``
+        on each TaxID, but the genome IDs, and the genome, taxonomy and
+        assembly summaries of ``batch_size`` TaxIDs are obtained with a
+        single request each. The genome IDs are found by linking the TaxIDs
+        to the genome database, and only the TaxIDs with no (or several)
+        linked genomes are searched one by one, as in
+        ``download_taxid_genome_infos_from_ncbi``. The FTP path of each
+        assembly is also stored in the infos (as "AssemblyFtpPath"), so no
+        Entrez request is needed to find the TaxID's data files URLs later
+        on.
+
+        Errors do not interrupt the download. When a batch request fails
+        (e.g. because of an invalid TaxID in the batch), the TaxIDs of the
+        batch are processed one by one instead, and assembly summaries which
+        could not be obtained are fetched later, when the data files are
+        downloaded. A dict ``{taxid: error}`` of all the TaxIDs whose infos
+        could not be obtained is returned.
+
+        Examples
+        ========
+
+        >>> errors = collection.download_taxids_infos_from_ncbi(taxids)
+        >>> for taxid, error in errors.items():
+        >>>     print ("TaxID %s failed: %s" % (taxid, error))
+        """
+        taxids = [str(taxid) for taxid in taxids]
+        self._log_message("Downloading infos for %d taxids" % len(taxids))
+        errors = {}
+        genome_ids = {}
+        for i in range(0, len(taxids), batch_size):
+            batch = taxids[i : i + batch_size]
+            try:
+                genome_ids.update(self._get_taxids_genome_ids_from_ncbi(batch))
+            except Exception as err:
+                # The genome IDs of the batch are searched one by one below
+                self._log_batch_error("genome links", batch, err)
+        for taxid in taxids:
+            if taxid in genome_ids:
+                continue
+            try:
+                genome_ids[taxid] = self._get_taxid_genome_id_from_ncbi(taxid)
+            except Exception as err:
+                errors[taxid] = err
+        valid_taxids = [taxid for taxid in taxids if taxid in genome_ids]
+
+        for i in range(0, len(valid_taxids), batch_size):
+            batch = valid_taxids[i : i + batch_size]
+            try:
+                genome_summaries = self._get_entrez_summaries(
+                    "genome", sorted(set(genome_ids[taxid] for taxid in batch))
+                )
+                taxonomy_summaries = self._get_entrez_summaries(
+                    "taxonomy", batch
+                )
+            except Exception as err:
+                self._log_batch_error("summaries", batch, err)
+                for taxid in batch:
+                    try:
+                        infos = self._get_taxid_infos_from_ncbi(
+                            taxid, genome_id=genome_ids[taxid]
+                        )
+                    except Exception as err:
+                        errors[taxid] = err
+                        continue
+                    self._write_taxid_infos(taxid, infos)
+                continue
+            batch_infos = {}
+            for taxid in batch:
+                genome_id = genome_ids[taxid]
+                if genome_id not in genome_summaries:
+                    errors[taxid] = IOError(
+                        "Found no summary for genome %s" % genome_id
+                    )
+                    continue
+                if taxid not in taxonomy_summaries:
+                    errors[taxid] = IOError(
+                        "Found no taxonomy summary for taxid %s" % taxid
+                    )
+                    continue
+                infos = dict(**genome_summaries[genome_id])
+                infos.update(dict(**taxonomy_summaries[taxid]))
+                infos["taxID"] = taxid
+                infos["genomeID"] = genome_id
+                try:
+                    if infos["AssemblyID"] == "0":
+                        self._set_infos_assembly_id(infos)
+                except Exception as err:
+                    errors[taxid] = err
+                    continue
+                batch_infos[taxid] = infos
+
+            if len(batch_infos) == 0:
+                continue
+            assembly_ids = set(i["AssemblyID"] for i in batch_infos.values())
+            try:
+                assembly_summaries = self._get_entrez_summaries(
+                    "assembly", sorted(assembly_ids)
+                )
+            except Exception as err:
+                # The FTP paths will be found when downloading the data
+                self._log_batch_error("assembly summaries", batch, err)
+                assembly_summaries = {}
+            for taxid, infos in batch_infos.items():
+                assembly_summary = assembly_summaries.get(infos["AssemblyID"])
+                if assembly_summary is not None:
+                    ftp_path = assembly_summary["FtpPath_RefSeq"]
+                    if ftp_path == "":
+                        ftp_path = assembly_summary["FtpPath_GenBank"]
+                    infos["AssemblyFtpPath"] = ftp_path
+                self._write_taxid_infos(taxid, infos)
+        return errors
+
+    def _log_batch_error(self, description, batch, error):
+        self._log_message(
+            "The request for the %s of %d taxids failed: %s"
+            % (description, len(batch), error)
+        )
 
     def _get_taxid_assembly_url_from_ncbi(self, taxid, data_type):
         """Return a URL pointing to this taxid's genome sequence in NCBI.
@@ -151,15 +497,29 @@ class NCBIMixin:
             "Getting assembly URL for taxid %s from NCBI" % taxid
         )
         genome_infos = self.get_taxid_infos(taxid)
-        assembly_id = genome_infos["AssemblyID"]
-        data = self._get_data_from_entrez(
-            Entrez.esummary, id=assembly_id, db="assembly", retmode="xml"
-        )
-        ftp_data = data["DocumentSummarySet"]["DocumentSummary"][0]
+        ftp_path = genome_infos.get("AssemblyFtpPath", "")
+        if ftp_path == "":
+            assembly_id = genome_infos["AssemblyID"]
+            data = self._get_data_from_entrez(
+                Entrez.esummary, id=assembly_id, db="assembly", retmode="xml"
+            )
+            ftp_path = self._get_assembly_ftp_path(data)
+        return self._get_assembly_file_url(ftp_path, data_type)
+
+    @staticmethod
+    def _get_assembly_ftp_path(assembly_summary):
+        """Return the FTP folder of an assembly, from its Entrez summary.
+
+        The RefSeq folder is preferred, the GenBank folder is the fallback.
+        """
+        ftp_data = assembly_summary["DocumentSummarySet"]["DocumentSummary"][0]
         ftp_path = ftp_data["FtpPath_RefSeq"]
         if ftp_path == "":
             ftp_path = ftp_data["FtpPath_GenBank"]
+        return ftp_path
 
+    def _get_assembly_file_url(self, ftp_path, data_type):
+        """Return the URL of a data file in an assembly's FTP folder."""
         basename = ftp_path.split("/")[-1]
         if self.use_ncbi_ftp_via_https:
             ftp_path = ftp_path.replace("ftp:", "https:")
@@ -171,28 +531,235 @@ class NCBIMixin:
         
         data_type is either genomic_fasta, genomic_genbank, genomic_gff,
         or protein_fasta.
+
+        When the ``stream_downloads`` attribute is True (default), the data is
+        decompressed on the fly as it is downloaded, so the gz file is never
+        read back from the disk. Set the ``keep_gz_files`` attribute to False
+        to only keep the uncompressed file. In all cases the files are
+        written to temporary files first, and renamed once complete.
+
+        Interrupted downloads are resumed: dropped connections are retried
+        (``download_max_retries`` times in a row, every
+        ``download_retry_delay`` seconds) from where they stopped, and the
+        data of a failed download is kept in a hidden ".part" file, so the
+        next call only downloads the missing data. When the
+        ``download_segments`` attribute is more than 1, large files are
+        downloaded in that many segments in parallel (this disables the
+        streaming decompression). The progress is sent to the logger, as a
+        "download" bar.
+
+        When the ``check_ncbi_md5`` attribute is True (default), the download
+        is checked against the MD5 listed in the "md5checksums.txt" file of
+        the NCBI assembly folder, and an IOError is raised (and no file is
+        written) if the data is corrupted. The MD5 is kept in the catalog.
+
+        The ``gunzip_backend`` attribute selects the decompression
+        implementation: "igzip" or "pigz" (programs, using
+        ``gunzip_threads`` threads), "isal" or "zlib-ng" (libraries), "zlib"
+        (standard library), or "auto" (default) for the fastest available.
+        Programs can't decompress streamed data, so streaming downloads use
+        the fastest available library.
+
+        When the ``sequence_storage`` attribute is "bgzf", the data is stored
+        compressed in BGZF blocks (with compression level
+        ``bgzf_compresslevel``), with a .gzi index, and the original gz file
+        is not kept.
+
+        The download is made under a lock, so other threads or processes
+        downloading the same file at the same time wait for this download.
         """
         taxid = str(taxid)
-        target_data_file = self.datafile_path(taxid, data_type)
+        stored_data_type = self._stored_data_type(data_type)
+        with self._taxid_file_lock(taxid, stored_data_type):
+            self._download_taxid_genome_data(taxid, data_type)
+
+    def _download_taxid_genome_data(self, taxid, data_type):
         query = "TaxID %s %s" % (data_type, taxid)
         self._log_message("Getting NCBI URL for %s." % query)
-        taxid = str(taxid)
         ftp_url = self._get_taxid_assembly_url_from_ncbi(
             taxid, data_type=data_type
         )
+        self._download_taxid_genome_data_from_url(taxid, data_type, ftp_url)
+
+    def _download_taxid_genome_data_from_url(self, taxid, data_type, ftp_url):
+        stored_data_type = self._stored_data_type(data_type)
+        target_data_file = self.datafile_path(taxid, stored_data_type)
+        query = "TaxID %s %s" % (data_type, taxid)
+        target_gz_file = self.datafile_path(taxid, "%s_gz" % data_type)
+        md5 = self._get_ncbi_md5(ftp_url) if self.check_ncbi_md5 else None
+        keep_gz_file = self.keep_gz_files and (stored_data_type == data_type)
+        bgzf_compresslevel = None
+        if stored_data_type != data_type:
+            bgzf_compresslevel = self.bgzf_compresslevel
+
+        if self.stream_downloads and (self.download_segments == 1):
+            self._log_message("Downloading and unzipping %s." % query)
+            try:
+                stream_gunzip_url(
+                    ftp_url,
+                    target_data_file,
+                    gz_path=target_gz_file if keep_gz_file else None,
+                    md5=md5,
+                    progress_callback=self._log_download_progress,
+                    max_retries=self.download_max_retries,
+                    retry_delay=self.download_retry_delay,
+                    gunzip_backend=self._get_gunzip_backend(),
+                    bgzf_compresslevel=bgzf_compresslevel,
+                )
+            except request.HTTPError as err:
+                raise IOError(
+                    "NCBI genome URL %s for taxID %s not found: %s"
+                    % (ftp_url, taxid, err)
+                )
+        else:
+            self._download_and_gunzip(ftp_url, taxid, data_type, md5=md5)
+        self._register_taxid_files(taxid, stored_data_type, source_md5=md5)
+        if bgzf_compresslevel is not None:
+            self._register_taxid_files(taxid, stored_data_type + "_gzi")
+        self._register_taxid_files(taxid, data_type + "_gz", source_md5=md5)
+        self._log_message("Done downloading %s." % query)
+
+    def _log_download_progress(self, downloaded, total):
+        # Proglog loggers need the total (even None) to initialize the bar
+        self._logger(download__total=total, download__index=downloaded)
+
+    def _get_gunzip_backend(self):
+        """Return the GunzipBackend set by the collection's attributes."""
+        return GunzipBackend(self.gunzip_backend, threads=self.gunzip_threads)
+
+    def _get_ncbi_md5(self, url):
+        """Return the MD5 of a file of an NCBI assembly folder, or None.
+
+        The MD5 is read from the "md5checksums.txt" file of the folder. None
+        is returned (and no check is made) if the file or the entry is absent.
+        """
+        folder, basename = url.rsplit("/", 1)
+        try:
+            with request.urlopen(folder + "/md5checksums.txt") as response:
+                lines = response.read().decode().splitlines()
+        except IOError as err:
+            message = "No MD5 checksums found for %s (%s)" % (url, err)
+            self._log_message(message)
+            return None
+        for line in lines:
+            # Lines are of the form "md5  ./filename"
+            fields = line.split()
+            if len(fields) == 2 and os.path.basename(fields[1]) == basename:
+                return fields[0]
+        return None
 
+    def _download_and_gunzip(self, ftp_url, taxid, data_type, md5=None):
+        """Download the gz file then unzip it (no streaming)."""
+        query = "TaxID %s %s" % (data_type, taxid)
+        stored_data_type = self._stored_data_type(data_type)
+        target_data_file = self.datafile_path(taxid, stored_data_type)
         target_gz_file = self.datafile_path(taxid, "%s_gz" % data_type)
 
         self._log_message("Downloading %s." % query)
         try:
-            request.urlretrieve(ftp_url, target_gz_file)
+            download_url(
+                ftp_url,
+                target_gz_file,
+                md5=md5,
+                segments=self.download_segments,
+                progress_callback=self._log_download_progress,
+                max_retries=self.download_max_retries,
+                retry_delay=self.download_retry_delay,
+            )
         except request.HTTPError as err:
             raise IOError(
                 "NCBI genome URL %s for taxID %s not found: %s"
                 % (ftp_url, taxid, err)
             )
         self._log_message("Unzipping  %s." % query)
-        with open(target_data_file, "wb") as f_fasta:
-            with gzip.open(target_gz_file, "rb") as f_gz:
-                shutil.copyfileobj(f_gz, f_fasta)
-        self._log_message("Done downloading %s." % query)
+        gunzip_backend = self._get_gunzip_backend()
+        if stored_data_type == data_type:
+            with atomic_write(target_data_file) as f:
+                gunzip_backend.gunzip_file(target_gz_file, f)
+        else:
+            with atomic_bgzf_write(
+                target_data_file, self.bgzf_compresslevel
+            ) as f:
+                gunzip_backend.gunzip_file(target_gz_file, f)
+        if (not self.keep_gz_files) or (stored_data_type != data_type):
+            os.remove(target_gz_file)
+
+    def prefetch(self, taxids, data_types=("genomic_fasta",), max_workers=4):
+        """Make sure that the data for many TaxIDs is available locally.
+
+        The infos of the TaxIDs are obtained first (with batched Entrez
+        requests, see ``download_taxids_infos_from_ncbi``, when the source
+        is NCBI), then the data
+        files are downloaded in parallel by a pool of threads. Entrez requests
+        made by the threads still go through the collection's rate limiter.
+
+        Errors do not interrupt the prefetching: instead a report is
+        returned, with one entry per (TaxID, data type).
+
+        Parameters
+        ==========
+
+        taxids
+          List of TaxIDs (int or str).
+
+        data_types
+          List of data types to obtain for each TaxID, e.g. "infos",
+          "genomic_fasta", "genomic_genbank", "genomic_gff", "protein_fasta".
+
+        max_workers
+          Maximal number of simultaneous downloads.
+
+        Examples
+        ========
+
+        >>> report = collection.prefetch([511145, 559292], max_workers=8)
+        >>> [
+        >>>     {'taxid': '511145', 'data_type': 'genomic_fasta',
+        >>>      'path': '/.../511145_genomic.fa', 'error': None},
+        >>>     ...
+        >>> ]
+        """
+        taxids = [str(taxid) for taxid in taxids]
+        infos_errors = {}
+        missing_infos = [
+            taxid
+            for taxid in taxids
+            if not os.path.exists(self.datafile_path(taxid, "infos"))
+        ]
+        is_ncbi_source = isinstance(self._get_source(), NCBISource)
+        if missing_infos and self.autodownload and is_ncbi_source:
+            infos_errors = self.download_taxids_infos_from_ncbi(missing_infos)
+        for taxid in taxids:
+            if taxid in infos_errors:
+                continue
+            try:
+                self.get_taxid_infos(taxid)
+            except Exception as err:
+                infos_errors[taxid] = err
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                (taxid, data_type): executor.submit(
+                    self.get_taxid_genome_data_path, taxid, data_type
+                )
+                for taxid in taxids
+                if taxid not in infos_errors
+                for data_type in data_types
+                if data_type != "infos"
+            }
+
+        report = []
+        for taxid in taxids:
+            for data_type in data_types:
+                entry = dict(taxid=taxid, data_type=data_type, path=None)
+                entry["error"] = infos_errors.get(taxid, None)
+                if entry["error"] is None:
+                    if data_type == "infos":
+                        entry["path"] = self.datafile_path(taxid, "infos")
+                    else:
+                        future = futures[(taxid, data_type)]
+                        entry["error"] = future.exception()
+                        if entry["error"] is None:
+                            entry["path"] = future.result()
+                report.append(entry)
+        return report
@@ -0,0 +1,370 @@
+"""Mixin limiting the size of the data directory, by evicting unused files."""
+
+import os
+import time
+
+from ..tools import atomic_write, atomic_bgzf_write
+
+
+class QuotaMixin:
+    """All methods are directly accessible to GenomeCollection instances."""
+
+    max_data_size = None
+    eviction_policy = "lru"
+    eviction_grace_period = 600
+    access_flush_interval = 1.0
+
+    def _record_access(self, taxid, data_type):
+        """Count an access to a TaxID's data file, for the eviction policy.
+
+        Accesses are buffered in memory and written to the catalog at most
+        every ``access_flush_interval`` seconds. The first access to a file
+        since the last write is written at once, so that other processes
+        never see a last access more than ``access_flush_interval`` seconds
+        old (see ``eviction_grace_period``).
+        """
+        now = time.time()
+        key = (str(taxid), data_type)
+        with self._access_lock:
+            is_buffered = (key in self._pending_accesses) or (
+                key in self._flushed_accesses
+            )
+            count = self._pending_accesses.get(key, (now, 0))[1]
+            self._pending_accesses[key] = (now, count + 1)
+            is_recent = (
+                now - self._last_access_flush < self.access_flush_interval
+            )
+            if is_buffered and is_recent:
+                return
+        self._flush_accesses()
+
+    def _flush_accesses(self):
+        """Write the buffered accesses to the catalog."""
+        with self._access_lock:
+            pending = self._pending_accesses
+            self._pending_accesses = {}
+            self._flushed_accesses = set(pending)
+            self._last_access_flush = time.time()
+        if pending:
+            self._get_catalog().record_accesses(
+                [
+                    (taxid, data_type, access_time, count)
+                    for (taxid, data_type), (access_time, count) in (
+                        pending.items()
+                    )
+                ]
+            )
+
+    def _eviction_tier(self, data_type, compressed_data_types=()):
+        """Return the eviction priority of a data type (0 goes first).
+
+        Indexes built from the sequences (BLAST databases, Bowtie indexes,
+        FASTA indexes, 2bit files) come first, then uncompressed sequence
+        files which can be restored from a local gz file (in
+        ``compressed_data_types``), then the other sequence files. Infos
+        files are never evicted (None).
+        """
+        if data_type == "infos":
+            return None
+        if (data_type in self.multifile_data_types) or data_type.endswith(
+            ("_index", "_2bit")
+        ):
+            return 0
+        if data_type + "_gz" in compressed_data_types:
+            return 1
+        return 2
+
+    def get_data_usage(self):
+        """Return the data files of the collection, in eviction order.
+
+        The files are grouped by artifact: a TaxID's data file with its
+        companion files (all files of a BLAST database or Bowtie index, the
+        .gzi index of a BGZF file). The result is a list of dicts with keys
+        taxid, data_type, size (in bytes, of all the files), last_access
+        (a timestamp), access_count and pinned. Artifacts which are never
+        accessed directly (e.g. gz files) have the last access and access
+        count of their TaxID's most used data type. The list is sorted in
+        the order in which ``evict_data_files`` removes artifacts (see
+        ``eviction_policy``); pinned TaxIDs and infos files come last.
+
+        The files and sizes are those of the collection's catalog: files
+        added to the data directory by other means than the collection
+        (e.g. copied by hand) are not counted until ``rebuild_catalog`` is
+        called. Files hard-linked to several artifacts (e.g. the files of
+        TaxIDs sharing an assembly, see ``deduplicate_assemblies``) are
+        counted once, in the size of the last of these artifacts in
+        eviction order, as only its eviction frees the disk space. So the
+        sizes add up to the disk usage of the data files.
+
+        Examples
+        ========
+
+        >>> usage = collection.get_data_usage()
+        >>> print("%.1f Gb" % (sum(a["size"] for a in usage) / 1e9))
+        """
+        usage = self._get_data_usage()
+        for artifact in usage:
+            artifact.pop("files")
+        return usage
+
+    def _get_data_usage(self):
+        """Return the artifacts of ``get_data_usage``, with their files.
+
+        The "files" of an artifact are a list of (inode, size), where inode
+        is a (device, inode number) pair identifying the hard-linked files.
+        """
+        if self.eviction_policy not in ("lru", "lfu"):
+            raise ValueError(
+                "eviction_policy should be 'lru' or 'lfu', not %s"
+                % self.eviction_policy
+            )
+        self._flush_accesses()
+        catalog = self._get_catalog()
+        accesses = catalog.accesses()
+        pinned_taxids = set(catalog.pinned_taxids())
+        artifacts = {}
+        for entry in catalog.files():
+            data_type = entry["data_type"]
+            if data_type.endswith("_gzi"):
+                data_type = data_type[: -len("_gzi")]
+            key = (entry["taxid"], data_type)
+            if key not in artifacts:
+                artifacts[key] = dict(
+                    taxid=entry["taxid"],
+                    data_type=data_type,
+                    size=0,
+                    files=[],
+                    build_time=0,
+                    pinned=entry["taxid"] in pinned_taxids,
+                )
+            artifact = artifacts[key]
+            path = os.path.join(self.data_dir, entry["filename"])
+            try:
+                stat = os.stat(path)
+                inode = (stat.st_dev, stat.st_ino)
+            except FileNotFoundError:
+                inode = (None, path)
+            artifact["files"].append((inode, entry["size"]))
+            artifact["build_time"] = max(
+                artifact["build_time"], entry["build_time"]
+            )
+        taxids_accesses = {}
+        for (taxid, _), (last_access, count) in accesses.items():
+            previous = taxids_accesses.get(taxid, (0, 0))
+            taxids_accesses[taxid] = (
+                max(previous[0], last_access),
+                max(previous[1], count),
+            )
+        data_types_by_taxid = {}
+        for taxid, data_type in artifacts:
+            data_types_by_taxid.setdefault(taxid, set()).add(data_type)
+        for key, artifact in artifacts.items():
+            build_time = artifact.pop("build_time")
+            last_access, count = accesses.get(
+                key, taxids_accesses.get(artifact["taxid"], (build_time, 0))
+            )
+            artifact["last_access"] = last_access
+            artifact["access_count"] = count
+            artifact["tier"] = self._eviction_tier(
+                artifact["data_type"], data_types_by_taxid[artifact["taxid"]]
+            )
+
+        def eviction_order(artifact):
+            if artifact["pinned"] or (artifact["tier"] is None):
+                return (1, 0, 0, 0)
+            usage = (artifact["last_access"], artifact["access_count"])
+            if self.eviction_policy == "lfu":
+                usage = usage[::-1]
+            return (0, artifact["tier"]) + usage
+
+        usage = sorted(artifacts.values(), key=eviction_order)
+        counted_inodes = set()
+        for artifact in reversed(usage):
+            for inode, size in artifact["files"]:
+                if inode not in counted_inodes:
+                    counted_inodes.add(inode)
+                    artifact["size"] += size
+        return usage
+
+    def pin_taxids(self, taxids):
+        """Protect the data files of these TaxIDs from eviction.
+
+        The pinned TaxIDs are recorded in the collection's catalog, so they
+        are pinned for all processes sharing the data directory.
+        """
+        self._get_catalog().pin_taxids(taxids)
+
+    def unpin_taxids(self, taxids):
+        """Let the data files of these TaxIDs be evicted again."""
+        self._get_catalog().unpin_taxids(taxids)
+
+    def list_pinned_taxids(self):
+        """Return the list of the TaxIDs protected from eviction."""
+        return self._get_catalog().pinned_taxids()
+
+    def evict_data_files(self, max_size=None):
+        """Remove the least used data files until the collection fits a size.
+
+        The files are removed by artifact (see ``get_data_usage``), in the
+        order of ``eviction_policy`` ("lru": least recently used first,
+        "lfu": least frequently used first), indexes first, then the
+        uncompressed sequences which have a local gz file (they are restored
+        from it when needed), then the other sequence files. The files of
+        pinned TaxIDs (see ``pin_taxids``), the infos files and the files
+        being created by another thread or process are never removed.
+        Neither are the files accessed by any process sharing the data
+        directory in the last ``eviction_grace_period`` seconds (default
+        600), as they may still be in use (e.g. a BLAST database being
+        searched), so the collection may exceed ``max_size`` for that time.
+        The files are downloaded or built again the next time they are
+        needed. The sizes are those of the catalog, with hard-linked files
+        counted once: they are only freed when all their artifacts are
+        evicted (see ``get_data_usage``).
+
+        This is done automatically after each download or build when
+        attribute ``max_data_size`` is set.
+
+        Parameters
+        ==========
+
+        max_size
+          Maximal total size of the data files, in bytes. Defaults to the
+          collection's ``max_data_size``.
+
+        Returns
+        =======
+
+        evicted
+          The list of the evicted artifacts (see ``get_data_usage``).
+
+        Examples
+        ========
+
+        >>> collection.pin_taxids([511145])
+        >>> collection.evict_data_files(max_size=50e9)
+        """
+        return self._evict_data_files(max_size)
+
+    def _evict_data_files(self, max_size=None, protected=()):
+        if max_size is None:
+            max_size = self.max_data_size
+        if max_size is None:
+            raise ValueError(
+                "Provide a max_size, or set the collection's max_data_size."
+            )
+        protected = {(str(taxid), data_type) for taxid, data_type in protected}
+        grace_start = time.time() - self.eviction_grace_period
+        with self._taxid_file_lock("collection", "eviction"):
+            # The catalog's total counts hard-linked files several times,
+            # so a collection under it is under the limit.
+            if self._get_catalog().total_size() <= max_size:
+                return []
+            usage = self._get_data_usage()
+            inodes_sizes, inodes_links = {}, {}
+            for artifact in usage:
+                for inode, size in artifact["files"]:
+                    inodes_sizes[inode] = size
+                    inodes_links[inode] = inodes_links.get(inode, 0) + 1
+            total_size = sum(inodes_sizes.values())
+            evicted = []
+            for artifact in usage:
+                if total_size <= max_size:
+                    break
+                taxid, data_type = artifact["taxid"], artifact["data_type"]
+                if artifact["pinned"] or (artifact["tier"] is None):
+                    continue
+                if (taxid, data_type) in protected:
+                    continue
+                if artifact["last_access"] > grace_start:
+                    continue
+                if self._evict_artifact(taxid, data_type):
+                    self._log_message(
+                        "Evicted %s of taxid %s (%d bytes)"
+                        % (data_type, taxid, artifact["size"])
+                    )
+                    for inode, size in artifact.pop("files"):
+                        inodes_links[inode] -= 1
+                        if inodes_links[inode] == 0:
+                            total_size -= size
+                    evicted.append(artifact)
+        if evicted and self.deduplicate_assemblies:
+            self.clean_assembly_store()
+        return evicted
+
+    def _evict_artifact(self, taxid, data_type):
+        """Remove the files of an artifact, unless they are being created.
+
+        Return whether the files were removed.
+        """
+        lock_data_type = data_type
+        if data_type.endswith("_gz"):  # created with the uncompressed file
+            lock_data_type = data_type[: -len("_gz")]
+        lock = self._taxid_file_lock(taxid, lock_data_type)
+        lock.timeout = 0
+        if lock.is_locked():
+            return False
+        try:
+            lock.acquire()
+        except TimeoutError:
+            return False
+        try:
+            catalog = self._get_catalog()
+            data_types = [data_type, data_type + "_gzi"]
+            filenames = []
+            for companion_data_type in data_types:
+                entries = catalog.files(taxid, companion_data_type)
+                filenames += [entry["filename"] for entry in entries]
+            for filename in filenames:
+                path = os.path.join(self.data_dir, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+            catalog.remove_files(filenames)
+            record_path = self._build_record_path(taxid, data_type)
+            if os.path.exists(record_path):
+                os.remove(record_path)
+        finally:
+            lock.release()
+        return True
+
+    def _enforce_max_data_size(self, taxid, data_type):
+        """Evict data files if the collection exceeds its ``max_data_size``.
+
+        The TaxID's data file of this type, which was just created, is kept.
+        """
+        if self.max_data_size is not None:
+            self._evict_data_files(protected=[(taxid, data_type)])
+
+    def _gunzip_local_gz_file(self, taxid, data_type):
+        """Restore a TaxID's sequence file from its local gz file, if any.
+
+        Return True if the gz file of this data type (see attribute
+        ``keep_gz_files``) was found and decompressed to the data file (or
+        recompressed to BGZF, see ``sequence_storage``), False otherwise.
+        """
+        gz_data_type = data_type + "_gz"
+        if gz_data_type not in self.datafiles_extensions:
+            return False
+        gz_path = self.datafile_path(taxid, gz_data_type)
+        if not os.path.exists(gz_path):
+            return False
+        self._log_message(
+            "Unzipping the local gz file of TaxID %s %s." % (data_type, taxid)
+        )
+        stored_data_type = self._stored_data_type(data_type)
+        target_data_file = self.datafile_path(taxid, stored_data_type)
+        gunzip_backend = self._get_gunzip_backend()
+        if stored_data_type == data_type:
+            with atomic_write(target_data_file) as f:
+                gunzip_backend.gunzip_file(gz_path, f)
+        else:
+            with atomic_bgzf_write(
+                target_data_file, self.bgzf_compresslevel
+            ) as f:
+                gunzip_backend.gunzip_file(gz_path, f)
+            self._register_taxid_files(taxid, stored_data_type + "_gzi")
+        entries = self._get_catalog().files(taxid, gz_data_type)
+        source_md5 = entries[0]["source_md5"] if entries else None
+        self._register_taxid_files(
+            taxid, stored_data_type, source_md5=source_md5
+        )
+        return True
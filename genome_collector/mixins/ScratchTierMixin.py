@@ -0,0 +1,144 @@
+"""Mixin copying data files to a fast local directory in front of data_dir."""
+
+import os
+import shutil
+from contextlib import contextmanager
+
+from ..tools import atomic_link_or_copy
+
+
+class ScratchTierMixin:
+    """All methods are directly accessible to GenomeCollection instances."""
+
+    scratch_dir = None
+    max_scratch_size = None
+
+    def _get_scratch_collection(self):
+        """Return the collection of the scratch tier, or None.
+
+        This is a collection of the same class with ``scratch_dir`` as its
+        data directory, which never downloads anything: its files are copies
+        of the files of this collection. Its attributes (layout, storage,
+        locks, size limit) are updated from this collection at each call.
+        """
+        if self.scratch_dir is None:
+            return None
+        with self._scratch_lock:
+            scratch = self._scratch_collection
+            if (scratch is None) or (scratch.data_dir != self.scratch_dir):
+                scratch = type(self)(
+                    data_dir=self.scratch_dir, logger=self._logger
+                )
+                self._scratch_collection = scratch
+        scratch.scratch_dir = None
+        scratch.autodownload = False
+        scratch.compute_checksums = False
+        scratch.verify_on_read = False
+        scratch.messages_prefix = self.messages_prefix + "[scratch] "
+        for attribute in [
+            "data_layout",
+            "sequence_storage",
+            "lock_timeout",
+            "stale_lock_timeout",
+            "eviction_policy",
+            "eviction_grace_period",
+            "access_flush_interval",
+        ]:
+            setattr(scratch, attribute, getattr(self, attribute))
+        scratch.max_data_size = self.max_scratch_size
+        return scratch
+
+    def _scratch_tier_path(self, taxid, data_type, ready_extension=""):
+        """Return the path of a data file in the scratch tier.
+
+        The file (or all the files of a multi-file data type, or the BGZF
+        file with its .gzi index) is copied from the ``data_dir`` to the
+        ``scratch_dir`` if it is missing there, or if the copy is outdated
+        (size or modification time of the ready file differs). The copy is
+        made under a lock of the scratch tier, then the least used files of
+        the scratch tier are evicted if it exceeds ``max_scratch_size``.
+        Without ``scratch_dir``, the path in the ``data_dir`` is returned.
+        ``ready_extension`` is the extension of the file proving that a
+        multi-file data type is complete.
+        """
+        taxid = str(taxid)
+        path = self.datafile_path(taxid, data_type)
+        scratch = self._get_scratch_collection()
+        if scratch is None:
+            return path
+        scratch_path = scratch.datafile_path(taxid, data_type)
+
+        def is_fresh():
+            try:
+                stat = os.stat(path + ready_extension)
+                scratch_stat = os.stat(scratch_path + ready_extension)
+            except FileNotFoundError:
+                return False
+            return (stat.st_size, stat.st_mtime) == (
+                scratch_stat.st_size,
+                scratch_stat.st_mtime,
+            )
+
+        def copy():
+            self._log_message(
+                "Copying %s of taxid %s to the scratch directory"
+                % (data_type, taxid)
+            )
+            if data_type in self.multifile_data_types:
+                with scratch._atomic_multifile_build(
+                    taxid, data_type, ready_extension
+                ) as prefix:
+                    for source in self._data_type_files(path, data_type):
+                        shutil.copy2(source, prefix + source[len(path) :])
+                scratch._register_taxid_files(taxid, data_type)
+                return
+            # The .gzi index of BGZF files is copied before the file
+            for companion_data_type in [data_type + "_gzi", data_type]:
+                if companion_data_type not in self.datafiles_extensions:
+                    continue
+                source = self.datafile_path(taxid, companion_data_type)
+                if os.path.exists(source):
+                    atomic_link_or_copy(
+                        source,
+                        scratch.datafile_path(taxid, companion_data_type),
+                        hardlink=False,
+                    )
+                    scratch._register_taxid_files(taxid, companion_data_type)
+
+        scratch._single_flight(
+            taxid,
+            data_type,
+            scratch_path + ready_extension,
+            copy,
+            is_ready=is_fresh,
+        )
+        return scratch_path
+
+    @contextmanager
+    def _scratch_build(self, taxid, data_type, ready_extension, temp_dir):
+        """Yield the path prefix where to build a multi-file artifact.
+
+        Without ``scratch_dir``, this is a prefix in ``temp_dir`` (a
+        temporary folder of the ``data_dir``). Otherwise the artifact is
+        built in the scratch tier, which is faster than a network file
+        system, then its files are copied to ``temp_dir`` to be published
+        to the ``data_dir``, and kept in the scratch tier.
+        """
+        basename = os.path.basename(self.datafile_path(taxid, data_type))
+        scratch = self._get_scratch_collection()
+        if scratch is None:
+            yield os.path.join(temp_dir, basename)
+            return
+        with scratch._taxid_file_lock(taxid, data_type):
+            with scratch._atomic_multifile_build(
+                taxid, data_type, ready_extension
+            ) as prefix:
+                yield prefix
+                build_dir = os.path.dirname(prefix)
+                for name in os.listdir(build_dir):
+                    shutil.copy2(
+                        os.path.join(build_dir, name),
+                        os.path.join(temp_dir, name),
+                    )
+            scratch._register_taxid_files(taxid, data_type)
+        scratch._enforce_max_data_size(taxid, data_type)
@@ -0,0 +1,179 @@
+"""Mixin for random access to sequences, inherited by GenomeCollection."""
+
+import os
+from functools import partial
+
+from Bio.Seq import reverse_complement
+
+from ..FastaIndex import FastaIndex
+from ..TwoBitGenome import TwoBitGenome, write_twobit_file
+from ..tools import atomic_write
+
+
+class SequenceMixin:
+    """All methods are directly accessible to GenomeCollection instances."""
+
+    packing_chunk_size = 2 ** 22
+
+    def get_taxid_fasta_index(self, taxid):
+        """Return a FastaIndex of the TaxID's genomic FASTA file.
+
+        The index is stored next to the FASTA, in a samtools-compatible
+        ``[taxid]_genomic.fa.fai`` file (``[taxid]_genomic.fa.gz.fai`` for
+        BGZF files, see ``sequence_storage``), which is created (or
+        re-created if older than the FASTA) if needed, under the TaxID's
+        lock (see ``_single_flight``). The FASTA is downloaded if needed.
+        """
+        taxid = str(taxid)
+        self.get_taxid_genome_data_path(taxid, "genomic_fasta")
+        fasta_data_type = self._stored_data_type("genomic_fasta")
+        fasta_path = self.datafile_path(taxid, fasta_data_type)
+        index_data_type = fasta_data_type + "_index"
+        index_path = self.datafile_path(taxid, index_data_type)
+        fasta_mtime = os.path.getmtime(fasta_path)
+
+        def is_ready():
+            return os.path.exists(index_path) and (
+                os.path.getmtime(index_path) >= fasta_mtime
+            )
+
+        def build():
+            self._log_message("Indexing the genomic FASTA of %s" % taxid)
+            with self._open_data_file(taxid, "genomic_fasta") as f:
+                index = FastaIndex.from_fasta(f)
+            with atomic_write(index_path, mode="w") as f:
+                index.write(f)
+            self._register_taxid_files(taxid, index_data_type)
+            genome_size = sum(r.length for r in index.records.values())
+            self._get_catalog().update_genome_size(taxid, genome_size)
+            self._fasta_indexes[fasta_path] = (fasta_mtime, index)
+
+        self._single_flight(
+            taxid, index_data_type, index_path, build, is_ready=is_ready
+        )
+        if self._fasta_indexes.get(fasta_path, (None,))[0] != fasta_mtime:
+            index = FastaIndex.read(index_path)
+            self._fasta_indexes[fasta_path] = (fasta_mtime, index)
+        return self._fasta_indexes[fasta_path][1]
+
+    def get_taxid_subsequence(self, taxid, seq_id, start, end, strand=1):
+        """Return a subsequence (str) of a record of the TaxID's genome.
+
+        Only the requested bases are read from the genomic FASTA file, using
+        the index returned by ``get_taxid_fasta_index`` (for BGZF files, only
+        the blocks containing the bases are decompressed).
+
+        Parameters
+        ==========
+
+        taxid
+          TaxID (int or str) of the genome.
+
+        seq_id
+          ID of the record in the genomic FASTA, e.g. "NC_000913.3".
+
+        start, end
+          Coordinates of the subsequence in the record. These are 0-based,
+          with ``end`` excluded, like in Python slices.
+
+        strand
+          Either 1 or -1. When -1, the reverse-complement is returned.
+
+        Examples
+        ========
+
+        >>> collection.get_taxid_subsequence(511145, "NC_000913.3", 0, 20)
+        'AGCTTTTCATTCTGACTGCA'
+        """
+        return self.get_taxid_subsequences(
+            taxid, [(seq_id, start, end, strand)]
+        )[0]
+
+    def get_taxid_subsequences(self, taxid, intervals):
+        """Return a list of subsequences (str) of the TaxID's genome.
+
+        ``intervals`` is a list of (seq_id, start, end) or (seq_id, start,
+        end, strand) tuples, with the same meaning as the parameters of
+        ``get_taxid_subsequence``. The intervals are read record by record,
+        in the order of the file, and the sequences are returned in the order
+        of the intervals.
+        """
+        taxid = str(taxid)
+        index = self.get_taxid_fasta_index(taxid)
+        intervals = [
+            (i, (tuple(interval) + (1,))[:4])
+            for i, interval in enumerate(intervals)
+        ]
+        record_order = {name: i for i, name in enumerate(index.records)}
+
+        def reading_order(indexed_interval):
+            seq_id, start = indexed_interval[1][:2]
+            return (record_order.get(seq_id, -1), start)
+
+        results = [None for interval in intervals]
+        with self._open_data_file(
+            taxid, "genomic_fasta", random_access=True
+        ) as f:
+            for i, interval in sorted(intervals, key=reading_order):
+                seq_id, start, end, strand = interval
+                sequence = index.fetch(f, seq_id, start, end).decode()
+                if strand == -1:
+                    sequence = reverse_complement(sequence)
+                results[i] = sequence
+        return results
+
+    def get_taxid_packed_genome(self, taxid):
+        """Return a memory-mapped TwoBitGenome of the TaxID's genome.
+
+        The genome is stored in a ``[taxid]_genomic.2bit`` file (UCSC's 2bit
+        format: 2 bits per base, with tables of N and lowercase runs), which
+        is created from the genomic FASTA if needed. Several processes
+        opening the same packed genome share a single mapping in memory.
+        The FASTA is read and packed ``packing_chunk_size`` bases at a time
+        (4M by default), so records are never entirely in memory. The file
+        is created under the TaxID's lock (see ``_single_flight``), so
+        concurrent threads and processes pack the genome only once. This
+        requires NumPy.
+
+        Examples
+        ========
+
+        >>> with collection.get_taxid_packed_genome(511145) as genome:
+        >>>     buffer = genome.packed("NC_000913.3")
+        >>>     packed = numpy.frombuffer(buffer, dtype="uint8")
+        """
+        taxid = str(taxid)
+        path = self.datafile_path(taxid, "genomic_2bit")
+        self.get_taxid_genome_data_path(taxid, "genomic_fasta")
+        fasta_path = self.datafile_path(
+            taxid, self._stored_data_type("genomic_fasta")
+        )
+
+        def is_ready():
+            return os.path.exists(path) and (
+                os.path.getmtime(path) >= os.path.getmtime(fasta_path)
+            )
+
+        def build():
+            self._log_message("Packing the genome of taxid %s" % taxid)
+            index = self.get_taxid_fasta_index(taxid)
+            with self._open_data_file(
+                taxid, "genomic_fasta", random_access=True
+            ) as fasta_file:
+                records = [
+                    partial(
+                        index.fetch_chunks,
+                        fasta_file,
+                        name,
+                        self.packing_chunk_size,
+                    )
+                    for name in index.records
+                ]
+                with atomic_write(path) as f:
+                    write_twobit_file(records, list(index.records), f)
+            self._register_taxid_files(taxid, "genomic_2bit")
+
+        self._single_flight(
+            taxid, "genomic_2bit", path, build, is_ready=is_ready
+        )
+        return TwoBitGenome(path)
@@ -0,0 +1,209 @@
+"""Source of genome data: a local or HTTP mirror of NCBI's FTP site."""
+
+import threading
+from collections import namedtuple
+from pathlib import Path
+from urllib import request
+
+AssemblySummary = namedtuple(
+    "AssemblySummary",
+    [
+        "assembly_accession",
+        "taxid",
+        "species_taxid",
+        "organism_name",
+        "refseq_category",
+        "version_status",
+        "asm_name",
+        "ftp_path",
+    ],
+)
+
+PREFERRED_REFSEQ_CATEGORIES = ("reference genome", "representative genome")
+
+
+def _parse_assembly_summary(lines):
+    """Yield the AssemblySummary of each row of an assembly summary file.
+
+    ``lines`` is an iterable of (bytes) lines. The column names are taken
+    from the last comment line before the first row.
+    """
+    columns = None
+    for line in lines:
+        line = line.decode().rstrip("\r\n")
+        if line.startswith("#"):
+            columns = line.lstrip("#").strip().split("\t")
+            continue
+        if columns is None or not line:
+            continue
+        row = dict(zip(columns, line.split("\t")))
+        yield AssemblySummary(
+            *[row.get(field, "") for field in AssemblySummary._fields]
+        )
+
+
+class MirrorSource:
+    """Source reading a (partial) mirror of NCBI's genomes FTP folder.
+
+    The mirror follows the layout of https://ftp.ncbi.nlm.nih.gov/genomes:
+
+    - The assembly folders are at ``genomes/all/GCF/000/005/845/
+      GCF_000005845.2_ASM584v2/`` (with their "md5checksums.txt", which is
+      used to check the files).
+    - TaxIDs are matched to assemblies with the assembly summaries of
+      ``genomes/ASSEMBLY_REPORTS/`` (e.g. "assembly_summary_refseq.txt").
+
+    Only the assemblies (and files) needed have to be mirrored, e.g. with
+    ``rsync``. No request is made to NCBI, so this source can be used on
+    computers without internet access, with a mirror on a shared file
+    system or an internal HTTP server.
+
+    Parameters
+    ==========
+
+    root
+      Path or URL (file://, http://, https://...) of the folder containing
+      the mirror's "genomes" folder.
+
+    assembly_summaries
+      Names of the summary files of ``genomes/ASSEMBLY_REPORTS/`` to read,
+      in order of preference. Missing files are ignored. The summaries are
+      read once, at the first request, and kept in memory.
+
+    Examples
+    ========
+
+    >>> collection = GenomeCollection()
+    >>> collection.source = MirrorSource("/shared/ncbi_mirror/")
+    >>> collection.get_taxid_genome_data_path(511145)
+    """
+
+    def __init__(
+        self, root, assembly_summaries=("assembly_summary_refseq.txt",)
+    ):
+        if "://" not in root:
+            root = Path(root).resolve().as_uri()
+        self.root = root.rstrip("/")
+        self.assembly_summaries = assembly_summaries
+        self._assemblies = None
+        self._lock = threading.Lock()
+
+    def url(self, ncbi_path):
+        """Return the URL in the mirror of an NCBI genomes path or URL.
+
+        For instance "ftp://ftp.ncbi.nlm.nih.gov/genomes/all/GCF/..." (an
+        assembly's "ftp_path") becomes "[root]/genomes/all/GCF/...", and
+        "ASSEMBLY_REPORTS/x.txt" becomes
+        "[root]/genomes/ASSEMBLY_REPORTS/x.txt".
+        """
+        if "/genomes/" in ncbi_path:
+            ncbi_path = ncbi_path.split("/genomes/", 1)[1]
+        return "%s/genomes/%s" % (self.root, ncbi_path.lstrip("/"))
+
+    def _get_assemblies(self):
+        """Return the dicts {taxid: [assemblies]} and {species: [...]}."""
+        with self._lock:
+            if self._assemblies is None:
+                by_taxid, by_species_taxid = {}, {}
+                for name in self.assembly_summaries:
+                    url = self.url("ASSEMBLY_REPORTS/" + name)
+                    try:
+                        response = request.urlopen(url)
+                    except IOError:
+                        continue
+                    with response:
+                        for assembly in _parse_assembly_summary(response):
+                            by_taxid.setdefault(assembly.taxid, [])
+                            by_taxid[assembly.taxid].append(assembly)
+                            species = assembly.species_taxid
+                            by_species_taxid.setdefault(species, [])
+                            by_species_taxid[species].append(assembly)
+                self._assemblies = (by_taxid, by_species_taxid)
+        return self._assemblies
+
+    def get_taxid_assembly(self, taxid, assembly_id=None):
+        """Return the AssemblySummary of the TaxID's genome in the mirror.
+
+        The assemblies of the TaxID (or, if there are none, of the species
+        with this TaxID) are considered, and the latest versions are kept.
+        If several assemblies remain, the reference or representative genome
+        is selected. If there is none, an assembly_id (accession, e.g.
+        "GCF_000005845.2") must be provided. It can also be of the form "#1"
+        to select the first assembly (in alphabetical order of accessions).
+        """
+        taxid = str(taxid)
+        by_taxid, by_species_taxid = self._get_assemblies()
+        assemblies = by_taxid.get(taxid, by_species_taxid.get(taxid, []))
+        if len(assemblies) == 0:
+            raise IOError(
+                "Found no assembly for taxID %s in mirror %s"
+                % (taxid, self.root)
+            )
+        if assembly_id is not None:
+            assemblies = sorted(assemblies)
+            if assembly_id.startswith("#"):
+                return assemblies[int(assembly_id.strip("#"))]
+            for assembly in assemblies:
+                if assembly_id in (
+                    assembly.assembly_accession,
+                    assembly.assembly_accession.split(".")[0],
+                ):
+                    return assembly
+            raise ValueError(
+                "%s is not an assembly accession for taxID %s in mirror %s"
+                % (assembly_id, taxid, self.root)
+            )
+        latest = [a for a in assemblies if a.version_status == "latest"]
+        assemblies = latest or assemblies
+        if len(assemblies) > 1:
+            preferred = [
+                assembly
+                for assembly in assemblies
+                if assembly.refseq_category in PREFERRED_REFSEQ_CATEGORIES
+            ]
+            if len(preferred) == 1:
+                assemblies = preferred
+        if len(assemblies) > 1:
+            raise OSError(
+                "Found %d assemblies for taxID %s in mirror %s: %s. Provide "
+                "an assembly_id (accession, or index of the form '#0')."
+                % (
+                    len(assemblies),
+                    taxid,
+                    self.root,
+                    ", ".join(a.assembly_accession for a in assemblies),
+                )
+            )
+        return assemblies[0]
+
+    def get_taxid_infos(self, collection, taxid, assembly_id=None):
+        """Return the infos of the TaxID, from the assembly summaries.
+
+        The infos contain the assembly's accession (as "AssemblyID" and
+        "AssemblyAccession"), the organism name and the NCBI path of the
+        assembly folder ("AssemblyFtpPath"). See ``get_taxid_assembly`` for
+        the selection of the assembly.
+        """
+        message = "Getting infos for taxid %s from mirror %s"
+        collection._log_message(message % (taxid, self.root))
+        assembly = self.get_taxid_assembly(taxid, assembly_id)
+        return dict(
+            taxID=str(taxid),
+            ScientificName=assembly.organism_name,
+            AssemblyID=assembly.assembly_accession,
+            AssemblyAccession=assembly.assembly_accession,
+            AssemblyName=assembly.asm_name,
+            AssemblyFtpPath=assembly.ftp_path,
+        )
+
+    def download_taxid_genome_data(self, collection, taxid, data_type):
+        """Download the TaxID's data file from the mirror."""
+        infos = collection.get_taxid_infos(taxid)
+        ftp_path = infos.get("AssemblyFtpPath", "")
+        if ftp_path == "":
+            accession = infos.get("AssemblyAccession", None)
+            ftp_path = self.get_taxid_assembly(taxid, accession).ftp_path
+        basename = ftp_path.rstrip("/").split("/")[-1]
+        extension = collection.datafiles_extensions["%s_gz" % data_type]
+        url = "%s/%s%s" % (self.url(ftp_path), basename, extension)
+        collection._download_taxid_genome_data_from_url(taxid, data_type, url)
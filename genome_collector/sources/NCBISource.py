@@ -0,0 +1,33 @@
+"""Source of genome data: NCBI's Entrez API and FTP servers."""
+
+
+class NCBISource:
+    """Source obtaining infos from Entrez and data files from NCBI's FTP.
+
+    This is the default source of collections (when their ``source``
+    attribute is None). Sources are objects with two methods, which receive
+    the collection as first argument (so they can use its settings, logger
+    and download methods):
+
+    - ``get_taxid_infos(collection, taxid, assembly_id=None)`` returns the
+      dict of infos stored in the TaxID's infos file.
+    - ``download_taxid_genome_data(collection, taxid, data_type)`` writes
+      (and registers) the TaxID's data file of this type in the collection.
+
+    Examples
+    ========
+
+    >>> collection.source = NCBISource()
+    """
+
+    def get_taxid_infos(self, collection, taxid, assembly_id=None):
+        """Return the infos of the TaxID, from Entrez.
+
+        See ``collection.download_taxid_genome_infos_from_ncbi`` for the
+        meaning of ``assembly_id``.
+        """
+        return collection._get_taxid_infos_from_ncbi(taxid, assembly_id)
+
+    def download_taxid_genome_data(self, collection, taxid, data_type):
+        """Download the TaxID's data file from the NCBI FTP server."""
+        collection._download_taxid_genome_data(taxid, data_type)
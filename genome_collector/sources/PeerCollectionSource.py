@@ -0,0 +1,108 @@
+"""Source of genome data: the data directory of another collection."""
+
+import os
+import json
+import shutil
+from pathlib import Path
+
+from ..tools import CHUNK_SIZE, atomic_bgzf_write, atomic_link_or_copy
+
+
+class PeerCollectionSource:
+    """Source taking the files from the data directory of another collection.
+
+    This is useful to populate a collection from a collection on the same
+    machine (e.g. a shared lab collection on a network drive), without
+    downloading anything. Files are hard-linked when possible, so they take
+    no extra space, and copied otherwise.
+
+    If the peer collection stores the files in another form, they are
+    converted: plain files are compressed in BGZF (for a collection with
+    ``sequence_storage = "bgzf"``), and BGZF files or kept NCBI gz files are
+    decompressed. Only the infos and sequence files (genomic FASTA, GenBank,
+    GFF and protein FASTA) are taken from the peer: BLAST databases and
+    Bowtie indexes are built locally.
+
+    Parameters
+    ==========
+
+    data_dir
+      Data directory of the peer collection (which must be readable, and is
+      never modified).
+
+    hardlink
+      If False, files are always copied (so the two collections can be
+      modified independently, e.g. if files could be edited in place).
+
+    Examples
+    ========
+
+    >>> collection = GenomeCollection(data_dir="local_data")
+    >>> collection.source = PeerCollectionSource("/shared/genomes/")
+    >>> collection.get_taxid_genome_data_path(511145)
+    """
+
+    def __init__(self, data_dir, hardlink=True):
+        self.data_dir = data_dir
+        self.hardlink = hardlink
+
+    def _get_peer(self, collection):
+        return type(collection)(data_dir=self.data_dir, logger=None)
+
+    def get_taxid_infos(self, collection, taxid, assembly_id=None):
+        """Return the infos of the TaxID, from the peer's infos file.
+
+        ``assembly_id`` is ignored (the peer's assembly is used).
+        """
+        path = self._get_peer(collection).datafile_path(taxid, "infos")
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                "No infos for taxID %s in peer collection %s"
+                % (taxid, self.data_dir)
+            )
+        message = "Getting infos for taxid %s from peer collection %s"
+        collection._log_message(message % (taxid, self.data_dir))
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def download_taxid_genome_data(self, collection, taxid, data_type):
+        """Link, copy or convert the TaxID's data file of the peer."""
+        peer = self._get_peer(collection)
+        stored_data_type = collection._stored_data_type(data_type)
+        target = collection.datafile_path(taxid, stored_data_type)
+        candidates = [stored_data_type, data_type, data_type + "_bgzf"]
+        candidates.append(data_type + "_gz")
+        for peer_data_type in candidates:
+            if peer_data_type not in collection.datafiles_extensions:
+                continue
+            path = peer.datafile_path(taxid, peer_data_type)
+            if os.path.exists(path):
+                break
+        else:
+            raise FileNotFoundError(
+                "No %s data for taxID %s in peer collection %s"
+                % (data_type, taxid, self.data_dir)
+            )
+        message = "Getting %s data for taxid %s from peer collection %s"
+        collection._log_message(message % (data_type, taxid, self.data_dir))
+        if peer_data_type == stored_data_type:
+            atomic_link_or_copy(path, target, self.hardlink)
+            if os.path.exists(path + ".gzi"):
+                atomic_link_or_copy(
+                    path + ".gzi", target + ".gzi", self.hardlink
+                )
+        elif stored_data_type != data_type and peer_data_type == data_type:
+            with open(path, "rb") as f, atomic_bgzf_write(
+                target, collection.bgzf_compresslevel
+            ) as writer:
+                shutil.copyfileobj(f, writer, CHUNK_SIZE)
+        else:
+            # Decompress (and maybe recompress) a gzip or BGZF file
+            uri = Path(path).resolve().as_uri()
+            collection._download_taxid_genome_data_from_url(
+                taxid, data_type, uri
+            )
+            return
+        collection._register_taxid_files(taxid, stored_data_type)
+        if stored_data_type != data_type:
+            collection._register_taxid_files(taxid, stored_data_type + "_gzi")
@@ -0,0 +1,5 @@
+from .NCBISource import NCBISource
+from .MirrorSource import MirrorSource
+from .PeerCollectionSource import PeerCollectionSource
+
+__all__ = ["NCBISource", "MirrorSource", "PeerCollectionSource"]
@@ -0,0 +1,822 @@
+"""Generic helper functions used by the different mixins."""
+
+import os
+import json
+import time
+import asyncio
+import zlib
+import shutil
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import subprocess
+import http.client
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
+from urllib import request
+from urllib.error import HTTPError
+
+from .BgzfFile import BgzfFileWriter, write_gzi
+
+CHUNK_SIZE = 2 ** 20
+
+# wbits value making zlib accept gzip headers and trailers
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+@contextmanager
+def atomic_write(path, mode="wb"):
+    """Write to a temporary file which is renamed to ``path`` on success.
+
+    The temporary file is in the same directory as ``path`` (so the final
+    rename is atomic) and has a hidden name, so it is never mistaken for a
+    data file by the listing methods. If an exception occurs, the temporary
+    file is deleted and ``path`` is left untouched. The directory is created
+    if needed.
+
+    Examples
+    ========
+
+    >>> with atomic_write("genome.fa") as f:
+    >>>     f.write(b">record_1\\nATGC")
+    """
+    directory, basename = os.path.split(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory, prefix="." + basename + ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def atomic_link_or_copy(path, target, hardlink=True):
+    """Hard-link (or copy) a file to ``target``, through a hidden file.
+
+    The file is copied if ``hardlink`` is False or if the link fails (e.g.
+    the files are on different file systems).
+    """
+    directory, basename = os.path.split(os.path.abspath(target))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory, prefix="." + basename + ".", suffix=".tmp"
+    )
+    os.close(fd)
+    try:
+        os.remove(temp_path)
+        linked = False
+        if hardlink:
+            try:
+                os.link(path, temp_path)
+                linked = True
+            except OSError:
+                pass
+        if not linked:
+            shutil.copy2(path, temp_path)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+@contextmanager
+def atomic_bgzf_write(path, compresslevel=6):
+    """Write a BGZF file and its .gzi index (``path + ".gzi"``) atomically.
+
+    Yields a ``BgzfFileWriter``: the data written to it is compressed in
+    BGZF blocks. The index is written (atomically) before the BGZF file is
+    renamed, so a complete BGZF file always has its index.
+    """
+    with atomic_write(path) as f:
+        writer = BgzfFileWriter(f, compresslevel=compresslevel)
+        yield writer
+        writer.close()
+        with atomic_write(path + ".gzi") as gzi_file:
+            write_gzi(writer.block_offsets, gzi_file)
+
+
+@contextmanager
+def sqlite_connection(path):
+    """Yield a connection to a SQLite file, committed and closed at the end.
+
+    Changes are rolled back if an exception occurs.
+    """
+    connection = sqlite3.connect(path, timeout=60)
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def file_checksum(path, chunk_size=CHUNK_SIZE):
+    """Return a fast checksum of a file's content, e.g. "crc32:0a1b2c3d".
+
+    The checksum detects accidental corruptions (truncations, bit flips...)
+    and is computed at disk speed, but it is not a cryptographic hash.
+    """
+    checksum = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            checksum = zlib.crc32(chunk, checksum)
+    return "crc32:%08x" % checksum
+
+
+def file_hash(path, algorithm="sha256", chunk_size=CHUNK_SIZE):
+    """Return the hexadecimal hash of a file's content (SHA-256 default)."""
+    hasher = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def check_md5(md5, expected_md5, url):
+    """Raise an IOError if a (hashlib) md5 doesn't have the expected value."""
+    if (expected_md5 is not None) and (md5.hexdigest() != expected_md5):
+        raise IOError(
+            "MD5 checksum mismatch for the data downloaded from %s (got %s, "
+            "expected %s)" % (url, md5.hexdigest(), expected_md5)
+        )
+
+
+def partial_download_path(path):
+    """Return the (hidden) path of the incomplete download of a file.
+
+    The data downloaded so far is kept there, so an interrupted download
+    can be resumed later, even by another process.
+    """
+    directory, basename = os.path.split(path)
+    return os.path.join(directory, "." + basename + ".part")
+
+
+def _remove_if_empty(path):
+    if os.path.exists(path) and (os.path.getsize(path) == 0):
+        os.remove(path)
+
+
+def _open_url_range(url, start, end, timeout):
+    """Open a URL to read the bytes start:end (end=None for the file end).
+
+    A Range request is used. If the server ignores it and sends the whole
+    file, the first ``start`` bytes are skipped.
+    """
+    url_request = request.Request(url)
+    if start or (end is not None):
+        last_byte = "" if end is None else str(end - 1)
+        url_request.add_header("Range", "bytes=%d-%s" % (start, last_byte))
+    response = request.urlopen(url_request, timeout=timeout)
+    if start and (getattr(response, "status", None) != 206):
+        to_skip = start
+        while to_skip:
+            skipped = len(response.read(min(to_skip, CHUNK_SIZE)))
+            if not skipped:
+                response.close()
+                raise IOError("Data from %s is shorter than expected" % url)
+            to_skip -= skipped
+    return response
+
+
+def iter_url_chunks(
+    url,
+    start=0,
+    end=None,
+    max_retries=5,
+    retry_delay=1.0,
+    timeout=60,
+    chunk_size=CHUNK_SIZE,
+):
+    """Yield the bytes start:end of a URL's content, in chunks.
+
+    When the connection fails or is dropped, the download is resumed where
+    it stopped with a Range request, up to ``max_retries`` times in a row
+    (waiting ``retry_delay`` seconds before each retry). HTTP errors other
+    than server errors (5xx) are raised immediately.
+    """
+    position = start
+    failures = 0
+    while (end is None) or (position < end):
+        try:
+            with _open_url_range(url, position, end, timeout) as response:
+                while (end is None) or (position < end):
+                    chunk = response.read(chunk_size)
+                    if not chunk:
+                        # HTTP responses keep track of the bytes left to read
+                        if getattr(response, "length", None):
+                            raise IOError("Connection closed by the server")
+                        break
+                    if end is not None:
+                        chunk = chunk[: end - position]
+                    position += len(chunk)
+                    failures = 0
+                    yield chunk
+            if (end is not None) and (position < end):
+                raise IOError("Connection closed before the end of the data")
+            return
+        except HTTPError as err:
+            if (err.code == 416) and position and (end is None):
+                return  # Range starting at the end: nothing left to read
+            if err.code < 500:
+                raise
+            error = err
+        except (IOError, http.client.HTTPException) as err:
+            error = err
+        failures += 1
+        if failures > max_retries:
+            raise IOError(
+                "Download of %s failed after %d retries: %s"
+                % (url, max_retries, error)
+            )
+        time.sleep(retry_delay)
+
+
+def stream_gunzip_url(
+    url,
+    target_path,
+    gz_path=None,
+    md5=None,
+    progress_callback=None,
+    max_retries=5,
+    retry_delay=1.0,
+    chunk_size=CHUNK_SIZE,
+    gunzip_backend=None,
+    bgzf_compresslevel=None,
+):
+    """Download a gzipped file and decompress it on the fly into target_path.
+
+    The chunks are decompressed as they come off the response, so the
+    uncompressed file is written without ever re-reading the archive from
+    the disk. Gzip files made of several concatenated members are supported.
+
+    Dropped connections are resumed (see ``iter_url_chunks``). The
+    compressed data is also written to a partial file (see
+    ``partial_download_path``) so that if the download fails, a new call
+    only downloads the missing data (the partial file is decompressed again
+    from the disk, which is much faster than downloading).
+
+    Parameters
+    ==========
+
+    url
+      URL of the ``.gz`` file (any URL supported by ``urllib``).
+
+    target_path
+      Path of the uncompressed file to write. It is written atomically.
+
+    gz_path
+      If provided, the compressed data is also (atomically) saved there.
+
+    md5
+      Expected MD5 (hex string) of the compressed data. If the data doesn't
+      match, an IOError is raised and no file is written.
+
+    progress_callback
+      Function ``f(downloaded_bytes, total_bytes)`` called as the download
+      progresses. ``total_bytes`` is None when unknown.
+
+    max_retries, retry_delay
+      Maximal number of retries in a row when the connection fails, and
+      time in seconds to wait before each retry.
+
+    chunk_size
+      Number of compressed bytes read from the response at a time.
+
+    gunzip_backend
+      A ``GunzipBackend`` whose decompressors are used (they come from the
+      fastest available library by default).
+
+    bgzf_compresslevel
+      If provided, the target file is written compressed in BGZF blocks
+      with this compression level (see ``atomic_bgzf_write``).
+    """
+    if gunzip_backend is None:
+        from .GunzipBackend import GunzipBackend
+
+        gunzip_backend = GunzipBackend("auto")
+    if gz_path is None:
+        part_path = partial_download_path(target_path + ".gz")
+    else:
+        part_path = partial_download_path(gz_path)
+    try:
+        _stream_gunzip_url(
+            url,
+            target_path,
+            gz_path,
+            part_path,
+            md5,
+            progress_callback,
+            dict(max_retries=max_retries, retry_delay=retry_delay),
+            chunk_size,
+            gunzip_backend,
+            bgzf_compresslevel,
+        )
+    finally:
+        _remove_if_empty(part_path)
+
+
+def _stream_gunzip_url(
+    url,
+    target_path,
+    gz_path,
+    part_path,
+    md5,
+    progress_callback,
+    retry_params,
+    chunk_size,
+    gunzip_backend,
+    bgzf_compresslevel,
+):
+    with ExitStack() as stack:
+        if bgzf_compresslevel is None:
+            target = stack.enter_context(atomic_write(target_path))
+        else:
+            target = stack.enter_context(
+                atomic_bgzf_write(target_path, bgzf_compresslevel)
+            )
+        part = stack.enter_context(open(part_path, "ab+"))
+        state = dict(
+            decompressor=gunzip_backend.decompressobj(),
+            member_is_incomplete=False,
+        )
+        compressed_md5 = hashlib.md5()
+
+        def process(chunk):
+            compressed_md5.update(chunk)
+            while chunk:
+                state["member_is_incomplete"] = True
+                target.write(state["decompressor"].decompress(chunk))
+                chunk = b""
+                if state["decompressor"].eof:
+                    # End of a gzip member, another member may follow.
+                    state["member_is_incomplete"] = False
+                    chunk = state["decompressor"].unused_data
+                    state["decompressor"] = gunzip_backend.decompressobj()
+
+        def discard_partial_download(error):
+            part.close()
+            os.remove(part_path)
+            raise error
+
+        try:
+            # Data of a previous, interrupted download of this file
+            part.seek(0)
+            for chunk in iter(lambda: part.read(chunk_size), b""):
+                process(chunk)
+            downloaded = part.tell()
+            chunks = iter_url_chunks(
+                url, downloaded, chunk_size=chunk_size, **retry_params
+            )
+            for chunk in chunks:
+                part.write(chunk)
+                process(chunk)
+                downloaded += len(chunk)
+                if progress_callback is not None:
+                    progress_callback(downloaded, None)
+        except gunzip_backend.error as err:
+            message = "Invalid gzip data downloaded from %s: %s" % (url, err)
+            discard_partial_download(IOError(message))
+        if state["member_is_incomplete"]:
+            message = "Truncated gzip data downloaded from %s" % url
+            discard_partial_download(IOError(message))
+        try:
+            check_md5(compressed_md5, md5, url)
+        except IOError as err:
+            discard_partial_download(err)
+        part.close()
+        if gz_path is not None:
+            os.replace(part_path, gz_path)
+        else:
+            os.remove(part_path)
+
+
+def _get_url_size(url, timeout=60):
+    """Return the size of a URL's content (None if Ranges aren't allowed)."""
+    try:
+        url_request = request.Request(url, method="HEAD")
+        with request.urlopen(url_request, timeout=timeout) as response:
+            accept_ranges = response.headers.get("Accept-Ranges", "")
+            size = response.headers.get("Content-Length", None)
+    except (IOError, http.client.HTTPException):
+        return None
+    if (accept_ranges != "bytes") or (size is None):
+        return None
+    return int(size)
+
+
+def _download_segments(
+    url, part_path, total, n_segments, progress_callback, **retry_params
+):
+    """Download a URL into ``part_path`` in parallel segments.
+
+    The progress of each segment is saved in a JSON file next to the partial
+    file, so an interrupted segmented download can be resumed.
+    """
+    state_path = part_path + ".json"
+    if os.path.exists(state_path):
+        with open(state_path, "r") as f:
+            state = json.load(f)
+        total = state["total"]
+    else:
+        bounds = [total * i // n_segments for i in range(n_segments + 1)]
+        segments = [[s, e, s] for s, e in zip(bounds[:-1], bounds[1:])]
+        state = dict(total=total, segments=segments)
+        with open(part_path, "wb") as f:
+            f.truncate(total)
+    segments = state["segments"]
+    lock = threading.Lock()
+    downloaded = [sum(position - s for s, e, position in segments)]
+
+    def save_state():
+        with atomic_write(state_path, mode="w") as f:
+            json.dump(state, f)
+
+    save_state()
+
+    def download_segment(segment):
+        start, end, position = segment
+        last_save = position
+        with open(part_path, "r+b") as f:
+            f.seek(position)
+            for chunk in iter_url_chunks(url, position, end, **retry_params):
+                f.write(chunk)
+                with lock:
+                    segment[2] += len(chunk)
+                    downloaded[0] += len(chunk)
+                    if progress_callback is not None:
+                        progress_callback(downloaded[0], total)
+                    if segment[2] - last_save > 16 * CHUNK_SIZE:
+                        f.flush()
+                        save_state()
+                        last_save = segment[2]
+            f.flush()
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+            unfinished = [s for s in segments if s[2] < s[1]]
+            list(executor.map(download_segment, unfinished))
+    finally:
+        with lock:
+            save_state()
+    os.remove(state_path)
+
+
+def download_url(
+    url,
+    target_path,
+    md5=None,
+    segments=1,
+    progress_callback=None,
+    min_segment_size=16 * CHUNK_SIZE,
+    max_retries=5,
+    retry_delay=1.0,
+):
+    """Download a URL into a file, with resume and parallel segments.
+
+    The data is downloaded in a partial file (see ``partial_download_path``)
+    which is renamed to ``target_path`` once complete, so an interrupted
+    download is resumed by the next call. Dropped connections are resumed
+    as in ``iter_url_chunks``.
+
+    Parameters
+    ==========
+
+    url
+      URL of the file (any URL supported by ``urllib``).
+
+    target_path
+      Path of the file to write.
+
+    md5
+      Expected MD5 (hex string) of the data. If the data doesn't match, an
+      IOError is raised and the partial file is deleted.
+
+    segments
+      Number of segments of the file downloaded in parallel (with Range
+      requests). Only used if the server supports Range requests and the
+      file is bigger than ``segments * min_segment_size``.
+
+    progress_callback
+      Function ``f(downloaded_bytes, total_bytes)`` called as the download
+      progresses. ``total_bytes`` is None when unknown.
+
+    min_segment_size
+      Minimal size of the segments in bytes.
+
+    max_retries, retry_delay
+      Maximal number of retries in a row when a connection fails, and time
+      in seconds to wait before each retry.
+    """
+    part_path = partial_download_path(target_path)
+    retry_params = dict(max_retries=max_retries, retry_delay=retry_delay)
+    total = None
+    if os.path.exists(part_path + ".json"):  # interrupted segmented download
+        segments = 2
+    elif segments > 1:
+        total = _get_url_size(url)
+        if (total is None) or (total < segments * min_segment_size):
+            segments = 1
+    try:
+        if segments > 1:
+            _download_segments(
+                url,
+                part_path,
+                total,
+                segments,
+                progress_callback,
+                **retry_params
+            )
+        else:
+            with open(part_path, "ab") as f:
+                downloaded = f.tell()
+                chunks = iter_url_chunks(url, downloaded, **retry_params)
+                for chunk in chunks:
+                    f.write(chunk)
+                    downloaded += len(chunk)
+                    if progress_callback is not None:
+                        progress_callback(downloaded, total)
+    finally:
+        _remove_if_empty(part_path)
+    if md5 is not None:
+        downloaded_md5 = hashlib.md5()
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                downloaded_md5.update(chunk)
+        try:
+            check_md5(downloaded_md5, md5, url)
+        except IOError:
+            os.remove(part_path)
+            raise
+    os.replace(part_path, target_path)
+
+
+@contextmanager
+def _monitored_process(
+    name,
+    parameters,
+    stdout,
+    timeout,
+    cancel_event,
+    stderr_tail_lines,
+    stdin_file=None,
+):
+    """Start a process, yield it, then wait for it and check its exit code.
+
+    Only the last ``stderr_tail_lines`` lines of stderr are kept (for error
+    messages). A watcher thread kills the process if the ``timeout`` (in
+    seconds) is reached or the ``cancel_event`` (a ``threading.Event``) is
+    set, in which case a TimeoutError or an InterruptedError is raised. The
+    content of ``stdin_file`` (a binary file handle), if any, is piped to
+    the process's stdin by a feeder thread.
+    """
+    process = subprocess.Popen(
+        parameters,
+        stdin=None if stdin_file is None else subprocess.PIPE,
+        stdout=stdout,
+        stderr=subprocess.PIPE,
+    )
+    stderr_tail = deque(maxlen=stderr_tail_lines)
+    stderr_reader = threading.Thread(
+        target=stderr_tail.extend, args=(process.stderr,), daemon=True
+    )
+    stderr_reader.start()
+    feeder_errors = []
+    feeder = None
+    if stdin_file is not None:
+
+        def feed():
+            try:
+                shutil.copyfileobj(stdin_file, process.stdin, CHUNK_SIZE)
+            except BrokenPipeError:
+                pass  # the process stopped reading, its exit code tells why
+            except Exception as err:
+                feeder_errors.append(err)
+                process.kill()
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+    stop_watching = threading.Event()
+    kill_reasons = []
+
+    def watch():
+        deadline = None if timeout is None else time.time() + timeout
+        while not stop_watching.wait(0.05):
+            if process.poll() is not None:
+                return
+            if (cancel_event is not None) and cancel_event.is_set():
+                error = InterruptedError("%s was cancelled" % name)
+            elif (deadline is not None) and (time.time() > deadline):
+                message = "%s timed out after %ss" % (name, timeout)
+                error = TimeoutError(message)
+            else:
+                continue
+            kill_reasons.append(error)
+            process.kill()
+            return
+
+    watcher = None
+    if (timeout is not None) or (cancel_event is not None):
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+    try:
+        yield process
+        process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        stop_watching.set()
+        if watcher is not None:
+            watcher.join()
+        if feeder is not None:
+            feeder.join()
+        stderr_reader.join()
+        for stream in (process.stdout, process.stderr):
+            if stream is not None:
+                stream.close()
+    if kill_reasons:
+        raise kill_reasons[0]
+    if feeder_errors:
+        raise feeder_errors[0]
+    if process.returncode:
+        error = b"".join(stderr_tail).decode(errors="replace")
+        parameters = " ".join(parameters)
+        raise OSError("%s failed:\n\n%s\n\n%s" % (name, error, parameters))
+
+
+def run_process(
+    name,
+    parameters,
+    stdout_path=None,
+    timeout=None,
+    cancel_event=None,
+    stderr_tail_lines=100,
+    stdin_file=None,
+):
+    """Run a process. Raise an OSError with the end of stderr if it fails.
+
+    Parameters
+    ==========
+
+    name
+      Name of the process, used in error messages.
+
+    parameters
+      List of the executable and its arguments.
+
+    stdout_path
+      If None, the stdout of the process is returned (as bytes). Otherwise
+      the stdout is written directly to this file, and never held in memory.
+      Use ``os.devnull`` to discard it.
+
+    timeout
+      Maximal running time in seconds, after which the process is killed and
+      a TimeoutError is raised.
+
+    cancel_event
+      A ``threading.Event`` which, when set (e.g. by another thread), kills
+      the process and raises an InterruptedError.
+
+    stderr_tail_lines
+      Number of lines of stderr kept for the error messages.
+
+    stdin_file
+      A binary file handle (e.g. of a decompressed file) whose content is
+      streamed to the stdin of the process.
+    """
+    with ExitStack() as stack:
+        if stdout_path is None:
+            stdout = subprocess.PIPE
+        else:
+            stdout = stack.enter_context(open(stdout_path, "wb"))
+        with _monitored_process(
+            name,
+            parameters,
+            stdout,
+            timeout,
+            cancel_event,
+            stderr_tail_lines,
+            stdin_file=stdin_file,
+        ) as process:
+            if stdout_path is None:
+                output = process.stdout.read()
+    return output if stdout_path is None else None
+
+
+def iter_process_lines(
+    name, parameters, timeout=None, cancel_event=None, stderr_tail_lines=100
+):
+    """Run a process and yield the lines (bytes) of its stdout as they come.
+
+    The parameters are the same as in ``run_process``. The errors are raised
+    once all lines have been read. Closing the generator kills the process.
+
+    Examples
+    ========
+
+    >>> for line in iter_process_lines("BLAST", ["blastn", ...]):
+    >>>     print (line.decode().split("\\t"))
+    """
+    with _monitored_process(
+        name,
+        parameters,
+        subprocess.PIPE,
+        timeout,
+        cancel_event,
+        stderr_tail_lines,
+    ) as process:
+        for line in process.stdout:
+            yield line
+
+
+async def run_process_async(
+    name,
+    parameters,
+    stdout_path=None,
+    timeout=None,
+    stderr_tail_lines=100,
+    stdin_file=None,
+):
+    """Run a process from asyncio code (without blocking the event loop).
+
+    The parameters are the same as in ``run_process``. Cancelling the task
+    running this coroutine kills the process. The ``stdin_file`` is read in
+    the loop's default executor.
+    """
+    with ExitStack() as stack:
+        if stdout_path is None:
+            stdout = asyncio.subprocess.PIPE
+        else:
+            stdout = stack.enter_context(open(stdout_path, "wb"))
+        process = await asyncio.create_subprocess_exec(
+            *parameters,
+            stdin=None if stdin_file is None else asyncio.subprocess.PIPE,
+            stdout=stdout,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stderr_tail = deque(maxlen=stderr_tail_lines)
+
+        async def write_stdin():
+            if stdin_file is None:
+                return
+            loop = asyncio.get_running_loop()
+            try:
+                while True:
+                    chunk = await loop.run_in_executor(
+                        None, stdin_file.read, CHUNK_SIZE
+                    )
+                    if not chunk:
+                        break
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the process stopped reading, its exit code tells why
+            finally:
+                process.stdin.close()
+
+        async def read_stderr():
+            incomplete_line = b""
+            while True:
+                chunk = await process.stderr.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                lines = (incomplete_line + chunk).split(b"\n")
+                incomplete_line = lines.pop()
+                stderr_tail.extend(line + b"\n" for line in lines)
+            stderr_tail.append(incomplete_line)
+
+        async def read_stdout():
+            if stdout_path is None:
+                return await process.stdout.read()
+
+        try:
+            output, _, _ = await asyncio.wait_for(
+                asyncio.gather(read_stdout(), read_stderr(), write_stdin()),
+                timeout,
+            )
+            await process.wait()
+        except BaseException as err:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            if isinstance(err, asyncio.TimeoutError):
+                raise TimeoutError("%s timed out after %ss" % (name, timeout))
+            raise
+    if process.returncode:
+        error = b"".join(stderr_tail).decode(errors="replace")
+        parameters = " ".join(parameters)
+        raise OSError("%s failed:\n\n%s\n\n%s" % (name, error, parameters))
+    return output
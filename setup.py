@@ -15,4 +15,5 @@ setup(
     license='MIT',
     keywords="NCBI genomes TaxID BLAST Bowtie",
     packages=find_packages(exclude='docs'),
-    install_requires=['appdirs', 'Biopython', 'proglog'])
+    install_requires=['appdirs', 'Biopython', 'proglog'],
+    extras_require={'packed': ['numpy'], 'fast': ['isal']})
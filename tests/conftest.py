@@ -0,0 +1,123 @@
+import os
+import sys
+import gzip
+import stat
+import hashlib
+
+import pytest
+
+ASSEMBLY_SUMMARY_COLUMNS = [
+    "assembly_accession",
+    "bioproject",
+    "refseq_category",
+    "taxid",
+    "species_taxid",
+    "organism_name",
+    "version_status",
+    "asm_name",
+    "ftp_path",
+]
+
+# (accession, refseq_category, taxid, species_taxid, status, asm_name)
+ASSEMBLIES = [
+    ("GCF_000005845.2", "reference genome", "511145", "562", "latest",
+     "ASM584v2"),
+    ("GCF_000005845.1", "na", "511145", "562", "replaced", "ASM584v1"),
+    ("GCF_000008865.2", "na", "386585", "562", "latest", "ASM886v2"),
+    ("GCF_000001111.1", "na", "999", "999", "latest", "ASM111v1"),
+    ("GCF_000002222.1", "na", "999", "999", "latest", "ASM222v1"),
+]
+
+FASTA = b">record_1 a record\nATGCATGCAA\nTTGC\n>record_2\nGGGCCC\n"
+PROTEIN_FASTA = b">protein_1\nMKLV\n"
+
+
+def _ftp_path(accession, asm_name):
+    digits = accession[4:13]
+    return "/".join(
+        [
+            "https://ftp.ncbi.nlm.nih.gov/genomes/all",
+            accession[:3],
+            digits[:3],
+            digits[3:6],
+            digits[6:9],
+            accession + "_" + asm_name,
+        ]
+    )
+
+
+@pytest.fixture
+def ncbi_mirror(tmpdir):
+    """Create a mirror of a few NCBI assemblies, with their summary."""
+    root = os.path.join(str(tmpdir), "mirror")
+    reports_dir = os.path.join(root, "genomes", "ASSEMBLY_REPORTS")
+    os.makedirs(reports_dir)
+    lines = [
+        "#   See ftp://ftp.ncbi.nlm.nih.gov/genomes/README_assembly_summary",
+        "# " + "\t".join(ASSEMBLY_SUMMARY_COLUMNS),
+    ]
+    for accession, category, taxid, species, status, name in ASSEMBLIES:
+        ftp_path = _ftp_path(accession, name)
+        row = [accession, "PRJNA1", category, taxid, species]
+        row += ["Organism " + taxid, status, name, ftp_path]
+        lines.append("\t".join(row))
+        folder = ftp_path.split("/genomes/")[1]
+        folder = os.path.join(root, "genomes", folder)
+        os.makedirs(folder)
+        basename = os.path.basename(folder)
+        checksums = []
+        for extension, data in [
+            ("_genomic.fna.gz", FASTA),
+            ("_protein.faa.gz", PROTEIN_FASTA),
+        ]:
+            gz_data = gzip.compress(data)
+            with open(os.path.join(folder, basename + extension), "wb") as f:
+                f.write(gz_data)
+            md5 = hashlib.md5(gz_data).hexdigest()
+            checksums.append("%s  ./%s%s" % (md5, basename, extension))
+        with open(os.path.join(folder, "md5checksums.txt"), "w") as f:
+            f.write("\n".join(checksums) + "\n")
+    path = os.path.join(reports_dir, "assembly_summary_refseq.txt")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return root
+
+
+# Fake programs logging their arguments, and creating the files proving
+# that the database/index is complete.
+FAKE_PROGRAM = """#!PYTHON
+import os, sys, time
+with open(os.environ["BUILD_LOG"], "a") as f:
+    f.write(" ".join(sys.argv) + "\\n")
+time.sleep(0.05)
+args = sys.argv[1:]
+if "-out" in args:
+    out = args[args.index("-out") + 1] + ".nsq"
+else:
+    out = args[-1] + (".1.ebwt" if "bowtie-build" in sys.argv[0] else ".1.bt2")
+with open(out, "w") as f:
+    f.write("index")
+"""
+
+
+@pytest.fixture
+def fake_build_programs(tmpdir, monkeypatch):
+    """Put fake makeblastdb and bowtie(2)-build programs in the PATH."""
+    bin_dir = os.path.join(str(tmpdir), "bin")
+    os.mkdir(bin_dir)
+    for name in ["makeblastdb", "bowtie-build", "bowtie2-build"]:
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(FAKE_PROGRAM.replace("PYTHON", sys.executable))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", bin_dir + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("BUILD_LOG", os.path.join(str(tmpdir), "build.log"))
+
+
+def read_build_log():
+    """Return the command lines of the fake build programs, in order."""
+    path = os.environ["BUILD_LOG"]
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return f.read().splitlines()
@@ -0,0 +1,96 @@
+import os
+
+from genome_collector import GenomeCollection, MirrorSource
+
+from conftest import FASTA, read_build_log
+
+MIRROR_FASTA_GZ = os.path.join(
+    "genomes",
+    "all",
+    "GCF",
+    "000",
+    "005",
+    "845",
+    "GCF_000005845.2_ASM584v2",
+    "GCF_000005845.2_ASM584v2_genomic.fna.gz",
+)
+
+
+def new_collection(tmpdir, ncbi_mirror):
+    data_dir = os.path.join(str(tmpdir), "data")
+    collection = GenomeCollection(data_dir=data_dir, logger=None)
+    collection.source = MirrorSource(ncbi_mirror)
+    collection.deduplicate_assemblies = True
+    return collection
+
+
+def test_deduplicate_assemblies(tmpdir, ncbi_mirror, fake_build_programs):
+    collection = new_collection(tmpdir, ncbi_mirror)
+
+    # TaxIDs 511145 and 562 (species) have the same assembly
+    path = collection.get_taxid_genome_data_path(511145)
+    os.remove(os.path.join(ncbi_mirror, MIRROR_FASTA_GZ))
+    other_path = collection.get_taxid_genome_data_path(562)
+    assert os.path.samefile(path, other_path)
+    with open(other_path, "rb") as f:
+        assert f.read() == FASTA
+
+    # The index of the assembly is built once, the BLAST databases (with
+    # their TaxIDs) once per TaxID
+    for taxid in [511145, 562]:
+        collection.get_taxid_blastdb_path(taxid, "nucl")
+        collection.get_taxid_bowtie_index_path(taxid, "2")
+    assert len(read_build_log()) == 3
+    index_paths = [
+        collection.datafile_path(taxid, "bowtie2_index") + ".1.bt2"
+        for taxid in ["511145", "562"]
+    ]
+    assert os.path.samefile(*index_paths)
+    collection.generate_bowtie_index_for_taxid(562, "2")
+    assert len(read_build_log()) == 3
+    catalog = collection._get_catalog()
+    assert len(catalog.files(taxid="562")) == 4  # infos, fasta, db, index
+
+    # The store keeps the files until no TaxID uses them
+    collection.remove_all_taxid_files(511145)
+    assert os.path.exists(other_path)
+    assert collection.clean_assembly_store() == []
+    collection.remove_all_taxid_files(562)
+    store_dir = collection._metadata_path("assemblies")
+    assert os.listdir(store_dir) == []
+
+
+def test_combined_blast_db_of_deduplicated_taxids(
+    tmpdir, ncbi_mirror, fake_build_programs
+):
+    collection = new_collection(tmpdir, ncbi_mirror)
+    collection.generate_combined_blast_db([511145, 562], "panel")
+    db_paths = [
+        collection.datafile_path(taxid, "blast_nucl")
+        for taxid in ["511145", "562"]
+    ]
+    assert not os.path.samefile(*[path + ".nsq" for path in db_paths])
+    builds = [args.split() for args in read_build_log()]
+    taxids = [args[args.index("-taxid") + 1] for args in builds]
+    assert sorted(taxids) == ["511145", "562"]
+
+
+def test_deduplicate_local_files(tmpdir):
+    data_dir = os.path.join(str(tmpdir), "data")
+    collection = GenomeCollection(data_dir=data_dir, logger=None)
+    collection.autodownload = False
+    for taxid, data in [("1", FASTA), ("2", FASTA), ("3", FASTA + b"A\n")]:
+        path = collection.datafile_path(taxid, "genomic_fasta")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    collection.rebuild_catalog()
+    assert collection.deduplicate_local_files() == len(FASTA)
+    paths = [
+        collection.datafile_path(taxid, "genomic_fasta")
+        for taxid in ["1", "2", "3"]
+    ]
+    assert os.path.samefile(paths[0], paths[1])
+    assert not os.path.samefile(paths[0], paths[2])
+    assert collection.verify_collection() == {}
+    assert collection.deduplicate_local_files() == 0
@@ -0,0 +1,150 @@
+import os
+import io
+import sys
+import gzip
+import stat
+import time
+import asyncio
+from pathlib import Path
+
+import pytest
+from Bio import Entrez
+
+from genome_collector import AsyncGenomeCollection, GenomeCollection
+from genome_collector.tools import run_process_async
+
+TAXID = "12345"
+
+# Fake makeblastdb creating the database files, and counting its calls
+FAKE_MAKEBLASTDB = """#!PYTHON
+import sys, time
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+with open(args["-in"] + ".builds", "a") as f:
+    f.write("build\\n")
+time.sleep(0.3)
+for extension in [".nhr", ".nin", ".nsq"]:
+    with open(args["-out"] + extension, "w") as f:
+        f.write(args["-taxid"])
+"""
+
+
+@pytest.fixture
+def fake_makeblastdb(tmpdir, monkeypatch):
+    bin_dir = os.path.join(str(tmpdir), "bin")
+    os.mkdir(bin_dir)
+    path = os.path.join(bin_dir, "makeblastdb")
+    with open(path, "w") as f:
+        f.write(FAKE_MAKEBLASTDB.replace("PYTHON", sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", bin_dir + os.pathsep + os.environ["PATH"])
+
+
+class FakeDownloaderCollection(AsyncGenomeCollection):
+    """Collection downloading a local file, and counting the downloads."""
+
+    n_downloads = 0
+
+    async def _aget_taxid_assembly_url_from_ncbi(self, taxid, data_type):
+        self.n_downloads += 1
+        await asyncio.sleep(0.2)
+        source = Path(self.data_dir, "..", "genome.fna.gz")
+        return source.resolve().as_uri()
+
+
+def make_collection(tmpdir):
+    with gzip.open(str(tmpdir.join("genome.fna.gz")), "wb") as f:
+        f.write(b">record_1\nATGCATGC\n")
+    data_dir = str(tmpdir.mkdir("data"))
+    return FakeDownloaderCollection(data_dir=data_dir, logger=None)
+
+
+def test_concurrent_coroutines_share_downloads_and_builds(
+    tmpdir, fake_makeblastdb
+):
+    collection = make_collection(tmpdir)
+
+    async def main():
+        return await asyncio.gather(
+            *(
+                [collection.aget_taxid_genome_data_path(TAXID)]
+                + [
+                    collection.aget_taxid_blastdb_path(TAXID, "nucl")
+                    for i in range(4)
+                ]
+            )
+        )
+
+    fasta_path, *db_paths = asyncio.run(main())
+    assert collection.n_downloads == 1
+    with open(fasta_path + ".builds", "r") as f:
+        assert len(f.readlines()) == 1
+    assert len(set(db_paths)) == 1
+    assert os.path.exists(db_paths[0] + ".nsq")
+
+    # The files are shared with synchronous collections
+    sync_collection = GenomeCollection(collection.data_dir, logger=None)
+    assert sync_collection.get_taxid_blastdb_path(TAXID, "nucl") == db_paths[0]
+    assert sync_collection.list_locally_available_taxids("blast_nucl") == [
+        TAXID
+    ]
+
+
+def test_async_entrez_requests_are_rate_limited(tmpdir, monkeypatch):
+    collection = AsyncGenomeCollection(str(tmpdir), logger=None)
+    collection.time_between_entrez_requests = 0.05
+    collection.use_entrez_cache = False
+    monkeypatch.setattr(Entrez, "read", lambda handle, validate: handle.read())
+
+    def fake_request(i):
+        return io.BytesIO(b"response %d" % i)
+
+    async def main():
+        return await asyncio.gather(
+            *[
+                collection._aget_data_from_entrez(fake_request, i=i)
+                for i in range(8)
+            ]
+        )
+
+    start_time = time.time()
+    responses = asyncio.run(main())
+    assert time.time() - start_time > 7 * 0.05 - 0.01
+    assert responses == [b"response %d" % i for i in range(8)]
+
+
+def test_run_process_async(tmpdir):
+    python = sys.executable
+
+    async def main():
+        output = await run_process_async(
+            "echo", [python, "-c", "print('hello')"]
+        )
+        assert output.strip() == b"hello"
+        with pytest.raises(OSError) as excinfo:
+            await run_process_async(
+                "failing", [python, "-c", "import sys; sys.exit('Oh no')"]
+            )
+        assert "Oh no" in str(excinfo.value)
+        with pytest.raises(TimeoutError):
+            await run_process_async(
+                "sleeper", [python, "-c", "import time; time.sleep(10)"],
+                timeout=0.3,
+            )
+        output_path = str(tmpdir.join("output.txt"))
+        await run_process_async(
+            "echo",
+            [python, "-c", "print('hi')"],
+            stdout_path=output_path,
+        )
+        with open(output_path, "r") as f:
+            assert f.read().strip() == "hi"
+        output = await run_process_async(
+            "count",
+            [python, "-c", "import sys; print(len(sys.stdin.buffer.read()))"],
+            stdin_file=io.BytesIO(3_000_000 * b"A"),
+        )
+        assert output.strip() == b"3000000"
+
+    start_time = time.time()
+    asyncio.run(main())
+    assert time.time() - start_time < 5
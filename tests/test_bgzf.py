@@ -0,0 +1,169 @@
+import io
+import os
+import sys
+import gzip
+import stat
+import random
+from pathlib import Path
+
+import pytest
+from Bio import bgzf
+from Bio.Seq import Seq
+
+from genome_collector import GenomeCollection
+from genome_collector.BgzfFile import (
+    BgzfFile,
+    BgzfFileWriter,
+    read_gzi,
+    write_gzi,
+)
+
+TAXID = "12345"
+
+# Fake programs saving the FASTA data they get (from a file or stdin), and
+# creating the files proving that the database/index is complete.
+FAKE_MAKEBLASTDB = """#!PYTHON
+import sys
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+if args["-in"] == "-":
+    data = sys.stdin.buffer.read()
+else:
+    with open(args["-in"], "rb") as f:
+        data = f.read()
+with open(args["-out"] + ".nsq", "wb") as f:
+    f.write(data)
+with open(args["-out"] + ".nhr", "w") as f:
+    f.write(args.get("-title", ""))
+"""
+
+FAKE_BOWTIE_BUILD = """#!PYTHON
+import sys
+fasta_path, index_path = sys.argv[1:]
+with open(fasta_path, "rb") as f:
+    data = f.read()
+with open(index_path + ".1.ebwt", "wb") as f:
+    f.write(data)
+"""
+
+
+@pytest.fixture
+def fake_programs(tmpdir, monkeypatch):
+    bin_dir = os.path.join(str(tmpdir), "bin")
+    os.mkdir(bin_dir)
+    for name, script in [
+        ("makeblastdb", FAKE_MAKEBLASTDB),
+        ("bowtie-build", FAKE_BOWTIE_BUILD),
+    ]:
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(script.replace("PYTHON", sys.executable))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", bin_dir + os.pathsep + os.environ["PATH"])
+
+
+def random_fasta(records=(("chr1", 150_000), ("chr2", 7), ("chr3", 80_000))):
+    rng = random.Random(123)
+    sequences = {}
+    lines = []
+    for name, length in records:
+        sequence = "".join(rng.choice("ATGC") for i in range(length))
+        sequences[name] = sequence
+        lines.append(">%s description" % name)
+        lines += [sequence[i : i + 70] for i in range(0, length, 70)]
+    return sequences, ("\n".join(lines) + "\n").encode()
+
+
+def test_bgzf_file_random_access(tmpdir):
+    data = os.urandom(500_000)
+    path = str(tmpdir.join("data.gz"))
+    with open(path, "wb") as f:
+        writer = BgzfFileWriter(f)
+        for i in range(0, len(data), 33_333):
+            writer.write(data[i : i + 33_333])
+        writer.close()
+    with open(path + ".gzi", "wb") as f:
+        write_gzi(writer.block_offsets, f)
+
+    # BGZF files are gzip files, readable by Biopython's BGZF module
+    with open(path, "rb") as f:
+        assert gzip.decompress(f.read()) == data
+    with bgzf.open(path, "rb") as f:
+        assert f.read(len(data)) == data
+
+    rng = random.Random(123)
+    with io.BufferedReader(BgzfFile(path)) as f:
+        for i in range(100):
+            start = rng.randint(0, len(data))
+            end = rng.randint(start, min(len(data), start + 200_000))
+            f.seek(start)
+            assert f.read(end - start) == data[start:end]
+        f.seek(len(data) - 5)
+        assert f.read(10) == data[-5:]
+
+    # Without .gzi, the offsets are computed from the blocks headers
+    block_offsets = read_gzi(path + ".gzi")
+    assert len(block_offsets) == len(data) // 0xFF00
+    os.remove(path + ".gzi")
+    with BgzfFile(path) as f:
+        assert f._get_block_offsets()[1:] == block_offsets
+
+
+@pytest.mark.parametrize("stream_downloads", [True, False])
+def test_bgzf_sequence_storage(tmpdir, fake_programs, stream_downloads):
+    sequences, fasta_data = random_fasta()
+    source_path = str(tmpdir.join("source.fna.gz"))
+    with open(source_path, "wb") as f:
+        f.write(gzip.compress(fasta_data))
+    data_dir = str(tmpdir.join("data"))
+    collection = GenomeCollection(data_dir=data_dir, logger=None)
+    collection.sequence_storage = "bgzf"
+    collection.stream_downloads = stream_downloads
+    collection.check_ncbi_md5 = False
+    collection._get_taxid_assembly_url_from_ncbi = lambda taxid, data_type: (
+        Path(source_path).as_uri()
+    )
+
+    path = collection.get_taxid_genome_data_path(TAXID)
+    assert path.endswith("_genomic.fa.gz")
+    with open(path, "rb") as f:
+        assert gzip.decompress(f.read()) == fasta_data
+    with collection.open_taxid_genome_data(TAXID) as f:
+        assert f.read() == fasta_data
+
+    records = collection.get_taxid_biopython_records(TAXID, "genomic_fasta")
+    assert [str(r.seq) for r in records] == list(sequences.values())
+    intervals = [("chr1", 0, 150_000), ("chr3", 1000, 70_000, -1)]
+    intervals += [("chr2", 2, 5), ("chr1", 69_990, 70_010)]
+    subsequences = collection.get_taxid_subsequences(TAXID, intervals)
+    assert subsequences[0] == sequences["chr1"]
+    assert subsequences[2] == sequences["chr2"][2:5]
+    assert subsequences[3] == sequences["chr1"][69_990:70_010]
+    chr3_part = sequences["chr3"][1000:70_000]
+    assert subsequences[1] == str(Seq(chr3_part).reverse_complement())
+
+    # makeblastdb gets the FASTA data through a pipe
+    db_path = collection.get_taxid_blastdb_path(TAXID, "nucl")
+    with open(db_path + ".nsq", "rb") as f:
+        assert f.read() == fasta_data
+    with open(db_path + ".nhr", "r") as f:
+        assert f.read() == TAXID + "_genomic.fa"
+
+    # bowtie-build gets a temporary uncompressed file
+    index_path = collection.get_taxid_bowtie_index_path(TAXID)
+    with open(index_path + ".1.ebwt", "rb") as f:
+        assert f.read() == fasta_data
+
+    assert sorted(os.listdir(data_dir)) == [
+        ".genome_collector",
+        TAXID + "_bowtie1.1.ebwt",
+        TAXID + "_genomic.fa.gz",
+        TAXID + "_genomic.fa.gz.fai",
+        TAXID + "_genomic.fa.gz.gzi",
+        TAXID + "_nucl.nhr",
+        TAXID + "_nucl.nsq",
+    ]
+    assert collection.verify_collection() == {}
+    data_types = {
+        entry["data_type"] for entry in collection._get_catalog().files()
+    }
+    assert "genomic_fasta_bgzf_gzi" in data_types
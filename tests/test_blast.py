@@ -1,4 +1,5 @@
 import os
+import pytest
 from genome_collector import GenomeCollection
 
 PHAGE_TAXID = "697289"
@@ -32,4 +33,26 @@ def test_blast_against_taxid(tmpdir):
         ["blastn", "-query", queries_file, "-out", blast_results_file],
     )
     file_size = os.stat(blast_results_file).st_size
-    assert 1200 > file_size > 800
\ No newline at end of file
+    assert 1200 > file_size > 800
+
+def test_generate_combined_blast_db(tmpdir):
+    collection = GenomeCollection(data_dir=str(tmpdir), logger=None)
+    built_taxids = []
+
+    def fake_generate_blast_db_for_taxid(taxid, db_type):
+        built_taxids.append(taxid)
+        path = collection.datafile_path(taxid, "blast_" + db_type)
+        with open(path + ".nsq", "w") as f:
+            f.write("fake database")
+
+    collection.generate_blast_db_for_taxid = fake_generate_blast_db_for_taxid
+    with pytest.raises(FileNotFoundError):
+        collection.get_combined_blastdb_path("panel")
+    path = collection.generate_combined_blast_db(["1", "2"], "panel")
+    assert path == collection.get_combined_blastdb_path("panel")
+    with open(path + ".nal", "r") as f:
+        assert 'DBLIST "1_nucl" "2_nucl"\n' in f.read()
+    collection.generate_combined_blast_db(["1", "2", "3"], "panel")
+    assert built_taxids == ["1", "2", "3"]
+    with open(path + ".nal", "r") as f:
+        assert 'DBLIST "1_nucl" "2_nucl" "3_nucl"\n' in f.read()
@@ -0,0 +1,158 @@
+import os
+import time
+import asyncio
+import threading
+
+import pytest
+
+from genome_collector import GenomeCollection, AsyncGenomeCollection
+from genome_collector.BuildScheduler import BuildScheduler
+
+from conftest import read_build_log
+
+TAXIDS = ["111", "222", "333"]
+
+
+@pytest.fixture
+def collection(tmpdir, fake_build_programs):
+    collection = GenomeCollection(data_dir=os.path.join(str(tmpdir), "data"))
+    collection.autodownload = False
+    for taxid in TAXIDS:
+        path = collection.datafile_path(taxid, "genomic_fasta")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(">chr1\nATGCATGC\n")
+    return collection
+
+
+def test_build_scheduler():
+    scheduler = BuildScheduler(cpus=4, memory=100)
+    usages, running = [], [0]
+    lock = threading.Lock()
+
+    def job(cpus, memory):
+        with scheduler.reserve(cpus, memory):
+            with lock:
+                running[0] += 1
+                usages.append(
+                    (running[0], scheduler.used_cpus, scheduler.used_memory)
+                )
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+    # (8, 500) is more than the budget: it runs alone, with the whole budget
+    jobs = [(1, 10)] * 6 + [(2, 60)] * 2 + [(8, 500)]
+    threads = [threading.Thread(target=job, args=args) for args in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(usages) == len(jobs)
+    assert all((cpus <= 4) and (memory <= 100) for _, cpus, memory in usages)
+    assert 1 < max(n_running for n_running, _, _ in usages) <= 4
+    assert scheduler.used_cpus == scheduler.used_memory == 0
+
+    async def ajobs():
+        async def ajob():
+            async with scheduler.areserve(cpus=3):
+                assert scheduler.used_cpus == 3
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*[ajob() for _ in range(3)])
+
+    asyncio.run(ajobs())
+    assert scheduler.used_cpus == 0
+
+
+def test_build_indexes(collection):
+    collection.build_cpu_budget = 4
+    collection.build_threads = 2
+    collection.blast_max_file_size = "1GB"
+    report = collection.build_indexes(
+        TAXIDS + ["444"], ["blast_nucl", "bowtie1_index", "bowtie2_index"]
+    )
+    assert len(report) == 12
+    for entry in report:
+        if entry["taxid"] == "444":
+            assert isinstance(entry["error"], FileNotFoundError)
+        else:
+            assert entry["error"] is None
+            assert entry["path"] == collection.datafile_path(
+                entry["taxid"], entry["data_type"]
+            )
+    log = read_build_log()
+    assert len(log) == 9
+    for line in log:
+        if "makeblastdb" in line:
+            assert "-max_file_sz 1GB" in line
+        else:
+            assert "--threads 2" in line
+
+    # Existing indexes are not built again
+    collection.build_indexes(TAXIDS, ["blast_nucl"], rebuild_outdated=True)
+    assert len(read_build_log()) == 9
+
+
+def test_skip_up_to_date_builds(collection):
+    taxid = TAXIDS[0]
+    collection.generate_blast_db_for_taxid(taxid)
+    collection.generate_bowtie_index_for_taxid(taxid)
+    assert len(read_build_log()) == 2
+
+    # Same input and parameters
+    collection.generate_blast_db_for_taxid(taxid)
+    collection.generate_bowtie_index_for_taxid(taxid)
+    assert len(read_build_log()) == 2
+
+    # The number of threads doesn't change the index
+    collection.build_threads = 4
+    collection.generate_bowtie_index_for_taxid(taxid)
+    assert len(read_build_log()) == 2
+
+    # Same content in a newer file
+    fasta_path = collection.datafile_path(taxid, "genomic_fasta")
+    stats = os.stat(fasta_path)
+    os.utime(fasta_path, (stats.st_atime + 10, stats.st_mtime + 10))
+    collection.generate_blast_db_for_taxid(taxid)
+    assert len(read_build_log()) == 2
+
+    # New parameters
+    collection.blast_max_file_size = "2GB"
+    collection.generate_blast_db_for_taxid(taxid)
+    assert len(read_build_log()) == 3
+
+    # New content
+    with open(fasta_path, "a") as f:
+        f.write(">chr2\nTTTT\n")
+    collection.generate_blast_db_for_taxid(taxid)
+    collection.generate_bowtie_index_for_taxid(taxid)
+    assert len(read_build_log()) == 5
+
+    # Deleted index
+    db_path = collection.get_taxid_blastdb_path(taxid, "nucl")
+    os.remove(db_path + ".nsq")
+    collection.generate_blast_db_for_taxid(taxid)
+    assert len(read_build_log()) == 6
+
+
+def test_async_builds_use_the_budget(collection):
+    async_collection = AsyncGenomeCollection(data_dir=collection.data_dir)
+    async_collection.build_scheduler = BuildScheduler(cpus=1)
+    async_collection.build_threads = 3
+
+    async def build():
+        await asyncio.gather(
+            *[
+                async_collection.aget_taxid_bowtie_index_path(taxid, "2")
+                for taxid in TAXIDS
+            ]
+        )
+        await async_collection.agenerate_bowtie_index_for_taxid(
+            TAXIDS[0], "2"
+        )
+
+    asyncio.run(build())
+    log = read_build_log()
+    assert len(log) == 3
+    assert all("--threads 3" in line for line in log)
@@ -19,7 +19,7 @@ def test_command_line_genome(tmpdir):
         data_dir,
     ]
     GenomeCollection.run_process("test_command_line_genome", args)
-    assert len(os.listdir(data_dir)) == 3
+    assert len(os.listdir(data_dir)) == 4  # incl. .genome_collector/
 
 
 def test_command_line_blast_db(tmpdir):
@@ -36,7 +36,7 @@ def test_command_line_blast_db(tmpdir):
         data_dir,
     ]
     GenomeCollection.run_process("test_command_line_blast_db", args)
-    assert len(os.listdir(data_dir)) == 6
+    assert len(os.listdir(data_dir)) == 7  # incl. .genome_collector/
 
 
 def test_command_line_bowtie(tmpdir):
@@ -51,4 +51,4 @@ def test_command_line_bowtie(tmpdir):
         data_dir,
     ]
     GenomeCollection.run_process("test_command_line_bowtie", args)
-    assert len(os.listdir(data_dir)) == 9
+    assert len(os.listdir(data_dir)) == 10  # incl. .genome_collector/
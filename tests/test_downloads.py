@@ -0,0 +1,186 @@
+import os
+import io
+import gzip
+import json
+import hashlib
+import time
+import threading
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+from Bio import Entrez
+from genome_collector import GenomeCollection
+
+TAXID = "12345"
+BASES_TABLE = bytes(b"ACGT"[i % 4] for i in range(256))
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server(tmpdir):
+    """Serve the files of a temporary directory over HTTP."""
+    served_dir = os.path.join(str(tmpdir), "served")
+    os.mkdir(served_dir)
+    handler = functools.partial(QuietHandler, directory=served_dir)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = "http://127.0.0.1:%d/" % server.server_address[1]
+    yield served_dir, url
+    server.shutdown()
+    server.server_close()
+
+
+def write_synthetic_genome_gz(path, n_records=3, record_size=4_000_000):
+    """Write a large gzip made of one gzip member per FASTA record."""
+    expected_content = b""
+    with open(path, "wb") as f:
+        for i in range(n_records):
+            sequence = os.urandom(record_size).translate(BASES_TABLE)
+            record = b">record_%d\n%s\n" % (i, sequence)
+            expected_content += record
+            f.write(gzip.compress(record, compresslevel=1))
+    return expected_content
+
+
+def make_collection(tmpdir, url):
+    data_dir = os.path.join(str(tmpdir), "data")
+    os.mkdir(data_dir)
+    collection = GenomeCollection(data_dir=data_dir, logger=None)
+    collection._get_taxid_assembly_url_from_ncbi = lambda taxid, data_type: (
+        url + "genome.fna.gz"
+    )
+    return collection
+
+
+@pytest.mark.parametrize("stream_downloads", [True, False])
+@pytest.mark.parametrize("keep_gz_files", [True, False])
+def test_download_genome_data(
+    tmpdir, http_server, stream_downloads, keep_gz_files
+):
+    served_dir, url = http_server
+    gz_path = os.path.join(served_dir, "genome.fna.gz")
+    expected_content = write_synthetic_genome_gz(gz_path)
+    collection = make_collection(tmpdir, url)
+    collection.stream_downloads = stream_downloads
+    collection.keep_gz_files = keep_gz_files
+    collection.download_taxid_genome_data_from_ncbi(TAXID, "genomic_fasta")
+    path = collection.datafile_path(TAXID, "genomic_fasta")
+    with open(path, "rb") as f:
+        assert f.read() == expected_content
+    local_gz_path = collection.datafile_path(TAXID, "genomic_fasta_gz")
+    assert os.path.exists(local_gz_path) == keep_gz_files
+    assert collection.list_locally_available_taxids("genomic_fasta") == [TAXID]
+    assert collection.list_locally_available_taxids("genomic_fasta_gz") == (
+        [TAXID] if keep_gz_files else []
+    )
+
+
+def test_truncated_download_leaves_no_file(tmpdir, http_server):
+    served_dir, url = http_server
+    gz_path = os.path.join(served_dir, "genome.fna.gz")
+    write_synthetic_genome_gz(gz_path, n_records=1)
+    with open(gz_path, "rb+") as f:
+        f.truncate(os.path.getsize(gz_path) // 2)
+    collection = make_collection(tmpdir, url)
+    with pytest.raises(IOError) as excinfo:
+        collection.download_taxid_genome_data_from_ncbi(TAXID, "genomic_fasta")
+    assert "Truncated" in str(excinfo.value)
+    assert os.listdir(collection.data_dir) == [".genome_collector"]
+
+
+def test_prefetch(tmpdir, http_server):
+    served_dir, url = http_server
+    for taxid in ["1", "2"]:
+        gz_path = os.path.join(served_dir, taxid + "_genome.fna.gz")
+        write_synthetic_genome_gz(gz_path, n_records=1, record_size=1000)
+    collection = make_collection(tmpdir, url)
+
+    def fake_download_infos(taxids):
+        for taxid in taxids:
+            if taxid != "4":
+                path = collection.datafile_path(taxid, "infos")
+                with open(path, "w") as f:
+                    json.dump({"taxID": taxid}, f)
+        return {"4": OSError("No AssemblyID found for taxID 4!")}
+
+    collection.download_taxids_infos_from_ncbi = fake_download_infos
+    collection._get_taxid_assembly_url_from_ncbi = lambda taxid, data_type: (
+        url + taxid + "_genome.fna.gz"
+    )
+    report = collection.prefetch(
+        ["1", 2, "3", "4"], data_types=["infos", "genomic_fasta"]
+    )
+    assert [(e["taxid"], e["data_type"]) for e in report] == [
+        (taxid, data_type)
+        for taxid in "1234"
+        for data_type in ["infos", "genomic_fasta"]
+    ]
+    errors = [e["taxid"] for e in report if e["error"] is not None]
+    assert errors == ["3", "4", "4"]  # TaxID 3 has no genome file served.
+    for entry in report:
+        if entry["error"] is None:
+            assert os.path.exists(entry["path"])
+
+
+def test_entrez_throttle_is_shared_between_threads(tmpdir, monkeypatch):
+    collection = GenomeCollection(data_dir=str(tmpdir), logger=None)
+    collection.time_between_entrez_requests = 0.05
+    collection.use_entrez_cache = False
+    monkeypatch.setattr(Entrez, "read", lambda handle, validate: handle.read())
+    call_times = []
+
+    def fake_request():
+        call_times.append(time.time())
+        return io.BytesIO(b"response")
+
+    threads = [
+        threading.Thread(
+            target=lambda: [
+                collection._get_data_from_entrez(fake_request)
+                for i in range(3)
+            ]
+        )
+        for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    call_times = sorted(call_times)
+    assert len(call_times) == 12
+    assert call_times[-1] - call_times[0] > 11 * 0.05 - 0.01
+
+
+@pytest.mark.parametrize("stream_downloads", [True, False])
+def test_download_is_checked_against_ncbi_md5(
+    tmpdir, http_server, stream_downloads
+):
+    served_dir, url = http_server
+    gz_path = os.path.join(served_dir, "genome.fna.gz")
+    write_synthetic_genome_gz(gz_path, n_records=1, record_size=1000)
+    with open(gz_path, "rb") as f:
+        md5 = hashlib.md5(f.read()).hexdigest()
+    md5_path = os.path.join(served_dir, "md5checksums.txt")
+    with open(md5_path, "w") as f:
+        f.write("%s  ./other_file.gz\n" % ("0" * 32))
+        f.write("%s  ./genome.fna.gz\n" % ("0" * 32))
+    collection = make_collection(tmpdir, url)
+    collection.stream_downloads = stream_downloads
+    with pytest.raises(IOError) as excinfo:
+        collection.download_taxid_genome_data_from_ncbi(TAXID, "genomic_fasta")
+    assert "MD5 checksum mismatch" in str(excinfo.value)
+    assert os.listdir(collection.data_dir) == [".genome_collector"]
+
+    with open(md5_path, "w") as f:
+        f.write("%s  ./genome.fna.gz\n" % md5)
+    collection.download_taxid_genome_data_from_ncbi(TAXID, "genomic_fasta")
+    [entry] = collection._get_catalog().files(TAXID, "genomic_fasta")
+    assert entry["source_md5"] == md5
+    assert entry["checksum"].startswith("crc32:")
+    assert collection.verify_collection() == {}
@@ -0,0 +1,70 @@
+import io
+import os
+import json
+
+import pytest
+from Bio import Entrez
+from genome_collector import GenomeCollection
+from genome_collector.EntrezCache import EntrezCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def test_entrez_cache_ttl_and_eviction(tmpdir):
+    clock = FakeClock()
+    path = os.path.join(str(tmpdir), "cache.sqlite")
+    cache = EntrezCache(path, ttl=100, max_size=25, clock=clock.time)
+    cache.set("a", b"0123456789")
+    clock.now += 1
+    cache.set("b", b"0123456789")
+    assert cache.get("a") == b"0123456789"  # "a" is now the most recent.
+    clock.now += 1
+    cache.set("c", b"0123456789")
+    assert cache.get("b") is None  # evicted
+    assert cache.get("a") == b"0123456789"
+    clock.now += 200
+    assert cache.get("a") is None  # outdated
+    assert cache.get("a", ignore_ttl=True) == b"0123456789"
+
+    # The cache is persistent
+    assert EntrezCache(path).get("c") == b"0123456789"
+
+
+def test_assembly_url_resolution_is_cached(tmpdir, monkeypatch):
+    monkeypatch.setattr(
+        Entrez, "read", lambda handle, validate: json.loads(handle.read())
+    )
+    collection = GenomeCollection(data_dir=str(tmpdir), logger=None)
+    collection.entrez_rate_limiter = type("Unlimited", (), {})()
+    collection.entrez_rate_limiter.acquire = lambda: None
+    with open(collection.datafile_path("1", "infos"), "w") as f:
+        json.dump({"AssemblyID": "201"}, f)
+    entrez_calls = []
+
+    def esummary(db, id, retmode):
+        entrez_calls.append((db, id))
+        summary = dict(FtpPath_RefSeq="ftp://ncbi/GCF_1", FtpPath_GenBank="")
+        data = {"DocumentSummarySet": {"DocumentSummary": [summary]}}
+        return io.BytesIO(json.dumps(data).encode())
+
+    monkeypatch.setattr(Entrez, "esummary", esummary)
+    for data_type in ["genomic_fasta", "genomic_genbank", "protein_fasta"]:
+        url = collection._get_taxid_assembly_url_from_ncbi("1", data_type)
+        assert url.startswith("https://ncbi/GCF_1/GCF_1_")
+    assert entrez_calls == [("assembly", "201")]
+
+    # In offline mode, a new collection only uses the cache
+    collection = GenomeCollection(data_dir=str(tmpdir), logger=None)
+    collection.entrez_offline = True
+    url = collection._get_taxid_assembly_url_from_ncbi("1", "genomic_gff")
+    assert url == "https://ncbi/GCF_1/GCF_1_genomic.gff.gz"
+    assert len(entrez_calls) == 1
+    with pytest.raises(IOError) as excinfo:
+        collection._get_data_from_entrez(Entrez.esummary, db="genome", id="1")
+    assert "offline mode" in str(excinfo.value)
@@ -0,0 +1,167 @@
+import os
+
+import pytest
+from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Bio.SeqFeature import SeqFeature, FeatureLocation, CompoundLocation
+
+from genome_collector import GenomeCollection
+from genome_collector.tools import atomic_bgzf_write
+
+PRODUCT = " ".join(4 * ["a protein with a very long name"])
+
+GFF = "\n".join(
+    [
+        "##gff-version 3",
+        "\t".join(
+            ["rec%201.1", "RefSeq", "gene", "190", "255", ".", "+", "."]
+            + ["ID=gene-b0001;Name=thrL;locus_tag=b0001"]
+        ),
+        "\t".join(
+            ["rec%201.1", "RefSeq", "CDS", "190", "255", ".", "+", "0"]
+            + ["ID=cds-1;gene=thrL;locus_tag=b0001;product=leader%3Bpeptide"]
+        ),
+        "\t".join(
+            ["rec2.1", "RefSeq", "CDS", "10", "40", ".", "-", "0"]
+            + ["ID=cds-2;gene=thrA;locus_tag=b0002"]
+        ),
+        "##FASTA",
+        ">rec 1.1",
+        "ATGC",
+    ]
+)
+
+
+def write_genbank(path):
+    records = []
+    for record_id, length in [("REC1.1", 600), ("REC2.1", 300)]:
+        record = SeqRecord(
+            Seq("ATGC" * (length // 4)),
+            id=record_id,
+            name=record_id.split(".")[0],
+            annotations={"molecule_type": "DNA"},
+        )
+        records.append(record)
+    qualifiers = dict(gene=["thrL"], locus_tag=["b0001"])
+    cds_qualifiers = dict(qualifiers, product=[PRODUCT])
+    cds_qualifiers["translation"] = ["MK" * 50]
+    records[0].features = [
+        SeqFeature(FeatureLocation(0, 600, 1), type="source"),
+        SeqFeature(
+            FeatureLocation(189, 255, 1), type="gene", qualifiers=qualifiers
+        ),
+        SeqFeature(
+            FeatureLocation(189, 255, 1), type="CDS", qualifiers=cds_qualifiers
+        ),
+        SeqFeature(
+            FeatureLocation(336, 500, -1),
+            type="CDS",
+            qualifiers=dict(gene=["thrA"], locus_tag=["b0002"]),
+        ),
+    ]
+    records[1].features = [
+        SeqFeature(
+            CompoundLocation(
+                [FeatureLocation(9, 20, -1), FeatureLocation(99, 120, -1)]
+            ),
+            type="CDS",
+            qualifiers=dict(locus_tag=["b0003"], note=["/gene=\"fake\""]),
+        ),
+    ]
+    SeqIO.write(records, path, "genbank")
+    return records
+
+
+@pytest.fixture
+def collection(tmpdir):
+    collection = GenomeCollection(data_dir=os.path.join(str(tmpdir), "data"))
+    collection.autodownload = False
+    return collection
+
+
+@pytest.mark.parametrize("sequence_storage", ["plain", "bgzf"])
+def test_genbank_features(collection, sequence_storage):
+    path = collection.datafile_path(511145, "genomic_genbank")
+    os.makedirs(os.path.dirname(path))
+    records = write_genbank(path)
+    if sequence_storage == "bgzf":
+        with open(path, "rb") as f:
+            data = f.read()
+        os.remove(path)
+        collection.sequence_storage = "bgzf"
+        bgzf_path = collection.datafile_path(511145, "genomic_genbank_bgzf")
+        with atomic_bgzf_write(bgzf_path) as f:
+            f.write(data)
+
+    # Same features as Biopython
+    features = collection.get_taxid_features(511145)
+    expected = [
+        (record.id, f.location.start, f.location.end, f.location.strand)
+        + (f.type,)
+        for record in records
+        for f in record.features
+    ]
+    assert sorted(tuple(f[:5]) for f in features) == sorted(expected)
+    cds = collection.get_taxid_features(
+        511145, gene="thrL", feature_type="CDS"
+    )
+    assert len(cds) == 1
+    assert cds[0].locus_tag == "b0001"
+    assert cds[0].product == PRODUCT.strip()
+    feature = collection.get_taxid_features(511145, locus_tag="b0003")[0]
+    assert (feature.gene, feature.strand) == (None, -1)
+
+    # Region queries
+    def region(record_id, start, end):
+        return [
+            (f.type, f.locus_tag)
+            for f in collection.get_taxid_features(
+                511145, record_id, start, end
+            )
+        ]
+
+    assert region("REC1.1", 250, 340) == [
+        ("source", None),
+        ("gene", "b0001"),
+        ("CDS", "b0001"),
+        ("CDS", "b0002"),
+    ]
+    assert region("REC1.1", 255, 336) == [("source", None)]
+    assert region("REC2.1", 50, 60) == [("CDS", "b0003")]
+    assert region("REC2.1", 120, 300) == []
+    with pytest.raises(ValueError):
+        collection.get_taxid_features(511145, start=0, end=10)
+
+
+def test_gff_features(collection):
+    path = collection.datafile_path(511145, "genomic_gff")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write(GFF)
+    index = collection.get_taxid_feature_index(511145, "genomic_gff")
+    assert index.record_ids() == ["rec 1.1", "rec2.1"]
+    features = index.query(record_id="rec 1.1", start=250, end=260)
+    assert [(f.type, f.gene, f.start, f.end) for f in features] == [
+        ("gene", "thrL", 189, 255),
+        ("CDS", "thrL", 189, 255),
+    ]
+    assert features[1].product == "leader;peptide"
+    (feature,) = index.query(locus_tag="b0002")
+    assert (feature.record_id, feature.strand) == ("rec2.1", -1)
+
+    # The index is rebuilt when the content of the file changes, whatever
+    # its modification time
+    index_path = collection.datafile_path(511145, "genomic_gff_feature_index")
+    index_mtime = os.path.getmtime(index_path)
+    stats = os.stat(path)
+    os.utime(path, (stats.st_atime + 10, stats.st_mtime + 10))
+    collection.get_taxid_feature_index(511145, "genomic_gff")
+    assert os.path.getmtime(index_path) == index_mtime
+    with open(path, "w") as f:
+        f.write(GFF.replace("b0002", "b0004"))
+    os.utime(path, (stats.st_atime, stats.st_mtime - 10))
+    features = collection.get_taxid_features(
+        511145, locus_tag="b0004", source_type="genomic_gff"
+    )
+    assert len(features) == 1
@@ -63,4 +63,219 @@ def test_autodownload_false(tmpdir):
 
     with pytest.raises(FileNotFoundError) as excinfo:
         collection.get_taxid_genome_data_path("224308")
-    assert "No genome" in str(excinfo.value)
\ No newline at end of file
+    assert "No genome" in str(excinfo.value)
+
+def create_files(data_dir, filenames):
+    for filename in filenames:
+        content = "data"
+        if filename.endswith(".json"):
+            content = '{"ScientificName": "%s"}' % filename
+        elif filename.endswith(".fai"):
+            content = "chr1\t4\t6\t4\t5\n"
+        with open(os.path.join(data_dir, filename), "w") as f:
+            f.write(content)
+
+
+def test_catalog(tmpdir):
+    data_dir = str(tmpdir)
+    create_files(
+        data_dir,
+        [
+            "1.json",
+            "1_genomic.fa",
+            "1_genomic.fa.fai",
+            "1_nucl.nsq",
+            "1_nucl.nhr",
+            "2.json",
+            "2_bowtie1.rev.1.ebwt",
+            "2_genomic.fa.tmp",
+            "notes.txt",
+        ],
+    )
+    collection = GenomeCollection(data_dir=data_dir, logger=None)
+    # The catalog is created from a scan of the pre-existing data_dir
+    assert collection.list_locally_available_taxids() == ["1", "2"]
+    assert collection.list_locally_available_taxids("genomic_fasta") == ["1"]
+    assert collection.list_locally_available_taxids("blast_nucl") == ["1"]
+    assert collection.list_locally_available_taxids("bowtie1_index") == ["2"]
+
+    # Files written by Genome Collector are registered in the catalog
+    collection._write_taxid_infos("3", {"ScientificName": "Some name"})
+    assert collection.list_locally_available_taxids() == ["1", "2", "3"]
+    assert collection.list_locally_available_taxids_names()["3"] == "Some name"
+
+    # Files added by other means are found after a rebuild
+    create_files(data_dir, ["4.json"])
+    assert collection.list_locally_available_taxids() == ["1", "2", "3"]
+    collection.rebuild_catalog()
+    assert collection.list_locally_available_taxids() == ["1", "2", "3", "4"]
+
+    # Files missing from the catalog are removed too
+    create_files(data_dir, ["1_protein.fa", "1_bowtie2.1.bt2"])
+    removed_files = collection.remove_all_taxid_files(1)
+    assert sorted(removed_files) == [
+        "1.json",
+        "1_bowtie2.1.bt2",
+        "1_genomic.fa",
+        "1_genomic.fa.fai",
+        "1_nucl.nhr",
+        "1_nucl.nsq",
+        "1_protein.fa",
+    ]
+    collection.remove_all_local_data_files()
+    assert collection.list_locally_available_taxids() == []
+    assert sorted(os.listdir(data_dir)) == [
+        ".genome_collector",
+        "2_genomic.fa.tmp",
+        "notes.txt",
+    ]
+
+
+def test_query_local_taxids(tmpdir):
+    collection = GenomeCollection(data_dir=str(tmpdir), logger=None)
+    for taxid, name, kingdom in [
+        ("1", "Escherichia coli", "Bacteria"),
+        ("2", "Saccharomyces cerevisiae", "Eukaryota"),
+        ("3", "Bacillus subtilis 100%", "Bacteria"),
+    ]:
+        infos = dict(
+            ScientificName=name,
+            Organism_Kingdom=kingdom,
+            AssemblyID="2" + taxid,
+        )
+        collection._write_taxid_infos(taxid, infos)
+    with open(collection.datafile_path("3", "genomic_fasta"), "w") as f:
+        f.write(">chr1\nATGCATGC\n>chr2\nATGC\n")
+    collection.get_taxid_fasta_index("3")
+
+    assert collection.list_locally_available_taxids_names() == {
+        "1": "Escherichia coli",
+        "2": "Saccharomyces cerevisiae",
+        "3": "Bacillus subtilis 100%",
+    }
+    results = collection.query_local_taxids(kingdom="Bacteria")
+    assert [r["taxid"] for r in results] == ["1", "3"]
+    assert results[1]["genome_size"] == 12
+    assert results[1]["assembly_id"] == "23"
+    assert sorted(results[1]["files"]) == [
+        "genomic_fasta_index",
+        "infos",
+    ]
+    results = collection.query_local_taxids(name_contains="0%")
+    assert [r["taxid"] for r in results] == ["3"]
+    results = collection.query_local_taxids(name_contains="CEREV")
+    assert [r["taxid"] for r in results] == ["2"]
+    results = collection.query_local_taxids(min_genome_size=10)
+    assert [r["taxid"] for r in results] == ["3"]
+    assert collection.query_local_taxids(max_genome_size=10) == []
+
+    # The metadata table survives a rebuild of the catalog
+    collection.rebuild_catalog()
+    results = collection.query_local_taxids(min_genome_size=10)
+    assert [r["taxid"] for r in results] == ["3"]
+    collection.remove_all_taxid_files("3")
+    assert len(collection.query_local_taxids(kingdom="Bacteria")) == 1
+
+
+def test_sharded_layout_and_migration(tmpdir):
+    data_dir = str(tmpdir)
+    create_files(data_dir, ["1.json", "1_genomic.fa", "1_nucl.nsq"])
+    collection = GenomeCollection(data_dir=data_dir, logger=None)
+    collection.data_layout = "sharded"
+
+    # Existing flat TaxIDs stay readable, new TaxIDs are sharded
+    flat_path = os.path.join(data_dir, "1_genomic.fa")
+    assert collection.datafile_path(1, "genomic_fasta") == flat_path
+    collection._write_taxid_infos("2", {"ScientificName": "Some name"})
+    infos_path = collection.datafile_path("2", "infos")
+    assert os.path.exists(infos_path)
+    assert infos_path != os.path.join(data_dir, "2.json")
+    assert os.path.dirname(infos_path) == collection.taxid_dir("2")
+    assert collection.list_locally_available_taxids() == ["1", "2"]
+
+    collection.migrate_data_layout("sharded")
+    sharded_dir = collection.taxid_dir("1")
+    assert sorted(os.listdir(sharded_dir)) == [
+        "1.json",
+        "1_genomic.fa",
+        "1_nucl.nsq",
+    ]
+    assert collection.datafile_path(1, "genomic_fasta").startswith(sharded_dir)
+    assert not os.path.exists(flat_path)
+    assert len(os.listdir(data_dir)) == 3  # 2 buckets + .genome_collector
+    assert collection.list_locally_available_taxids("blast_nucl") == ["1"]
+
+    # A collection in flat layout still reads the sharded files
+    flat_collection = GenomeCollection(data_dir=data_dir, logger=None)
+    assert flat_collection.get_taxid_infos(2)["ScientificName"] == "Some name"
+
+    flat_collection.migrate_data_layout("flat")
+    assert sorted(os.listdir(data_dir)) == [
+        ".genome_collector",
+        "1.json",
+        "1_genomic.fa",
+        "1_nucl.nsq",
+        "2.json",
+    ]
+    # Collections created before the migration must be re-created
+    collection = GenomeCollection(data_dir=data_dir, logger=None)
+    collection.data_layout = "sharded"
+    assert collection.datafile_path(1, "genomic_fasta") == flat_path
+
+    collection.migrate_data_layout("sharded")
+    collection.remove_all_local_data_files()
+    assert os.listdir(data_dir) == [".genome_collector"]
+
+
+def test_verify_collection(tmpdir):
+    data_dir = str(tmpdir)
+    collection = GenomeCollection(data_dir=data_dir, logger=None)
+    collection.autodownload = False
+    create_files(data_dir, ["1.json", "1_genomic.fa", "1_nucl.nhr"])
+    create_files(data_dir, ["1_nucl.nsq", "2.json", "2_genomic.fa"])
+    for taxid in ["1", "2"]:
+        for data_type in ["infos", "genomic_fasta", "blast_nucl"]:
+            collection._register_taxid_files(taxid, data_type)
+    assert collection.verify_collection() == {}
+
+    # Same size, different content
+    with open(os.path.join(data_dir, "1_genomic.fa"), "w") as f:
+        f.write("dada")
+    os.remove(os.path.join(data_dir, "1_nucl.nhr"))
+    with open(os.path.join(data_dir, "2_genomic.fa"), "a") as f:
+        f.write("more data")
+    problems = collection.verify_collection(max_workers=2)
+    assert sorted(problems) == ["1_genomic.fa", "1_nucl.nhr", "2_genomic.fa"]
+    assert "checksum" in problems["1_genomic.fa"]
+    assert "missing" in problems["1_nucl.nhr"]
+    assert "size" in problems["2_genomic.fa"]
+    assert list(collection.verify_taxid_files(1, "blast_nucl")) == [
+        "1_nucl.nhr"
+    ]
+
+    assert collection.get_taxid_genome_data_path(2) is not None
+    collection.verify_on_read = True
+    with pytest.raises(IOError) as excinfo:
+        collection.get_taxid_genome_data_path(2)
+    assert "corrupted" in str(excinfo.value)
+    assert collection.get_taxid_infos(2)["ScientificName"] == "2.json"
+
+    # Checksums of unchanged files survive a catalog rebuild
+    collection.rebuild_catalog()
+    [entry] = collection._get_catalog().files(taxid=2, data_type="infos")
+    assert entry["checksum"] is not None
+
+
+def test_atomic_multifile_build(tmpdir):
+    data_dir = str(tmpdir)
+    collection = GenomeCollection(data_dir=data_dir, logger=None)
+    create_files(data_dir, ["1_nucl.nsq", "1_nucl.old"])
+    with pytest.raises(ValueError):
+        with collection._atomic_multifile_build(1, "blast_nucl", ".nsq") as p:
+            create_files(data_dir, [os.path.relpath(p + ".nhr", data_dir)])
+            raise ValueError("Build failed")
+    assert sorted(os.listdir(data_dir)) == ["1_nucl.nsq", "1_nucl.old"]
+    with collection._atomic_multifile_build(1, "blast_nucl", ".nsq") as p:
+        create_files(data_dir, [os.path.relpath(p + ".nsq", data_dir)])
+        create_files(data_dir, [os.path.relpath(p + ".nhr", data_dir)])
+    assert sorted(os.listdir(data_dir)) == ["1_nucl.nhr", "1_nucl.nsq"]
@@ -0,0 +1,94 @@
+import os
+import sys
+import gzip
+import stat
+from pathlib import Path
+
+import pytest
+
+from genome_collector import GenomeCollection
+from genome_collector.GunzipBackend import GunzipBackend
+
+TAXID = "12345"
+CONTENT = b">record_1\nATGCATGC\n>record_2\nTTTTGGGG\n"
+
+# Fake pigz decompressing its last argument to stdout, logging its arguments
+FAKE_PIGZ = """#!PYTHON
+import sys, gzip, shutil
+with open(sys.argv[-1] + ".args", "w") as f:
+    f.write(" ".join(sys.argv[1:]))
+with gzip.open(sys.argv[-1], "rb") as f:
+    shutil.copyfileobj(f, sys.stdout.buffer)
+"""
+
+
+@pytest.fixture
+def fake_pigz(tmpdir, monkeypatch):
+    bin_dir = os.path.join(str(tmpdir), "bin")
+    os.mkdir(bin_dir)
+    path = os.path.join(bin_dir, "pigz")
+    with open(path, "w") as f:
+        f.write(FAKE_PIGZ.replace("PYTHON", sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", bin_dir + os.pathsep + os.environ["PATH"])
+
+
+def write_multimember_gz(path):
+    # Concatenated gzip members, as in some NCBI files
+    with open(path, "wb") as f:
+        f.write(gzip.compress(CONTENT[:20]) + gzip.compress(CONTENT[20:]))
+
+
+@pytest.mark.parametrize("name", GunzipBackend.available_backends())
+def test_available_backends(tmpdir, name):
+    gz_path = str(tmpdir.join("genome.fna.gz"))
+    target_path = str(tmpdir.join("genome.fa"))
+    write_multimember_gz(gz_path)
+    backend = GunzipBackend(name)
+    backend.gunzip_file(gz_path, target_path)
+    with open(target_path, "rb") as f:
+        assert f.read() == CONTENT
+    decompressor = backend.decompressobj()
+    assert decompressor.decompress(gzip.compress(CONTENT)) == CONTENT
+
+    with open(gz_path, "wb") as f:
+        f.write(gzip.compress(CONTENT)[:-10])
+    with pytest.raises(IOError):
+        backend.gunzip_file(gz_path, target_path)
+
+
+def test_backend_selection(fake_pigz, monkeypatch):
+    assert GunzipBackend.available_backends()[0] == "pigz"
+    assert GunzipBackend.available_backends()[-1] == "zlib"
+    assert GunzipBackend("auto").name == "pigz"
+    with pytest.raises(ValueError):
+        GunzipBackend("bzip2")
+    monkeypatch.setenv("PATH", "")
+    assert GunzipBackend("auto").name != "pigz"
+    with pytest.raises(FileNotFoundError):
+        GunzipBackend("pigz")
+
+
+@pytest.mark.parametrize("stream_downloads", [True, False])
+def test_collection_gunzip_backend(tmpdir, fake_pigz, stream_downloads):
+    source_path = str(tmpdir.join("source.fna.gz"))
+    write_multimember_gz(source_path)
+    data_dir = str(tmpdir.join("data"))
+    collection = GenomeCollection(data_dir=data_dir, logger=None)
+    collection.gunzip_backend = "pigz"
+    collection.gunzip_threads = 3
+    collection.check_ncbi_md5 = False
+    collection.stream_downloads = stream_downloads
+    collection._get_taxid_assembly_url_from_ncbi = lambda taxid, data_type: (
+        Path(source_path).as_uri()
+    )
+    path = collection.get_taxid_genome_data_path(TAXID)
+    with open(path, "rb") as f:
+        assert f.read() == CONTENT
+    gz_path = collection.datafile_path(TAXID, "genomic_fasta_gz")
+    if stream_downloads:
+        # The program can't be used on streamed data
+        assert not os.path.exists(gz_path + ".args")
+    else:
+        with open(gz_path + ".args", "r") as f:
+            assert f.read() == "-d -c -p 3 " + gz_path
@@ -0,0 +1,121 @@
+import os
+import gzip
+import json
+import time
+import socket
+import asyncio
+import contextvars
+import subprocess
+import sys
+import threading
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+from genome_collector import GenomeCollection
+from genome_collector.FileLock import FileLock
+
+
+class FakeDownloaderCollection(GenomeCollection):
+    """Collection downloading a local file, slowly, and counting downloads."""
+
+    def _get_taxid_assembly_url_from_ncbi(self, taxid, data_type):
+        source_dir = os.path.join(self.data_dir, "..", "source")
+        with open(os.path.join(source_dir, "downloads.txt"), "a") as f:
+            f.write("%s %s\n" % (os.getpid(), taxid))
+        time.sleep(0.5)
+        return Path(source_dir, "genome.fna.gz").resolve().as_uri()
+
+
+def get_genome_path(data_dir):
+    collection = FakeDownloaderCollection(data_dir=data_dir, logger=None)
+    return collection.get_taxid_genome_data_path(1, "genomic_fasta")
+
+
+def test_concurrent_downloads_are_made_once(tmpdir):
+    source_dir = tmpdir.mkdir("source")
+    with gzip.open(str(source_dir.join("genome.fna.gz")), "wb") as f:
+        f.write(b">record_1\nATGCATGC\n")
+    data_dir = str(tmpdir.mkdir("data"))
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(4) as pool:
+        paths = pool.map(get_genome_path, 4 * [data_dir])
+    assert len(set(paths)) == 1
+    with open(paths[0], "rb") as f:
+        assert f.read() == b">record_1\nATGCATGC\n"
+    with open(str(source_dir.join("downloads.txt")), "r") as f:
+        assert len(f.readlines()) == 1
+    locks_dir = os.path.join(data_dir, ".genome_collector", "locks")
+    assert os.listdir(locks_dir) == []
+
+
+def test_lock_waits_then_times_out(tmpdir):
+    path = str(tmpdir.join("file.lock"))
+    with FileLock(path) as lock:
+        assert lock.is_locked()
+        with lock:  # reentrant
+            pass
+        assert lock.is_locked()
+        errors = []
+
+        def acquire_from_other_thread():
+            try:
+                FileLock(path, timeout=0.3).acquire()
+            except TimeoutError as error:
+                errors.append(error)
+
+        thread = threading.Thread(target=acquire_from_other_thread)
+        thread.start()
+        thread.join()
+        assert len(errors) == 1
+    assert not os.path.exists(path)
+
+
+def test_stale_locks_are_broken(tmpdir):
+    path = str(tmpdir.join("file.lock"))
+    dead_process = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead_process.wait()
+    holder = dict(pid=dead_process.pid, host=socket.gethostname(), time=0)
+    with open(path, "w") as f:
+        json.dump(holder, f)
+    with FileLock(path, timeout=5) as lock:
+        assert lock.broke_stale_lock
+
+    # Lock held by a process on another machine which stopped refreshing it
+    holder = dict(pid=1, host="other_machine", time=0)
+    with open(path, "w") as f:
+        json.dump(holder, f)
+    lock = FileLock(path, timeout=0.3, stale_timeout=60)
+    with pytest.raises(TimeoutError):
+        lock.acquire()
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    with lock:
+        assert lock.broke_stale_lock
+    assert not os.path.exists(path)
+
+
+def test_async_locks_are_reentrant(tmpdir):
+    path = str(tmpdir.join("file.lock"))
+
+    def acquire_in_executor():
+        with FileLock(path, timeout=0.3) as lock:
+            return lock.is_locked()
+
+    async def main():
+        async with FileLock(path, timeout=0.3):
+            async with FileLock(path, timeout=0.3):
+                pass
+            # Functions run in the task's context see the lock as held
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            assert await loop.run_in_executor(
+                None, context.run, acquire_in_executor
+            )
+            assert os.path.exists(path)
+            # Other threads wait for it
+            with pytest.raises(TimeoutError):
+                await loop.run_in_executor(None, acquire_in_executor)
+
+    asyncio.run(main())
+    assert not os.path.exists(path)
@@ -36,3 +36,113 @@ def test_taxid_with_nonunique_genome(tmpdir):
     assert not os.path.exists(path)
     collection.get_taxid_genome_data_path(taxid)
     assert os.path.exists(path)
+
+
+class FakeDocumentSummary(dict):
+    def __init__(self, uid, **kwargs):
+        dict.__init__(self, **kwargs)
+        self.attributes = {"uid": uid}
+
+
+def test_download_taxids_infos_from_ncbi(tmpdir):
+    collection = GenomeCollection(data_dir=str(tmpdir), logger=None)
+    genome_ids = {"1": "101", "2": "102", "3": "103"}
+    entrez_calls = []
+
+    def fake_entrez(request, db, retmode, term=None, id=None, dbfrom=None):
+        entrez_calls.append((request.__name__, db))
+        if request.__name__ == "elink":
+            # TaxID 3 has no link, it is searched
+            return [
+                dict(
+                    IdList=[taxid],
+                    LinkSetDb=[
+                        dict(DbTo="genome", Link=[dict(Id=genome_ids[taxid])])
+                    ]
+                    if taxid in "12"
+                    else [],
+                )
+                for taxid in id
+            ]
+        if request.__name__ == "esearch":
+            taxid = term[len("txid") :]
+            return {"IdList": [genome_ids[taxid]] if taxid in "123" else []}
+        ids = id.split(",")
+        if db == "genome":
+            return [dict(Id=i, AssemblyID="20" + i[-1]) for i in ids]
+        if db == "taxonomy":
+            return [dict(Id=i, ScientificName="Species " + i) for i in ids]
+        summaries = [
+            FakeDocumentSummary(
+                i, FtpPath_RefSeq="", FtpPath_GenBank="ftp_" + i
+            )
+            for i in ids
+        ]
+        return {"DocumentSummarySet": {"DocumentSummary": summaries}}
+
+    collection._get_data_from_entrez = fake_entrez
+    errors = collection.download_taxids_infos_from_ncbi([1, 2, 3, 4])
+    assert list(errors) == ["4"]
+    assert sorted(entrez_calls) == sorted(
+        [("elink", "genome")]
+        + 2 * [("esearch", "genome")]
+        + [("esummary", "assembly"), ("esummary", "genome")]
+        + [("esummary", "taxonomy")]
+    )
+    assert collection.list_locally_available_taxids() == ["1", "2", "3"]
+    infos = collection.get_taxid_infos("2")
+    assert infos["ScientificName"] == "Species 2"
+    assert infos["AssemblyFtpPath"] == "ftp_202"
+    url = collection._get_taxid_assembly_url_from_ncbi("2", "genomic_fasta")
+    assert url == "ftp_202/ftp_202_genomic.fna.gz"
+    assert len(entrez_calls) == 6
+
+
+def test_download_taxids_infos_with_failing_batch_requests(tmpdir):
+    collection = GenomeCollection(data_dir=str(tmpdir), logger=None)
+    genome_ids = {"1": "101", "2": "102", "3": "103"}
+    failing_requests = set()
+
+    def fake_entrez(request, db, retmode, term=None, id=None, dbfrom=None):
+        name = request.__name__ if request.__name__ != "esummary" else db
+        is_batch = isinstance(id, list) or "," in (id or "")
+        if is_batch and (name in failing_requests):
+            raise RuntimeError("Invalid uid 4 at position=3")
+        if name == "esearch":
+            taxid = term[len("txid") :]
+            return {"IdList": [genome_ids[taxid]] if taxid in "123" else []}
+        ids = id.split(",")
+        if db == "genome":
+            return [dict(Id=i, AssemblyID="20" + i[-1]) for i in ids]
+        if db == "taxonomy":
+            # NCBI returns no taxonomy summary for TaxID 3
+            return [
+                dict(Id=i, ScientificName="Species " + i)
+                for i in ids
+                if i != "3"
+            ]
+        summaries = [
+            FakeDocumentSummary(
+                i, FtpPath_RefSeq="", FtpPath_GenBank="ftp_" + i
+            )
+            for i in ids
+        ]
+        return {"DocumentSummarySet": {"DocumentSummary": summaries}}
+
+    collection._get_data_from_entrez = fake_entrez
+
+    # Failing batch links and summaries: the TaxIDs are processed one by one
+    failing_requests.update(["elink", "genome"])
+    errors = collection.download_taxids_infos_from_ncbi([1, 2, 3, 4])
+    assert sorted(errors) == ["3", "4"]
+    assert collection.list_locally_available_taxids() == ["1", "2"]
+    assert collection.get_taxid_infos("1")["ScientificName"] == "Species 1"
+
+    # Failing assembly summaries: the FTP paths are not stored
+    failing_requests.clear()
+    failing_requests.update(["elink", "assembly"])
+    errors = collection.download_taxids_infos_from_ncbi([1, 2, 3])
+    assert list(errors) == ["3"]
+    infos = collection.get_taxid_infos("2")
+    assert infos["ScientificName"] == "Species 2"
+    assert "AssemblyFtpPath" not in infos
@@ -0,0 +1,91 @@
+import os
+import sys
+import stat
+
+import pytest
+from genome_collector import GenomeCollection
+from genome_collector.BuildScheduler import BuildScheduler
+
+# Fake blastn writing one tabular line per query, so that the sharding and
+# merging logics can be tested without BLAST.
+FAKE_BLASTN = """#!PYTHON
+import sys
+if sys.argv.count("-num_threads") != 1:
+    sys.exit("Argument -num_threads should be given once.")
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+with open(args["-query"]) as f:
+    queries = [line[1:].split()[0] for line in f if line.startswith(">")]
+with open(args["-out"], "w") as f:
+    for query in queries:
+        line = [query, args["-db"], args["-num_threads"]]
+        f.write("\\t".join(line) + "\\n")
+"""
+
+
+@pytest.fixture
+def fake_blastn(tmpdir, monkeypatch):
+    bin_dir = os.path.join(str(tmpdir), "bin")
+    os.mkdir(bin_dir)
+    path = os.path.join(bin_dir, "blastn")
+    with open(path, "w") as f:
+        f.write(FAKE_BLASTN.replace("PYTHON", sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", bin_dir + os.pathsep + os.environ["PATH"])
+
+
+def test_blast_against_taxids(tmpdir, fake_blastn):
+    collection = GenomeCollection(data_dir=str(tmpdir), logger=None)
+    collection.get_taxid_blastdb_path = lambda taxid, db_type: "db_" + taxid
+    queries_path = os.path.join(str(tmpdir), "queries.fa")
+    with open(queries_path, "w") as f:
+        for i in range(25):
+            f.write(">query_%d description\nATGCATGC\nATGC\n" % i)
+    output_path = os.path.join(str(tmpdir), "results.tsv")
+    collection.blast_against_taxids(
+        [1, 2, 3],
+        queries_path,
+        output_path,
+        queries_per_shard=10,
+        threads_per_job=2,
+        cpu_budget=4,
+    )
+    with open(output_path, "r") as f:
+        lines = [line.strip().split("\t") for line in f]
+    assert len(lines) == 75
+    assert lines[0] == ["1", "query_0", "db_1", "2"]
+    assert lines[-1] == ["3", "query_24", "db_3", "2"]
+    assert [line[1] for line in lines[:25]] == [
+        "query_%d" % i for i in range(25)
+    ]
+
+
+def test_blast_against_taxids_shares_the_build_budget(tmpdir, fake_blastn):
+    reservations = []
+
+    class RecordingScheduler(BuildScheduler):
+        def reserve(self, cpus=1, memory=0):
+            reservations.append((cpus, self.used_cpus))
+            return BuildScheduler.reserve(self, cpus, memory)
+
+    collection = GenomeCollection(data_dir=str(tmpdir), logger=None)
+    collection.build_scheduler = RecordingScheduler(cpus=3)
+    collection.get_taxid_blastdb_path = lambda taxid, db_type: "db_" + taxid
+    queries_path = os.path.join(str(tmpdir), "queries.fa")
+    with open(queries_path, "w") as f:
+        f.write(">query_1\nATGC\n")
+    output_path = os.path.join(str(tmpdir), "results.tsv")
+    collection.blast_against_taxids(
+        [1, 2], queries_path, output_path, blast_args=["-num_threads", "3"]
+    )
+    with open(output_path, "r") as f:
+        assert [line.split()[-1] for line in f] == ["3", "3"]
+    # One job at a time, as each needs the 3 CPUs of the budget
+    assert reservations == [(3, 0), (3, 0)]
+
+
+def test_blast_against_taxids_requires_tabular_output(tmpdir):
+    collection = GenomeCollection(data_dir=str(tmpdir), logger=None)
+    with pytest.raises(ValueError):
+        collection.blast_against_taxids(
+            [1], "queries.fa", "results.xml", blast_args=["-outfmt", "5"]
+        )
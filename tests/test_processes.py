@@ -0,0 +1,79 @@
+import io
+import os
+import sys
+import time
+import threading
+
+import pytest
+from genome_collector import GenomeCollection
+
+PRINT_LINES = "for i in range(%d): print('line', i, flush=True)"
+
+
+def python_process(code):
+    return [sys.executable, "-c", code]
+
+
+def test_run_process_returns_or_streams_stdout(tmpdir):
+    output = GenomeCollection.run_process("print", python_process("print(1)"))
+    assert output.strip() == b"1"
+    path = os.path.join(str(tmpdir), "output.txt")
+    process = python_process(PRINT_LINES % 100000)
+    assert GenomeCollection.run_process("print", process, path) is None
+    with open(path, "rb") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 100000
+    assert lines[-1] == b"line 99999"
+
+
+def test_run_process_error_has_stderr_tail():
+    code = (
+        "import sys\n"
+        "for i in range(1000): sys.stderr.write('error %d\\n' % i)\n"
+        "sys.exit(1)"
+    )
+    with pytest.raises(OSError) as excinfo:
+        GenomeCollection.run_process("failing", python_process(code))
+    message = str(excinfo.value)
+    assert "failing failed" in message
+    assert "error 999" in message
+    assert "error 899" not in message  # only the last 100 lines are kept
+
+
+def test_iter_process_lines():
+    lines = GenomeCollection.iter_process_lines(
+        "print", python_process(PRINT_LINES % 5)
+    )
+    assert list(lines) == [b"line %d\n" % i for i in range(5)]
+
+
+def test_run_process_timeout_and_cancellation():
+    sleeping_process = python_process("import time; time.sleep(30)")
+    t0 = time.time()
+    with pytest.raises(TimeoutError):
+        GenomeCollection.run_process("sleep", sleeping_process, timeout=0.2)
+    cancel_event = threading.Event()
+    threading.Timer(0.2, cancel_event.set).start()
+    lines = GenomeCollection.iter_process_lines(
+        "sleep", sleeping_process, cancel_event=cancel_event
+    )
+    with pytest.raises(InterruptedError):
+        list(lines)
+    assert time.time() - t0 < 10
+
+
+def test_run_process_with_stdin_file():
+    data = os.urandom(5_000_000)
+    code = "import sys; print(len(sys.stdin.buffer.read()))"
+    output = GenomeCollection.run_process(
+        "count", python_process(code), stdin_file=io.BytesIO(data)
+    )
+    assert output.strip() == b"5000000"
+
+    # A process which stops reading its stdin early
+    code = "import sys; sys.stdin.buffer.read(10); sys.exit('Stop')"
+    with pytest.raises(OSError) as excinfo:
+        GenomeCollection.run_process(
+            "early exit", python_process(code), stdin_file=io.BytesIO(data)
+        )
+    assert "Stop" in str(excinfo.value)
@@ -0,0 +1,149 @@
+import os
+import time
+
+from genome_collector import GenomeCollection, MirrorSource
+
+from conftest import FASTA, read_build_log
+
+
+def get_usage(collection):
+    return [
+        (artifact["taxid"], artifact["data_type"])
+        for artifact in collection.get_data_usage()
+    ]
+
+
+def test_evict_data_files(tmpdir, ncbi_mirror, fake_build_programs):
+    collection = GenomeCollection(data_dir=os.path.join(str(tmpdir), "data"))
+    collection.source = MirrorSource(ncbi_mirror)
+    collection.access_flush_interval = 0
+    collection.eviction_grace_period = 0
+    collection.get_taxid_blastdb_path(511145, "nucl")
+    collection.get_taxid_genome_data_path(386585)
+    assert get_usage(collection) == [
+        ("511145", "blast_nucl"),
+        ("511145", "genomic_fasta"),
+        ("386585", "genomic_fasta"),
+        ("511145", "genomic_fasta_gz"),
+        ("386585", "genomic_fasta_gz"),
+        ("386585", "infos"),
+        ("511145", "infos"),
+    ]
+
+    # Indexes go first, then the uncompressed copies of gz files
+    catalog = collection._get_catalog()
+    total_size = catalog.total_size()
+    evicted = collection.evict_data_files(max_size=total_size - 1)
+    assert [a["data_type"] for a in evicted] == ["blast_nucl"]
+    fasta_path = collection.datafile_path(511145, "genomic_fasta")
+    fasta_size = os.path.getsize(fasta_path)
+    max_size = catalog.total_size() - fasta_size
+    evicted = collection.evict_data_files(max_size=max_size)
+    assert [(a["taxid"], a["data_type"]) for a in evicted] == [
+        ("511145", "genomic_fasta")
+    ]
+    assert catalog.total_size() == max_size
+
+    # Evicted uncompressed files are restored from the local gz files
+    collection.autodownload = False
+    path = collection.get_taxid_genome_data_path(511145)
+    with open(path, "rb") as f:
+        assert f.read() == FASTA
+    collection.get_taxid_blastdb_path(511145, "nucl")
+    assert len(read_build_log()) == 2
+
+    # Pinned TaxIDs and infos are never evicted
+    collection.pin_taxids([511145])
+    assert collection.list_pinned_taxids() == ["511145"]
+    collection.evict_data_files(max_size=0)
+    assert sorted(get_usage(collection)) == [
+        ("386585", "infos"),
+        ("511145", "blast_nucl"),
+        ("511145", "genomic_fasta"),
+        ("511145", "genomic_fasta_gz"),
+        ("511145", "infos"),
+    ]
+    collection.unpin_taxids([511145])
+    collection.evict_data_files(max_size=0)
+    assert sorted(get_usage(collection)) == [
+        ("386585", "infos"),
+        ("511145", "infos"),
+    ]
+    assert collection.list_locally_available_taxids("genomic_fasta") == []
+
+
+def test_max_data_size_lfu(tmpdir, ncbi_mirror):
+    collection = GenomeCollection(data_dir=os.path.join(str(tmpdir), "data"))
+    collection.source = MirrorSource(ncbi_mirror)
+    collection.eviction_policy = "lfu"
+    collection.eviction_grace_period = 0
+    for _ in range(3):
+        collection.get_taxid_genome_data_path(511145)
+    collection.get_taxid_genome_data_path(386585)
+    assert get_usage(collection)[:2] == [
+        ("386585", "genomic_fasta"),
+        ("511145", "genomic_fasta"),
+    ]
+
+    # A new download exceeding the size evicts the least used files
+    catalog = collection._get_catalog()
+    collection.max_data_size = catalog.total_size()
+    path = collection.get_taxid_genome_data_path(511145, "protein_fasta")
+    assert os.path.exists(path)
+    assert catalog.total_size() <= collection.max_data_size
+    assert not os.path.exists(
+        collection.datafile_path(386585, "genomic_fasta")
+    )
+    assert os.path.exists(collection.datafile_path(386585, "infos"))
+
+
+def test_recently_accessed_files_are_not_evicted(tmpdir, ncbi_mirror):
+    data_dir = os.path.join(str(tmpdir), "data")
+    collection = GenomeCollection(data_dir=data_dir, logger=None)
+    collection.source = MirrorSource(ncbi_mirror)
+    for taxid in [511145, 386585]:
+        collection.get_taxid_genome_data_path(taxid)
+    assert collection.evict_data_files(max_size=0) == []
+
+    # Accesses of other processes are seen at once
+    collection.eviction_grace_period = 0.5
+    time.sleep(0.6)
+    other = GenomeCollection(data_dir=data_dir, logger=None)
+    for taxid in [386585, 511145]:
+        other.get_taxid_genome_data_path(taxid)
+    assert collection.evict_data_files(max_size=0) == []
+    time.sleep(0.6)
+    assert len(collection.evict_data_files(max_size=0)) == 4
+
+
+def test_hard_linked_files_are_counted_once(tmpdir, ncbi_mirror):
+    collection = GenomeCollection(data_dir=os.path.join(str(tmpdir), "data"))
+    collection.source = MirrorSource(ncbi_mirror)
+    collection.deduplicate_assemblies = True
+    collection.eviction_grace_period = 0
+
+    # TaxIDs 511145 and 562 (species) share the FASTA of their assembly
+    for taxid in [511145, 562]:
+        collection.get_taxid_genome_data_path(taxid)
+    usage = collection.get_data_usage()
+    fasta_sizes = [
+        artifact["size"]
+        for artifact in usage
+        if artifact["data_type"] == "genomic_fasta"
+    ]
+    assert fasta_sizes == [0, len(FASTA)]
+    catalog = collection._get_catalog()
+    total_size = sum(artifact["size"] for artifact in usage)
+    assert total_size == catalog.total_size() - len(FASTA)
+
+    # Evicting the first TaxID's FASTA frees nothing, so eviction goes on
+    evicted = collection.evict_data_files(max_size=total_size - 1)
+    first = evicted[0]
+    assert (first["taxid"], first["data_type"], first["size"]) == (
+        "511145",
+        "genomic_fasta",
+        0,
+    )
+    assert len(evicted) == 2
+    usage = collection.get_data_usage()
+    assert sum(artifact["size"] for artifact in usage) < total_size
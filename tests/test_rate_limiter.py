@@ -0,0 +1,115 @@
+import io
+import os
+from urllib.error import HTTPError
+
+import pytest
+from Bio import Entrez
+from genome_collector import GenomeCollection
+from genome_collector.RateLimiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, duration):
+        self.now += duration
+
+
+def test_rate_limiter_spaces_calls():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=10, clock=clock.time, sleep=clock.sleep)
+    call_times = []
+    for i in range(5):
+        limiter.acquire()
+        call_times.append(clock.now)
+    assert call_times == pytest.approx([1000, 1000.1, 1000.2, 1000.3, 1000.4])
+
+
+def test_rate_limiter_bursts():
+    clock = FakeClock()
+    limiter = RateLimiter(
+        rate=10, capacity=3, clock=clock.time, sleep=clock.sleep
+    )
+    for i in range(3):
+        limiter.acquire()
+    assert clock.now == 1000
+    limiter.acquire()
+    assert clock.now == pytest.approx(1000.1)
+    clock.sleep(10)  # The bucket refills, but never above its capacity.
+    for i in range(4):
+        limiter.acquire()
+    assert clock.now == pytest.approx(1010.2)
+
+
+def test_rate_limiter_shared_through_state_file(tmpdir):
+    clock = FakeClock()
+    state_file = os.path.join(str(tmpdir), "state")
+    limiters = [
+        RateLimiter(
+            rate=10, state_file=state_file, clock=clock.time, sleep=clock.sleep
+        )
+        for i in range(2)
+    ]
+    for i in range(3):
+        for limiter in limiters:
+            limiter.acquire()
+    assert clock.now == pytest.approx(1000.5)
+
+
+def test_collection_shares_rate_limit_across_instances(tmpdir, monkeypatch):
+    monkeypatch.setattr(Entrez, "read", lambda handle, validate: handle.read())
+    clock = FakeClock()
+    collections = [
+        GenomeCollection(str(tmpdir), logger=None) for i in range(2)
+    ]
+    for collection in collections:
+        collection.share_entrez_rate_limit = True
+        collection.use_entrez_cache = False
+        limiter = collection._get_entrez_rate_limiter()
+        limiter.clock, limiter.sleep = clock.time, clock.sleep
+        assert limiter.rate == pytest.approx(1 / 0.34)
+    for i in range(2):
+        for collection in collections:
+            collection._get_data_from_entrez(lambda: io.BytesIO(b""))
+    assert clock.now == pytest.approx(1000 + 3 * 0.34)
+    assert os.listdir(str(tmpdir)) == [".genome_collector"]
+
+
+def test_entrez_api_key_rate(tmpdir, monkeypatch):
+    monkeypatch.setattr(Entrez, "api_key", "MY_KEY")
+    collection = GenomeCollection(data_dir=str(tmpdir), logger=None)
+    assert collection._get_entrez_rate_limiter().rate == pytest.approx(10)
+
+
+def test_entrez_retries_with_backoff(tmpdir, monkeypatch):
+    monkeypatch.setattr(Entrez, "read", lambda handle, validate: handle.read())
+    clock = FakeClock()
+    collection = GenomeCollection(data_dir=str(tmpdir), logger=None)
+    collection.use_entrez_cache = False
+    collection.entrez_rate_limiter = RateLimiter(
+        rate=100, clock=clock.time, sleep=clock.sleep
+    )
+    monkeypatch.setattr("time.sleep", clock.sleep)
+    errors = [429, 503, 500]
+
+    def fake_entrez_request(term):
+        if len(errors):
+            raise HTTPError("url", errors.pop(0), "Error", {}, None)
+        return io.BytesIO(b"results for " + term.encode())
+
+    result = collection._get_data_from_entrez(fake_entrez_request, term="t")
+    assert result == b"results for t"
+    assert clock.now == pytest.approx(1000 + 1 + 2 + 4)
+
+    errors = [429, 429, 429, 429]
+    with pytest.raises(HTTPError):
+        collection._get_data_from_entrez(fake_entrez_request, term="t")
+
+    errors = [404]
+    with pytest.raises(HTTPError):
+        collection._get_data_from_entrez(fake_entrez_request, term="t")
+    assert errors == []
@@ -0,0 +1,209 @@
+import os
+import gzip
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import proglog
+import pytest
+
+from genome_collector import GenomeCollection
+from genome_collector.tools import download_url, partial_download_path
+
+TAXID = "12345"
+BASES_TABLE = bytes(b"ACGT"[i % 4] for i in range(256))
+
+
+class FlakyRangeHandler(BaseHTTPRequestHandler):
+    """Serve the server's files, with Range support and dropped connections.
+
+    The first ``server.drops`` responses are cut after ``server.drop_after``
+    bytes.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_data(send_body=False)
+
+    def do_GET(self):
+        self.send_data(send_body=True)
+
+    def send_data(self, send_body):
+        server = self.server
+        data = server.files.get(self.path.lstrip("/"), None)
+        if data is None:
+            self.send_error(404)
+            return
+        start, end = 0, len(data)
+        range_header = self.headers.get("Range", None)
+        if server.support_ranges and (range_header is not None):
+            first, last = range_header.split("=")[1].split("-")
+            start = int(first)
+            end = int(last) + 1 if last else len(data)
+            if start >= len(data):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", "bytes %d-%d/%d" % (start, end - 1, len(data))
+            )
+        else:
+            self.send_response(200)
+        if server.support_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+        if not send_body:
+            return
+        body = data[start:end]
+        with server.lock:
+            server.requests.append((start, end))
+            drop = server.drops > 0
+            server.drops -= 1
+        if drop:
+            body = body[: server.drop_after]
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def flaky_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyRangeHandler)
+    server.files = {}
+    server.requests = []
+    server.lock = threading.Lock()
+    server.drops = 0
+    server.drop_after = 0
+    server.support_ranges = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = "http://127.0.0.1:%d/" % server.server_address[1]
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def synthetic_genome(n_records=2, record_size=500_000):
+    content = b"".join(
+        b">record_%d\n%s\n"
+        % (i, os.urandom(record_size).translate(BASES_TABLE))
+        for i in range(n_records)
+    )
+    return content, gzip.compress(content, compresslevel=1)
+
+
+def make_collection(tmpdir, url):
+    data_dir = os.path.join(str(tmpdir), "data")
+    collection = GenomeCollection(
+        data_dir=data_dir, logger=proglog.ProgressBarLogger()
+    )
+    collection.check_ncbi_md5 = False
+    collection.download_retry_delay = 0
+    collection._get_taxid_assembly_url_from_ncbi = lambda taxid, data_type: (
+        url + "genome.fna.gz"
+    )
+    return collection
+
+
+@pytest.mark.parametrize("support_ranges", [True, False])
+@pytest.mark.parametrize("stream_downloads", [True, False])
+def test_dropped_connections_are_resumed(
+    tmpdir, flaky_server, support_ranges, stream_downloads
+):
+    content, gz_data = synthetic_genome()
+    flaky_server.files["genome.fna.gz"] = gz_data
+    flaky_server.drops = 3
+    flaky_server.drop_after = 100_000
+    flaky_server.support_ranges = support_ranges
+    collection = make_collection(tmpdir, flaky_server.url)
+    collection.stream_downloads = stream_downloads
+    path = collection.get_taxid_genome_data_path(TAXID)
+    with open(path, "rb") as f:
+        assert f.read() == content
+    starts = [start for start, end in flaky_server.requests]
+    if support_ranges:
+        assert starts == [0, 100_000, 200_000, 300_000]
+    else:
+        assert starts == [0, 0, 0, 0]
+    assert collection._logger.bars["download"]["index"] == len(gz_data)
+    assert sorted(os.listdir(collection.data_dir)) == [
+        ".genome_collector",
+        TAXID + "_genomic.fa",
+        TAXID + "_genomic.fna.gz",
+    ]
+
+
+@pytest.mark.parametrize("stream_downloads", [True, False])
+def test_failed_download_is_resumed_from_part_file(
+    tmpdir, flaky_server, stream_downloads
+):
+    content, gz_data = synthetic_genome()
+    flaky_server.files["genome.fna.gz"] = gz_data
+    flaky_server.drops = 1
+    flaky_server.drop_after = 100_000
+    collection = make_collection(tmpdir, flaky_server.url)
+    collection.stream_downloads = stream_downloads
+    collection.download_max_retries = 0
+    with pytest.raises(IOError):
+        collection.get_taxid_genome_data_path(TAXID)
+    gz_path = collection.datafile_path(TAXID, "genomic_fasta_gz")
+    assert os.path.getsize(partial_download_path(gz_path)) == 100_000
+    assert collection.list_locally_available_taxids("genomic_fasta") == []
+
+    path = collection.get_taxid_genome_data_path(TAXID)
+    with open(path, "rb") as f:
+        assert f.read() == content
+    size = len(gz_data)
+    assert flaky_server.requests == [(0, size), (100_000, size)]
+    assert not os.path.exists(partial_download_path(gz_path))
+
+
+def test_segmented_download(tmpdir, flaky_server):
+    data = os.urandom(1_000_000)
+    md5 = hashlib.md5(data).hexdigest()
+    flaky_server.files["file.bin"] = data
+    flaky_server.drops = 5
+    flaky_server.drop_after = 50_000
+    target = os.path.join(str(tmpdir), "file.bin")
+    progress = []
+
+    # First attempt fails, the segments' progress is kept
+    with pytest.raises(IOError):
+        download_url(
+            flaky_server.url + "file.bin",
+            target,
+            segments=4,
+            min_segment_size=1000,
+            max_retries=0,
+        )
+    assert os.path.exists(partial_download_path(target) + ".json")
+    assert not os.path.exists(target)
+
+    download_url(
+        flaky_server.url + "file.bin",
+        target,
+        md5=md5,
+        segments=4,
+        min_segment_size=1000,
+        progress_callback=lambda index, total: progress.append(index),
+        retry_delay=0,
+    )
+    with open(target, "rb") as f:
+        assert f.read() == data
+    assert progress[-1] == len(data)
+    assert os.listdir(str(tmpdir)) == ["file.bin"]
+    segments = sorted(set(end for start, end in flaky_server.requests))
+    assert segments == [250_000, 500_000, 750_000, 1_000_000]
+    # Nothing was downloaded twice
+    starts = [start for start, end in flaky_server.requests]
+    assert len(starts) == len(set(starts))
+
+
+def test_download_md5_mismatch(tmpdir, flaky_server):
+    flaky_server.files["file.bin"] = b"some data"
+    target = os.path.join(str(tmpdir), "file.bin")
+    with pytest.raises(IOError) as excinfo:
+        download_url(flaky_server.url + "file.bin", target, md5="0" * 32)
+    assert "MD5" in str(excinfo.value)
+    assert os.listdir(str(tmpdir)) == []
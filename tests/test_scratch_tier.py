@@ -0,0 +1,132 @@
+import os
+import time
+import asyncio
+from contextlib import contextmanager
+
+from genome_collector import (
+    GenomeCollection,
+    AsyncGenomeCollection,
+    MirrorSource,
+)
+
+from conftest import FASTA, read_build_log
+
+
+def new_collection(tmpdir, ncbi_mirror, scratch_name, cls=GenomeCollection):
+    collection = cls(data_dir=os.path.join(str(tmpdir), "shared"))
+    collection.source = MirrorSource(ncbi_mirror)
+    collection.scratch_dir = os.path.join(str(tmpdir), scratch_name)
+    return collection
+
+
+def test_scratch_tier(tmpdir, ncbi_mirror, fake_build_programs):
+    collection = new_collection(tmpdir, ncbi_mirror, "scratch_1")
+    path = collection.get_taxid_genome_data_path(511145)
+    assert path.startswith(collection.scratch_dir)
+    shared_path = collection.datafile_path(511145, "genomic_fasta")
+    for fasta_path in [path, shared_path]:
+        with open(fasta_path, "rb") as f:
+            assert f.read() == FASTA
+
+    # Indexes are built in the scratch tier and published to the data_dir
+    for get_path, variant, extension in [
+        (collection.get_taxid_blastdb_path, "nucl", ".nsq"),
+        (collection.get_taxid_bowtie_index_path, "2", ".1.bt2"),
+    ]:
+        db_path = get_path(511145, variant)
+        assert db_path.startswith(collection.scratch_dir)
+        shared_db_path = collection.datafile_path(511145, "blast_nucl")
+        if variant == "2":
+            shared_db_path = collection.datafile_path(511145, "bowtie2_index")
+        stats = [os.stat(p + extension) for p in [db_path, shared_db_path]]
+        assert stats[0].st_mtime == stats[1].st_mtime
+    assert len(read_build_log()) == 2
+    alias_path = collection.generate_combined_blast_db([511145], "panel")
+    with open(alias_path + ".nal", "r") as f:
+        assert "scratch" not in f.read()
+
+    # Another machine copies the published indexes to its scratch tier
+    other = new_collection(tmpdir, ncbi_mirror, "scratch_2")
+    db_path = other.get_taxid_blastdb_path(511145, "nucl")
+    assert db_path.startswith(other.scratch_dir)
+    assert os.path.exists(db_path + ".nsq")
+    assert len(read_build_log()) == 2
+
+    # Outdated copies are replaced
+    with open(shared_path, "ab") as f:
+        f.write(b">record_3\nAAAA\n")
+    with open(collection.get_taxid_genome_data_path(511145), "rb") as f:
+        assert f.read().endswith(b">record_3\nAAAA\n")
+
+    # The size of the scratch tier is limited
+    collection.max_scratch_size = 0
+    collection.eviction_grace_period = 0
+    path = collection.get_taxid_genome_data_path(511145, "protein_fasta")
+    assert os.path.exists(path)
+    scratch = collection._get_scratch_collection()
+    usage = scratch.get_data_usage()
+    assert [a["data_type"] for a in usage] == ["protein_fasta"]
+    assert os.path.exists(shared_path)
+
+
+def test_async_scratch_tier(tmpdir, ncbi_mirror, fake_build_programs):
+    collection = new_collection(
+        tmpdir, ncbi_mirror, "scratch", cls=AsyncGenomeCollection
+    )
+
+    async def get_paths():
+        return await asyncio.gather(
+            collection.aget_taxid_genome_data_path(511145),
+            collection.aget_taxid_blastdb_path(511145, "nucl"),
+            collection.aget_taxid_bowtie_index_path(511145, "1"),
+        )
+
+    paths = asyncio.run(get_paths())
+    assert all(path.startswith(collection.scratch_dir) for path in paths)
+    assert os.path.exists(paths[1] + ".nsq")
+    assert os.path.exists(paths[2] + ".1.ebwt")
+
+
+def test_async_scratch_builds_dont_block_the_loop(
+    tmpdir, ncbi_mirror, fake_build_programs
+):
+    class SlowCollection(AsyncGenomeCollection):
+        """Collection with slow (blocking) file operations."""
+
+        def _write_build_record(self, *args, **kwargs):
+            time.sleep(0.2)
+            return super()._write_build_record(*args, **kwargs)
+
+        def _add_to_assembly_store(self, *args, **kwargs):
+            time.sleep(0.2)
+            return super()._add_to_assembly_store(*args, **kwargs)
+
+        @contextmanager
+        def _atomic_multifile_build(self, *args, **kwargs):
+            time.sleep(0.2)
+            with super()._atomic_multifile_build(*args, **kwargs) as path:
+                yield path
+            time.sleep(0.2)
+
+    collection = new_collection(
+        tmpdir, ncbi_mirror, "scratch", cls=SlowCollection
+    )
+    for taxid in [511145, 386585]:
+        collection.get_taxid_genome_data_path(taxid)
+
+    async def main():
+        gaps = []
+        builds = asyncio.gather(
+            collection.aget_taxid_blastdb_path(511145, "nucl"),
+            collection.aget_taxid_bowtie_index_path(386585, "2"),
+        )
+        while not builds.done():
+            start_time = time.time()
+            await asyncio.sleep(0.01)
+            gaps.append(time.time() - start_time)
+        return await builds, max(gaps)
+
+    paths, max_gap = asyncio.run(main())
+    assert all(path.startswith(collection.scratch_dir) for path in paths)
+    assert len(read_build_log()) == 2
+    assert max_gap < 0.15
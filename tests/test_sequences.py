@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from Bio import SeqIO
+from Bio.Seq import reverse_complement
+from genome_collector import GenomeCollection
+from genome_collector.FastaIndex import FastaIndex
+
+TAXID = "12345"
+
+
+@pytest.fixture
+def collection(tmpdir):
+    """Collection with a local genome, no download needed."""
+    collection = GenomeCollection(data_dir=str(tmpdir), logger=None)
+    collection.autodownload = False
+    rng = random.Random(123)
+    with open(collection.datafile_path(TAXID, "genomic_fasta"), "w") as f:
+        for name, length in [("chr1", 1000), ("chr2", 5), ("chr3", 2345)]:
+            sequence = "".join(rng.choice("ATGC") for i in range(length))
+            lines = [sequence[i : i + 60] for i in range(0, length, 60)]
+            f.write(">%s some description\n%s\n" % (name, "\n".join(lines)))
+    return collection
+
+
+def test_get_taxid_subsequence(collection):
+    records = {
+        record.id: str(record.seq)
+        for record in collection.get_taxid_biopython_records(
+            TAXID, "genomic_fasta"
+        )
+    }
+    index_path = collection.datafile_path(TAXID, "genomic_fasta_index")
+    assert not os.path.exists(index_path)
+    for seq_id, start, end in [
+        ("chr1", 0, 1000),
+        ("chr1", 59, 61),
+        ("chr2", 2, 5),
+        ("chr3", 1000, 1300),
+        ("chr3", 5, 5),
+    ]:
+        subsequence = collection.get_taxid_subsequence(
+            TAXID, seq_id, start, end
+        )
+        assert subsequence == records[seq_id][start:end]
+        subsequence = collection.get_taxid_subsequence(
+            TAXID, seq_id, start, end, strand=-1
+        )
+        assert subsequence == reverse_complement(records[seq_id][start:end])
+    with open(index_path, "r") as f:
+        assert f.readline() == "chr1\t1000\t23\t60\t61\n"
+
+    with pytest.raises(ValueError):
+        collection.get_taxid_subsequence(TAXID, "chr2", 0, 6)
+    with pytest.raises(ValueError):
+        collection.get_taxid_subsequence(TAXID, "chr4", 0, 1)
+
+
+def test_get_taxid_subsequences(collection):
+    records = {
+        record.id: str(record.seq)
+        for record in collection.get_taxid_biopython_records(
+            TAXID, "genomic_fasta"
+        )
+    }
+    intervals = [("chr3", 10, 20, -1), ("chr1", 500, 600), ("chr3", 0, 5)]
+    subsequences = collection.get_taxid_subsequences(TAXID, intervals)
+    assert subsequences == [
+        reverse_complement(records["chr3"][10:20]),
+        records["chr1"][500:600],
+        records["chr3"][0:5],
+    ]
+
+
+def test_index_is_rebuilt_when_fasta_changes(collection):
+    assert collection.get_taxid_subsequence(TAXID, "chr2", 0, 5)
+    fasta_path = collection.datafile_path(TAXID, "genomic_fasta")
+    with open(fasta_path, "w") as f:
+        f.write(">chr2\nATGCATGC\nATG\n")
+    os.utime(fasta_path, (1e10, 1e10))
+    assert collection.get_taxid_subsequence(TAXID, "chr2", 6, 10) == "GCAT"
+
+
+def test_fasta_with_irregular_lines_cannot_be_indexed(collection):
+    with open(collection.datafile_path(TAXID, "genomic_fasta"), "w") as f:
+        f.write(">chr1\nATGC\nAT\nATGC\n")
+    with pytest.raises(ValueError) as excinfo:
+        collection.get_taxid_subsequence(TAXID, "chr1", 0, 2)
+    assert "different lengths" in str(excinfo.value)
+
+
+@pytest.mark.parametrize("packing_chunk_size", [2 ** 22, 3])
+def test_get_taxid_packed_genome(collection, packing_chunk_size):
+    numpy = pytest.importorskip("numpy")
+    collection.packing_chunk_size = packing_chunk_size
+    with open(collection.datafile_path(TAXID, "genomic_fasta"), "w") as f:
+        f.write(">chr1\nATGCNNNNNNacgtRA\nC\n>chr2\nNNA\n>chr3\n\n")
+    with collection.get_taxid_packed_genome(TAXID) as genome:
+        assert genome.sequence("chr1") == "ATGCNNNNNNACGTNAC"
+        assert genome.sequence("chr1", 3, 11) == "CNNNNNNA"
+        assert genome.sequence("chr2") == "NNA"
+        assert genome.sequence("chr3") == ""
+        packed = numpy.frombuffer(genome.packed("chr1"), dtype="uint8")
+        packed_bytes = packed.tolist()
+        del packed  # so that the genome's memory map can be closed
+        assert packed_bytes[:3] == [0b10001101, 0, 0b00001001]
+        starts, sizes = genome.n_blocks("chr1")
+        assert list(starts) == [4, 14] and list(sizes) == [6, 1]
+        starts, sizes = genome.records["chr1"]["mask_blocks"]
+        assert list(starts) == [10] and list(sizes) == [4]
+    path = collection.datafile_path(TAXID, "genomic_2bit")
+    with open(path, "rb") as f:
+        assert f.read(4) == bytes([0x43, 0x27, 0x41, 0x1A])
+
+
+
+def counted_calls(function, calls):
+    def wrapper(*args, **kwargs):
+        calls.append(function.__name__)
+        time.sleep(0.2)
+        return function(*args, **kwargs)
+
+    return wrapper
+
+
+def test_fasta_index_is_created_once(collection, monkeypatch):
+    calls = []
+    from_fasta = counted_calls(FastaIndex.from_fasta, calls)
+    monkeypatch.setattr(FastaIndex, "from_fasta", staticmethod(from_fasta))
+    with ThreadPoolExecutor(4) as executor:
+        indexes = list(
+            executor.map(collection.get_taxid_fasta_index, 4 * [TAXID])
+        )
+    assert [len(index.records) for index in indexes] == [3, 3, 3, 3]
+    assert calls == ["from_fasta"]
+
+
+@pytest.mark.parametrize("data_type", ["genomic_fasta_index", "genomic_2bit"])
+def test_index_creation_enforces_max_data_size(collection, data_type):
+    if data_type == "genomic_2bit":
+        pytest.importorskip("numpy")
+        collection.get_taxid_fasta_index(TAXID)  # before the size limit
+    other_path = collection.datafile_path("999", "genomic_fasta")
+    with open(other_path, "w") as f:
+        f.write(">chr1\nATGC\n")
+    collection.rebuild_catalog()
+    collection.max_data_size = collection._get_catalog().total_size()
+    collection.eviction_grace_period = 0
+    collection.pin_taxids([TAXID])
+    if data_type == "genomic_2bit":
+        collection.get_taxid_packed_genome(TAXID).close()
+    else:
+        collection.get_taxid_fasta_index(TAXID)
+    assert not os.path.exists(other_path)
+    assert os.path.exists(collection.datafile_path(TAXID, data_type))
+
+
+def test_packed_genome_is_created_once(collection, monkeypatch):
+    pytest.importorskip("numpy")
+    module = sys.modules[GenomeCollection.get_taxid_packed_genome.__module__]
+    calls = []
+    write_twobit_file = counted_calls(module.write_twobit_file, calls)
+    monkeypatch.setattr(module, "write_twobit_file", write_twobit_file)
+
+    def get_sequence(taxid):
+        with collection.get_taxid_packed_genome(taxid) as genome:
+            return genome.sequence("chr2")
+
+    with ThreadPoolExecutor(4) as executor:
+        sequences = list(executor.map(get_sequence, 4 * [TAXID]))
+    assert len(set(sequences)) == 1
+    assert calls == ["write_twobit_file"]
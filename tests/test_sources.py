@@ -0,0 +1,130 @@
+import os
+import gzip
+import asyncio
+
+import pytest
+
+from genome_collector import (
+    GenomeCollection,
+    AsyncGenomeCollection,
+    MirrorSource,
+    PeerCollectionSource,
+)
+
+from conftest import FASTA, PROTEIN_FASTA
+
+
+def test_mirror_source(tmpdir, ncbi_mirror):
+    collection = GenomeCollection(data_dir=os.path.join(str(tmpdir), "data"))
+    collection.source = MirrorSource(ncbi_mirror)
+    infos = collection.get_taxid_infos(511145)
+    assert infos["AssemblyAccession"] == "GCF_000005845.2"
+    assert infos["ScientificName"] == "Organism 511145"
+    path = collection.get_taxid_genome_data_path(511145)
+    with open(path, "rb") as f:
+        assert f.read() == FASTA
+    records = collection.get_taxid_biopython_records(511145, "genomic_fasta")
+    assert [r.id for r in records] == ["record_1", "record_2"]
+
+    # Species TaxID: the reference genome is chosen among the assemblies
+    assert collection.get_taxid_infos(562)["AssemblyName"] == "ASM584v2"
+
+    # Two "latest" assemblies, none preferred
+    with pytest.raises(OSError) as err:
+        collection.get_taxid_infos(999)
+    assert "GCF_000001111.1" in str(err.value)
+    collection.download_taxid_genome_infos(999, assembly_id="GCF_000002222")
+    assert collection.get_taxid_infos(999)["AssemblyName"] == "ASM222v1"
+    with pytest.raises(OSError):
+        collection.get_taxid_infos(123)
+
+
+def test_mirror_source_checks_md5(tmpdir, ncbi_mirror):
+    collection = GenomeCollection(data_dir=os.path.join(str(tmpdir), "data"))
+    collection.source = MirrorSource(ncbi_mirror)
+    folder = os.path.join(
+        ncbi_mirror, "genomes", "all", "GCF", "000", "005", "845",
+        "GCF_000005845.2_ASM584v2",
+    )
+    path = os.path.join(folder, "GCF_000005845.2_ASM584v2_genomic.fna.gz")
+    with open(path, "wb") as f:
+        f.write(gzip.compress(b">corrupted\nATGC\n"))
+    with pytest.raises(IOError):
+        collection.get_taxid_genome_data_path(511145)
+    path = collection.datafile_path("511145", "genomic_fasta")
+    assert not os.path.exists(path)
+
+
+def test_mirror_source_sequence_storage(tmpdir, ncbi_mirror):
+    collection = GenomeCollection(data_dir=os.path.join(str(tmpdir), "data"))
+    collection.source = MirrorSource(ncbi_mirror)
+    collection.sequence_storage = "bgzf"
+    path = collection.get_taxid_genome_data_path(511145, "protein_fasta")
+    assert path.endswith("_protein.fa.gz")
+    with gzip.open(path, "rb") as f:
+        assert f.read() == PROTEIN_FASTA
+
+
+@pytest.mark.parametrize("hardlink", [True, False])
+def test_peer_collection_source(tmpdir, ncbi_mirror, hardlink):
+    peer = GenomeCollection(data_dir=os.path.join(str(tmpdir), "peer"))
+    peer.source = MirrorSource(ncbi_mirror)
+    peer_path = peer.get_taxid_genome_data_path(511145)
+
+    collection = GenomeCollection(data_dir=os.path.join(str(tmpdir), "data"))
+    collection.source = PeerCollectionSource(peer.data_dir, hardlink=hardlink)
+    infos = collection.get_taxid_infos(511145)
+    assert infos == peer.get_taxid_infos(511145)
+    path = collection.get_taxid_genome_data_path(511145)
+    assert os.path.samefile(path, peer_path) == hardlink
+    with open(path, "rb") as f:
+        assert f.read() == FASTA
+    entries = collection._get_catalog().files(taxid="511145")
+    assert {entry["data_type"] for entry in entries} == {
+        "infos",
+        "genomic_fasta",
+    }
+    with pytest.raises(FileNotFoundError):
+        collection.get_taxid_genome_data_path(511145, "protein_fasta")
+    with pytest.raises(FileNotFoundError):
+        collection.get_taxid_infos(386585)
+
+
+@pytest.mark.parametrize("peer_storage", ["plain", "bgzf"])
+@pytest.mark.parametrize("storage", ["plain", "bgzf"])
+def test_peer_collection_conversions(
+    tmpdir, ncbi_mirror, peer_storage, storage
+):
+    peer = GenomeCollection(data_dir=os.path.join(str(tmpdir), "peer"))
+    peer.source = MirrorSource(ncbi_mirror)
+    peer.sequence_storage = peer_storage
+    peer.get_taxid_genome_data_path(511145)
+
+    collection = GenomeCollection(data_dir=os.path.join(str(tmpdir), "data"))
+    collection.source = PeerCollectionSource(peer.data_dir)
+    collection.sequence_storage = storage
+    collection.get_taxid_genome_data_path(511145)
+    with collection._open_data_file(511145, "genomic_fasta") as f:
+        assert f.read() == FASTA
+    subsequence = collection.get_taxid_subsequence(511145, "record_1", 2, 6)
+    assert subsequence == "GCAT"
+
+
+def test_async_collection_with_mirror_source(tmpdir, ncbi_mirror):
+    collection = AsyncGenomeCollection(
+        data_dir=os.path.join(str(tmpdir), "data")
+    )
+    collection.source = MirrorSource(ncbi_mirror)
+
+    async def get_paths():
+        return await asyncio.gather(
+            *[
+                collection.aget_taxid_genome_data_path(taxid)
+                for taxid in [511145, 511145, 386585]
+            ]
+        )
+
+    paths = asyncio.run(get_paths())
+    assert paths[0] == paths[1]
+    infos = collection.get_taxid_infos(386585)
+    assert infos["AssemblyAccession"] == "GCF_000008865.2"